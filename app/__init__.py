@@ -41,6 +41,13 @@ def create_app(config_class=Config):
     from flask_wtf.csrf import CSRFProtect
     csrf = CSRFProtect(app)
     db.init_app(app)
+    # Register the flush listeners
+    from app.services import rollup_service  # noqa: F401 (daily rollups)
+    from app.services import cache_service  # noqa: F401 (cache tags)
+    from app.services import activity_service  # noqa: F401 (activity log)
+    from app.services import balance_service  # noqa: F401 (enrollment balances)
+    from app.services import search_service  # noqa: F401 (lead search)
+    from app.services import slot_cache  # noqa: F401 (slot availability)
     # Solo usar render_as_batch para SQLite (desarrollo local)
     is_sqlite = app.config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite')
     migrate.init_app(app, db, render_as_batch=is_sqlite)
@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, g
 
 bp = Blueprint('api', __name__)
 
@@ -14,4 +14,11 @@ def add_header(response):
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
+    # Server-side result cache (ResultCache): outcome of this request plus this worker's counters
+    if 'result_cache' in g:
+        from app.services.cache_service import ResultCache
+        stats = ResultCache.entries.stats()
+        response.headers['X-Cache'] = g.result_cache
+        response.headers['X-Cache-Hits'] = str(stats['hits'])
+        response.headers['X-Cache-Misses'] = str(stats['misses'])
     return response
@@ -1,11 +1,18 @@
 from flask import request, jsonify
 from flask_login import login_required, current_user
 from app.api import bp
-from app.services.user_service import UserService
+from app.services.user_service import UserService, LEAD_COUNT_TAGS
 from app.services.financial_service import FinancialService
 from app.services.dashboard_service import DashboardService
 from app.services.admin_ops_service import AdminOperationService
 from app.services.import_service import ImportService
+from app.services.funnel_service import FunnelService
+from app.services.activity_service import ActivityService
+from app.services.analytics_service import AnalyticsService
+from app.services.lead_filter import LeadFilter
+from app.services.lead_profile_service import LeadProfileService
+from app.services.search_service import SearchService
+from app.services.pagination_service import PaginationService
 from app.decorators import admin_required
 import pandas as pd
 import io
@@ -13,8 +20,13 @@ import json
 from app.models import Program, db, User, Client, Expense, RecurringExpense, Payment, Enrollment, PaymentMethod, Event, DailyReportQuestion, Appointment, Integration
 from datetime import datetime, date, timedelta
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 import calendar
 
+# Writes to these invalidate the cached totals of the raw database listings
+AGENDA_COUNT_TAGS = ('appointments', 'clients', 'users')
+SALES_COUNT_TAGS = ('payments', 'enrollments', 'clients')
+
 @bp.route('/admin/finance/overview', methods=['GET'])
 @login_required
 @admin_required
@@ -26,24 +38,6 @@ def get_finance_overview():
     end_date = today.replace(day=last_day)
     
     data = FinancialService.get_finances_data(start_date, end_date)
-    
-    # Serialize expenses
-    serialized_expenses = []
-    for exp in data['expenses']:
-        # Handle both SQLAlchemy model and VirtualExpense object
-        serialized_expenses.append({
-            "id": getattr(exp, 'id', None),
-            "description": exp.description,
-            "amount": float(exp.amount),
-            "category": exp.category,
-            "date": exp.date.isoformat(),
-            "is_recurring": getattr(exp, 'is_recurring', False)
-        })
-    data['expenses'] = serialized_expenses
-    
-    if 'recurring_expenses' in data:
-        del data['recurring_expenses']
-        
     return jsonify(data), 200
 
 @bp.route('/admin/finance/expenses', methods=['POST'])
@@ -140,19 +134,55 @@ def get_dashboard():
     period = request.args.get('period', 'this_month')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    data = DashboardService.get_main_dashboard_data(period=period, start_date_arg=start_date, end_date_arg=end_date)
+    data = DashboardService.get_main_dashboard_data(period=period, start_date_arg=start_date, end_date_arg=end_date,
+                                                    timezone_name=current_user.timezone or 'America/La_Paz',
+                                                    granularity=request.args.get('granularity'))
     if 'dates' in data:
         data['dates']['start'] = data['dates']['start'].isoformat()
         data['dates']['end'] = data['dates']['end'].isoformat()
     if 'recent_activity' in data:
         for activity in data['recent_activity']:
             if 'time' in activity: activity['time'] = activity['time'].isoformat()
-    if 'cohort' in data and 'top_debtors' in data['cohort']:
-        for debtor in data['cohort']['top_debtors']:
-            client = debtor['student']
-            debtor['student'] = {"id": client.id, "full_name": client.full_name, "email": client.email}
     return jsonify(data), 200
 
+@bp.route('/admin/activity', methods=['GET'])
+@login_required
+@admin_required
+def get_activity_feed():
+    event_types = [t for t in request.args.get('type', '').split(',') if t]
+    feed = ActivityService.feed(limit=request.args.get('limit', type=int), cursor=request.args.get('cursor'),
+                                event_types=event_types, client_id=request.args.get('client_id', type=int))
+    for item in feed['items']: item['time'] = item['time'].isoformat()
+    return jsonify(feed), 200
+
+@bp.route('/admin/analytics/funnel', methods=['GET'])
+@login_required
+@admin_required
+def get_funnel_analytics():
+    # Default cohort: leads of the last 90 days
+    today = date.today()
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else today - timedelta(days=89)
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else today
+    except ValueError:
+        return jsonify({"message": "Formato de fecha inválido (YYYY-MM-DD)"}), 400
+    return jsonify(AnalyticsService.get_funnel(start_date, end_date)), 200
+
+@bp.route('/admin/closers/leaderboard', methods=['GET'])
+@login_required
+@admin_required
+def get_closer_leaderboard():
+    today = date.today()
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else today.replace(day=1)
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else today
+    except ValueError:
+        return jsonify({"message": "Formato de fecha inválido (YYYY-MM-DD)"}), 400
+    return jsonify({
+        "dates": {"start": start_date.isoformat(), "end": end_date.isoformat()},
+        "closers": DashboardService.get_closer_leaderboard(start_date, end_date)
+    }), 200
+
 @bp.route('/admin/users', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -242,8 +272,7 @@ def user_operations(id):
 def search_leads():
     query_str = request.args.get('q', '')
     if len(query_str) < 2: return jsonify([]), 200
-    term = f"%{query_str}%"
-    leads = Client.query.filter(or_(Client.full_name.ilike(term), Client.email.ilike(term))).limit(10).all()
+    leads = SearchService.typeahead(query_str, limit=10)
     return jsonify([{"id": l.id, "username": l.full_name or l.email, "email": l.email} for l in leads]), 200
 
 @bp.route('/admin/leads', methods=['GET'])
@@ -256,12 +285,15 @@ def get_leads():
         'start_date': request.args.get('start_date'),
         'end_date': request.args.get('end_date'),
         'sort_by': request.args.get('sort_by', 'newest'),
-        'closer_id': request.args.get('closer_id')
+        'closer_id': request.args.get('closer_id'),
+        'with_debt': request.args.get('with_debt') == 'true'
     }
-    page = request.args.get('page', 1, type=int)
+    # Compiled once: the page, its total and every KPI join the same lead set
+    lead_filter = LeadFilter.from_filters(filters)
+    page = request.args.get('page', type=int)
     per_page = request.args.get('per_page', 50, type=int)
-    pagination = UserService.get_leads_list(filters, page, per_page)
-    leads = pagination.items
+    pagination = UserService.get_leads_list(lead_filter, filters['sort_by'], page, per_page, cursor=request.args.get('cursor'), with_total=request.args.get('count') != 'false')
+    leads = pagination['items']
     lead_list = [{
         "id": l.id,
         "username": l.full_name or l.email,
@@ -270,26 +302,15 @@ def get_leads():
         "instagram": l.instagram,
         "created_at": l.created_at.isoformat() if l.created_at else None
     } for l in leads]
-    kpis = UserService.get_leads_kpis(filters)
-    return jsonify({"leads": lead_list, "total": pagination.total, "pages": pagination.pages, "current_page": pagination.page, "kpis": kpis}), 200
+    kpis = UserService.get_leads_kpis(lead_filter)
+    return jsonify({"leads": lead_list, "total": pagination['total'], "pages": pagination['pages'], "current_page": page or 1,
+                    "next_cursor": pagination['next_cursor'], "prev_cursor": pagination['prev_cursor'], "kpis": kpis}), 200
 
 @bp.route('/admin/leads/<int:id>', methods=['GET'])
 @login_required
 @admin_required
 def get_lead_profile(id):
-    client = Client.query.get_or_404(id)
-    profile_data = {
-        "id": client.id,
-        "username": client.full_name or client.email,
-        "email": client.email,
-        "profile": {
-            "phone": client.phone,
-            "instagram": client.instagram
-        },
-        "enrollments": [{"id": e.id, "program": e.program.name, "date": e.enrollment_date.isoformat(), "closer": e.closer_rel.username if e.closer_rel else None} for e in client.enrollments],
-        "appointments": [{"id": a.id, "start_time": a.start_time.isoformat(), "status": a.status, "closer": a.closer.username if a.closer else None, "origin": a.origin} for a in client.appointments]
-    }
-    return jsonify(profile_data), 200
+    return jsonify(LeadProfileService.lead_profile(id)), 200
 
 # --- Admin Database CRUD (Master Access) ---
 
@@ -343,27 +364,11 @@ def manage_db_leads():
         db.session.commit()
         return jsonify({"message": "Lead guardado"}), 200
     
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    lead_filter = LeadFilter(search=request.args.get('search', ''), start_date=request.args.get('start_date'), end_date=request.args.get('end_date'))
     sort_by = request.args.get('sort_by', 'newest')
 
-    query = Client.query
-    if search:
-        term = f"%{search}%"
-        query = query.filter(or_(Client.full_name.ilike(term), Client.email.ilike(term)))
-    
-    if start_date: query = query.filter(Client.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
-    if end_date: query = query.filter(Client.created_at < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
-
-    if sort_by == 'oldest': query = query.order_by(Client.created_at.asc())
-    elif sort_by == 'a-z': query = query.order_by(Client.full_name.asc())
-    elif sort_by == 'z-a': query = query.order_by(Client.full_name.desc())
-    else: query = query.order_by(Client.created_at.desc())
-
-    pagination = query.paginate(page=page, per_page=50, error_out=False)
-    return jsonify({"total": pagination.total, "pages": pagination.pages, "data": [{"id": c.id, "full_name": c.full_name, "email": c.email, "phone": c.phone, "instagram": c.instagram, "created_at": c.created_at.isoformat()} for c in pagination.items]}), 200
+    result = PaginationService.paginate(lead_filter.clients(), UserService.lead_order(sort_by), Client.id, **PaginationService.options(request.args, LEAD_COUNT_TAGS))
+    return jsonify(PaginationService.envelope(result, [{"id": c.id, "full_name": c.full_name, "email": c.email, "phone": c.phone, "instagram": c.instagram, "created_at": c.created_at.isoformat()} for c in result['items']])), 200
 
 @bp.route('/admin/db/agendas', methods=['GET', 'POST', 'DELETE'])
 @login_required
@@ -383,10 +388,14 @@ def manage_db_agendas():
             if 'status' in data: a.status = data['status']
             if 'origin' in data: a.origin = data['origin']
             if 'start_time' in data: a.start_time = datetime.fromisoformat(data['start_time'].replace('Z', ''))
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The unique index on active (closer, start) rejects moving (or reviving) onto a taken slot
+            db.session.rollback()
+            return jsonify({"message": "El closer ya tiene una agenda activa en ese horario."}), 409
         return jsonify({"message": "Agenda actualizada"}), 200
     
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -395,9 +404,7 @@ def manage_db_agendas():
     origin_filter = request.args.get('origin')
 
     query = Appointment.query.join(Client).join(User, Appointment.closer_id == User.id)
-    if search:
-        term = f"%{search}%"
-        query = query.filter(or_(Client.full_name.ilike(term), Client.email.ilike(term)))
+    query = SearchService.filter(query, search)
     
     if start_date: query = query.filter(Appointment.start_time >= datetime.strptime(start_date, '%Y-%m-%d'))
     if end_date: query = query.filter(Appointment.start_time < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
@@ -414,8 +421,8 @@ def manage_db_agendas():
         origins = origin_filter.split(',')
         if origins: query = query.filter(Appointment.origin.in_(origins))
 
-    pagination = query.order_by(Appointment.start_time.desc()).paginate(page=page, per_page=50, error_out=False)
-    return jsonify({"total": pagination.total, "pages": pagination.pages, "data": [{"id": a.id, "lead": a.client.full_name or a.client.email, "closer": a.closer.username, "start_time": a.start_time.isoformat(), "status": a.status, "origin": a.origin} for a in pagination.items]}), 200
+    result = PaginationService.paginate(query, [(Appointment.start_time, True)], Appointment.id, **PaginationService.options(request.args, AGENDA_COUNT_TAGS))
+    return jsonify(PaginationService.envelope(result, [{"id": a.id, "lead": a.client.full_name or a.client.email, "closer": a.closer.username, "start_time": a.start_time.isoformat(), "status": a.status, "origin": a.origin} for a in result['items']])), 200
 
 @bp.route('/admin/db/sales_raw', methods=['GET', 'POST'])
 @login_required
@@ -432,7 +439,6 @@ def manage_db_sales():
         db.session.commit()
         return jsonify({"message": "Registro de venta actualizado"}), 200
         
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -444,9 +450,7 @@ def manage_db_sales():
     # Use outerjoin to be safe
     query = Payment.query.join(Enrollment).join(Client).outerjoin(PaymentMethod, Payment.payment_method_id == PaymentMethod.id)
     
-    if search:
-        term = f"%{search}%"
-        query = query.filter(or_(Client.full_name.ilike(term), Client.email.ilike(term)))
+    query = SearchService.filter(query, search)
     
     if start_date: query = query.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d'))
     if end_date: query = query.filter(Payment.date < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
@@ -459,13 +463,13 @@ def manage_db_sales():
         methods = payment_method_filter.split(',')
         if methods: query = query.filter(PaymentMethod.name.in_(methods))
 
-    pagination = query.order_by(Payment.date.desc()).paginate(page=page, per_page=50, error_out=False)
-    return jsonify({"total": pagination.total, "pages": pagination.pages, "data": [{
+    result = PaginationService.paginate(query, [(Payment.date, True)], Payment.id, **PaginationService.options(request.args, SALES_COUNT_TAGS))
+    return jsonify(PaginationService.envelope(result, [{
         "id": p.id, "date": p.date.isoformat(), 
         "student": p.enrollment.client.full_name or p.enrollment.client.email,
         "program": p.enrollment.program.name,
         "amount": float(p.amount), "payment_type": p.payment_type, "method": p.payment_method.name if p.payment_method else "N/A"
-    } for p in pagination.items]}), 200
+    } for p in result['items']])), 200
 
 @bp.route('/admin/db/questions', methods=['GET', 'POST'])
 @bp.route('/admin/db/questions/<int:id>', methods=['DELETE'])
@@ -612,6 +616,7 @@ def manage_events():
             db.session.add(e)
             
         try:
+            FunnelService.invalidate()
             db.session.commit()
             return jsonify({"message": "Evento guardado"}), 200
         except Exception as err:
@@ -623,6 +628,7 @@ def manage_events():
         e = Event.query.get_or_404(id)
         db.session.delete(e) # Questions cascade? No, need manual delete or set null.
         # Ideally SurveyQuestion should cascade delete if event is deleted, let's assume manual for now or db constraint.
+        FunnelService.invalidate()
         db.session.commit()
         return jsonify({"message": "Evento eliminado"}), 200
         
@@ -671,6 +677,7 @@ def manage_event_questions(event_id):
             )
             db.session.add(q)
         
+        FunnelService.invalidate()
         db.session.commit()
         return jsonify({"message": "Pregunta guardada"}), 200
         
@@ -713,6 +720,7 @@ def manage_global_questions():
                 order=data.get('order', 0)
             )
             db.session.add(q)
+        FunnelService.invalidate()
         db.session.commit()
         return jsonify({"message": "Pregunta global guardada"}), 200
 
@@ -746,6 +754,7 @@ def manage_group_questions(group_id):
                 order=data.get('order', 0)
             )
             db.session.add(q)
+        FunnelService.invalidate()
         db.session.commit()
         return jsonify({"message": "Pregunta de grupo guardada"}), 200
 
@@ -762,6 +771,7 @@ def delete_event_question(id):
     from app.models import SurveyQuestion
     q = SurveyQuestion.query.get_or_404(id)
     db.session.delete(q)
+    FunnelService.invalidate()
     db.session.commit()
     return jsonify({"message": "Pregunta eliminada"}), 200
 
@@ -1,10 +1,15 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from app.services.closer_service import CloserService
+from app.services.lead_profile_service import LeadProfileService
+from app.services.slot_cache import SlotCache
+from app.services.search_service import SearchService
+from app.services.pagination_service import PaginationService
 from app.models import DailyReportQuestion, CloserDailyStats, DailyReportAnswer, db, Appointment, Enrollment, WeeklyAvailability, Event, Client, Payment, ClientComment
 from app.decorators import role_required
 from datetime import date, timedelta, datetime
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 
 bp = Blueprint('closer_api', __name__)
 
@@ -60,14 +65,12 @@ def get_dashboard():
     ).distinct().all()
     
     for s in sales:
-        total_paid = s.total_paid
-        price = s.program.price if s.program else 0.0
         serialized['sales_today'].append({
             "id": s.id,
             "student_name": s.client.full_name or s.client.email if s.client else "Unknown",
             "program_name": s.program.name if s.program else "Unknown",
-            "amount": total_paid,
-            "debt": max(0, price - total_paid),
+            "amount": s.total_paid,
+            "debt": s.balance_due,
             "time": s.enrollment_date.isoformat()
         })
     
@@ -96,8 +99,9 @@ def get_assigned_leads():
     }
     page = request.args.get('page', 1, type=int)
     
-    pagination = CloserService.get_leads_pagination(current_user.id, page=page, filters=filters)
-    kpis = CloserService.get_leads_kpis(current_user.id, filters=filters)
+    lead_filter = CloserService.lead_filter(current_user.id, filters)
+    pagination = CloserService.get_leads_pagination(lead_filter, page=page, sort_by=filters['sort_by'])
+    kpis = CloserService.get_leads_kpis(current_user.id, lead_filter)
     
     return jsonify({
         "leads": [{"id": l.id, "username": l.full_name or l.email, "email": l.email, "phone": l.phone} for l in pagination.items],
@@ -114,9 +118,8 @@ def search_closer_leads():
     query_str = request.args.get('q', '')
     if len(query_str) < 2: return jsonify([]), 200
     
-    term = f"%{query_str}%"
     # Allow searching ALL clients so they can sell to anyone in DB
-    leads = Client.query.filter(or_(Client.full_name.ilike(term), Client.email.ilike(term))).limit(20).all()
+    leads = SearchService.typeahead(query_str, limit=20)
     
     return jsonify([{
         "id": l.id, 
@@ -152,7 +155,6 @@ def get_all_agendas():
     if current_user.role not in ['closer', 'admin']:
         return jsonify({"message": "Forbidden"}), 403
     
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -177,10 +179,7 @@ def get_all_agendas():
 
     # Search
     if search:
-        query = query.join(Client).filter(
-            (Client.full_name.ilike(f'%{search}%')) | 
-            (Client.email.ilike(f'%{search}%'))
-        )
+        query = SearchService.filter(query.join(Client), search)
     
     # Date Range
     if start_date:
@@ -197,10 +196,9 @@ def get_all_agendas():
             from sqlalchemy import or_
             query = query.filter(Appointment.status.in_(statuses))
 
-    pagination = query.order_by(Appointment.start_time.desc()).paginate(page=page, per_page=50)
+    result = PaginationService.paginate(query, [(Appointment.start_time, True)], Appointment.id, **PaginationService.options(request.args, ('appointments', 'clients')))
     
-    return jsonify({
-        "data": [{
+    return jsonify(PaginationService.envelope(result, [{
             "id": a.id, 
             "lead_name": a.client.full_name or a.client.email if a.client else "Unknown",
             "phone": a.client.phone if a.client else None,
@@ -208,9 +206,7 @@ def get_all_agendas():
             "date": a.start_time.isoformat(), 
             "status": a.status, 
             "type": a.appointment_type
-        } for a in pagination.items],
-        "total": pagination.total, "pages": pagination.pages
-    }), 200
+        } for a in result['items']])), 200
 
 @bp.route('/sales', methods=['GET'])
 @login_required
@@ -218,7 +214,6 @@ def get_all_sales():
     if current_user.role not in ['closer', 'admin', 'setter']:
         return jsonify({"message": "Forbidden"}), 403
         
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -229,14 +224,10 @@ def get_all_sales():
 
     # Joins for filtering
     from app.models import Program, Payment, PaymentMethod
-    query = query.join(Client).join(Program).outerjoin(Payment).outerjoin(PaymentMethod, Payment.payment_method_id == PaymentMethod.id)
+    query = query.join(Client).join(Program)
 
     # Search
-    if search:
-        query = query.filter(
-            (Client.full_name.ilike(f'%{search}%')) | 
-            (Client.email.ilike(f'%{search}%'))
-        )
+    query = SearchService.filter(query, search)
     
     # Date Range (Enrollment Date)
     if start_date:
@@ -255,12 +246,13 @@ def get_all_sales():
     if payment_filter:
         methods = payment_filter.split(',')
         if methods:
-            query = query.filter(PaymentMethod.name.in_(methods))
+            # any() instead of a join, so enrollments with several payments appear once
+            query = query.filter(Enrollment.payments.any(Payment.payment_method.has(PaymentMethod.name.in_(methods))))
 
-    pagination = query.order_by(Enrollment.enrollment_date.desc()).paginate(page=page, per_page=50)
+    result = PaginationService.paginate(query, [(Enrollment.enrollment_date, True)], Enrollment.id, **PaginationService.options(request.args, ('enrollments', 'payments', 'clients')))
     
     data = []
-    for s in pagination.items:
+    for s in result['items']:
         # Get payment info (assuming single payment for simplicity or aggregate)
         # s.payments is dynamic, so use order_by
         last_payment = s.payments.order_by(Payment.id.desc()).first()
@@ -276,10 +268,7 @@ def get_all_sales():
             "date": s.enrollment_date.isoformat()
         })
 
-    return jsonify({
-        "data": data,
-        "total": pagination.total, "pages": pagination.pages
-    }), 200
+    return jsonify(PaginationService.envelope(result, data)), 200
 
 @bp.route('/weekly-availability', methods=['GET', 'POST'])
 @login_required
@@ -294,6 +283,7 @@ def manage_weekly_availability():
             day_of_week = int(day_entry.get('day'))
             for slot in day_entry.get('slots', []):
                 db.session.add(WeeklyAvailability(closer_id=current_user.id, day_of_week=day_of_week, start_time=datetime.strptime(slot['start'], '%H:%M').time(), end_time=datetime.strptime(slot['end'], '%H:%M').time()))
+        SlotCache.invalidate_closer(current_user.id)
         db.session.commit()
         return jsonify({"message": "Horario semanal actualizado"}), 200
         
@@ -320,7 +310,7 @@ def get_or_delete_enrollment(id):
     if request.method == 'DELETE':
         CloserService.delete_enrollment(id)
         return jsonify({"message": "Venta eliminada"}), 200
-    return jsonify(CloserService.get_enrollment_details(id)), 200
+    return jsonify(LeadProfileService.enrollment_details(id)), 200
 
 @bp.route('/enrollments/<int:id>/payments', methods=['POST'])
 @login_required
@@ -405,12 +395,17 @@ def update_appointment(id):
     if 'start_time' in data:
         try:
             # Format usually comes as ISO from frontend
-            appt.start_time = datetime.fromisoformat(data['start_time'].replace('Z', ''))
+            new_start = datetime.fromisoformat(data['start_time'].replace('Z', ''))
         except ValueError:
             return jsonify({"error": "Invalid date format"}), 400
-            
-    db.session.commit()
-    db.session.commit()
+        appt.start_time = new_start
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The unique index on active (closer, start) rejects moving onto a taken slot
+        db.session.rollback()
+        return jsonify({"error": "El closer ya tiene una agenda activa en ese horario."}), 409
     return jsonify({"message": "Agenda actualizada con éxito"}), 200
 
 @bp.route('/appointments', methods=['POST'])
@@ -1,65 +1,50 @@
-from flask import Blueprint, request, jsonify
-from app.models import db, Event, Client, Appointment, SurveyAnswer, SurveyQuestion, User
+from flask import Blueprint, request, jsonify, make_response
+from app.models import db, Event, Client, SurveyQuestion
 from app.services.booking_service import BookingService
-from datetime import datetime, date, timedelta
-import json
+from app.services.slot_hold_service import SlotHoldService
+from app.services.funnel_service import FunnelService
+from app.services.assignment_service import AssignmentService
+from app.services.lead_profile_service import LeadProfileService
+from datetime import datetime, timedelta
 
 bp = Blueprint('public_api', __name__)
 
+def _revalidated(payload, etag):
+    # Browsers and proxies revalidate with If-None-Match and get a 304 while the part is unchanged
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/public/funnel/<string:utm_source>/static', methods=['GET'])
+def get_funnel_static(utm_source):
+    static = FunnelService.get_static(utm_source)
+    if not static:
+        return jsonify({"error": "Event not found"}), 404
+    return _revalidated(*static)
+
+@bp.route('/public/funnel/<string:utm_source>/slots', methods=['GET'])
+def get_funnel_slots(utm_source):
+    slots = FunnelService.get_slots(utm_source)
+    if not slots:
+        return jsonify({"error": "Event not found"}), 404
+    return _revalidated(*slots)
+
 @bp.route('/public/funnel/<string:utm_source>', methods=['GET'])
 def get_funnel_by_source(utm_source):
-    # Find event by utm_source
-    event = Event.query.filter_by(utm_source=utm_source, is_active=True).first()
-    if not event:
+    # Combined payload kept for existing clients: static part + slots
+    static = FunnelService.get_static(utm_source)
+    if not static:
+        return jsonify({"error": "Event not found"}), 404
+    slots = FunnelService.get_slots(utm_source)
+    if not slots:
         return jsonify({"error": "Event not found"}), 404
-        
-    # Merge Questions: Global + Group + Event
-    global_questions = SurveyQuestion.query.filter_by(is_global=True, is_active=True).all()
-    group_questions = SurveyQuestion.query.filter_by(group_id=event.group_id, is_active=True).all() if event.group_id else []
-    event_questions = SurveyQuestion.query.filter_by(event_id=event.id, is_active=True).all()
-    
-    # Simple merge and sort by order
-    questions = global_questions + group_questions + event_questions
-    questions.sort(key=lambda x: x.order)
-        
-    # Get available slots (Generic for all closers)
-    start_date = date.today()
-    end_date = start_date + timedelta(days=14)
-    
-    # Simple strategy: aggregate slots from all closers
-    closers = User.query.filter_by(role='closer').all()
-    all_slots = []
-    for closer in closers:
-        slots = BookingService.get_available_slots_utc(start_date, end_date, preferred_closer_id=closer.id)
-        for s in slots:
-            s['closer_id'] = closer.id
-            s['closer_name'] = closer.username
-            all_slots.append(s)
-            
-    # Sort by timestamp for proper chronological order
-    all_slots.sort(key=lambda x: x['ts'])
 
-    return jsonify({
-        "event": {
-            "id": event.id,
-            "name": event.name,
-            "duration": event.duration_minutes,
-            "utm_source": event.utm_source,
-            "min_score": event.min_score,
-            "redirect_success": event.redirect_url_success,
-            "redirect_fail": event.redirect_url_fail,
-        },
-        "questions": [{
-            "id": q.id,
-            "text": q.text,
-            "type": q.question_type,
-            "options": json.loads(q.options) if q.options and q.options.startswith('[') else q.options,
-            "step": q.step,
-            "mapping": q.mapping_field
-        } for q in questions],
-        "availability": all_slots,
-        "closer_name": "Equipo NeurOPS" # Generic if merging
-    }), 200
+    payload = {**static[0], **slots[0]}
+    return _revalidated(payload, f'{static[1]}-{slots[1]}')
 
 @bp.route('/public/clients/check', methods=['POST'])
 def check_client_exists():
@@ -114,37 +99,38 @@ def submit_survey():
 
 @bp.route('/public/slots', methods=['GET'])
 def get_public_slots():
-    # Helper to get slots from ALL closers or specific if logic demands.
-    # Usually we want Round Robin or Pool. 
-    # For now, let's use BookingService to get slots from a specific closer if passed, or generic. 
-    # BookingService currently takes preferred_closer_id. 
-    # If no closer specified, we might want to aggregate ALL slots.
-    
-    # Simple strategy: standard 7 days lookahead
+    # Merged slots from all closers, standard 7 days lookahead
     start_date = datetime.now().date()
     end_date = start_date + timedelta(days=7)
-    
-    # We need a logic to pick which closer's slots to show, or show combined.
-    # BookingService.get_available_slots_utc returns slots for a specific closer.
-    # Let's iterate all active closers and merge? Or just pick one?
-    # User requirement is high level. Let's merge all available slots from all closers.
-    
-    closers = User.query.filter_by(role='closer').all()
-    all_slots = []
-    
-    for closer in closers:
-        slots = BookingService.get_available_slots_utc(start_date, end_date, preferred_closer_id=closer.id)
-        # slots structure: [{"start": ISO, "end": ISO, "closer_id": ID}...] (if we modify service to return closer_id)
-        # Service returns dict per day usually or list. 
-        # Let's check CloserService usage: it returns list of objects? No, usually list of dicts.
-        # Assuming list of {start, end}. We add closer_id.
-        for s in slots:
-            s['closer_id'] = closer.id
-            all_slots.append(s)
-            
-    # Sort by time
-    all_slots.sort(key=lambda x: x['ts'])
-    return jsonify(all_slots), 200
+    return jsonify(BookingService.get_team_slots(start_date, end_date)), 200
+
+@bp.route('/public/holds', methods=['POST'])
+def create_hold():
+    # Blocks the chosen slot for a few minutes while the lead finishes the survey
+    data = request.get_json() or {}
+    timestamp = data.get('timestamp')
+    if not timestamp: return jsonify({"error": "Missing required fields (timestamp)"}), 400
+
+    from datetime import timezone
+    start_time = datetime.fromtimestamp(float(timestamp), tz=timezone.utc).replace(tzinfo=None)
+    event = Event.query.get(data['event_id']) if data.get('event_id') else None
+    closer_id = data.get('closer_id')
+    closer_ids = [closer_id] if closer_id else AssignmentService.rank_closers(start_time, event=event)
+
+    hold = BookingService.hold_slot(start_time, closer_ids, event=event)
+    if not hold:
+        return jsonify({"error": "Lo sentimos, este horario ya no está disponible. Por favor elige otro."}), 409
+    return jsonify({
+        "token": hold.token,
+        "closer_id": hold.closer_id,
+        "utc_iso": hold.start_time.isoformat() + 'Z',
+        "expires_at": hold.expires_at.isoformat() + 'Z'
+    }), 201
+
+@bp.route('/public/holds/<string:token>', methods=['DELETE'])
+def release_hold(token):
+    SlotHoldService.release(token)
+    return jsonify({"message": "Hold released"}), 200
 
 @bp.route('/public/book', methods=['POST'])
 def book_appointment():
@@ -163,40 +149,34 @@ def book_appointment():
         return jsonify({"error": "Missing required fields (email, timestamp, event_id)"}), 400
         
     try:
-        # 1. Create/Update Client
+        # 1. Create/Update Client (the whole booking is committed once at the end)
         client = BookingService.create_or_update_client({
             'email': email,
             'name': name,
             'phone': phone,
             'instagram': instagram
-        })
+        }, commit=False)
         
-        # 2. Find a closer (Generic logic: use the one from the slot if possible, or any available)
-        # The frontend sends 'timestamp'. We need to find which closer has that slot.
+        # 2. Reserve the slot with the requested closer or the first free one
         # Ensure timestamp is treated as UTC
         from datetime import timezone
         start_time = datetime.fromtimestamp(float(timestamp), tz=timezone.utc).replace(tzinfo=None)
         
-        # Find which closer has this availability
-        # Note: In public funnel, we might want to pick a closer automatically.
-        # For now, let's see if the frontend sends closer_id. 
-        # Frontend BookingPage.jsx doesn't seem to send closer_id in the payload I saw.
-        # Let's adjust BookingPage.jsx to send closer_id, OR find one here.
-        
+        event = Event.query.get(event_id)
         closer_id = data.get('closer_id')
-        if not closer_id:
-            # Pick any closer that has this slot available and no conflict
-            # This is a bit simplified for now.
-            closers = User.query.filter_by(role='closer').all()
-            for c in closers:
-                appt = BookingService.create_appointment(client.id, c.id, start_time, origin='Funnel Web')
-                if appt:
-                    closer_id = c.id
-                    break
+        hold = SlotHoldService.get_active(data.get('hold_token'))
+        if closer_id:
+            closer_ids = [closer_id]
         else:
-            appt = BookingService.create_appointment(client.id, closer_id, start_time, origin='Funnel Web')
+            # Free closers at that time, least loaded first
+            closer_ids = AssignmentService.rank_closers(start_time, event=event)
+            if hold and hold.start_time == start_time:
+                # Held slots are hidden from the free-closer index; the holder keeps its closer
+                closer_ids = [hold.closer_id] + [cid for cid in closer_ids if cid != hold.closer_id]
+        appt = BookingService.book_slot(client.id, start_time, closer_ids, origin='Funnel Web', event=event, hold=hold)
             
-        if not closer_id:
+        if not appt:
+            db.session.rollback()
             return jsonify({"error": "Lo sentimos, este horario ya no está disponible. Por favor elige otro."}), 400
 
         # 3. Save Survey Answers and Calculate Score
@@ -209,22 +189,11 @@ def book_appointment():
                 
                 # Calculate points for this answer
                 q = SurveyQuestion.query.get(q_id_int)
-                if q and q.options:
-                    try:
-                        import json
-                        opts = json.loads(q.options)
-                        if isinstance(opts, list):
-                            for opt in opts:
-                                if str(opt.get('text')) == str(val):
-                                    total_score += int(opt.get('points', 0))
-                                    break
-                    except: # Fallback for old comma-separated format
-                        pass
+                if q: total_score += LeadProfileService.answer_points(q.options, val)
                         
-            BookingService.save_survey_answers(client.id, formatted_answers, appointment_id=appt.id)
+            BookingService.save_survey_answers(client.id, formatted_answers, appointment_id=appt.id, commit=False)
         
         # 4. Link to event and determine redirect
-        event = Event.query.get(event_id)
         redirect_url = None
         is_qualified = True
         
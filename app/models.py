@@ -2,6 +2,7 @@ from datetime import datetime
 from app import db, login
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.ext.hybrid import hybrid_property
 
 @login.user_loader
 def load_user(id):
@@ -13,6 +14,9 @@ ROLE_CLOSER = 'closer'
 ROLE_SETTER = 'setter'
 ROLE_OPERATOR = 'operator'
 
+# Closer commission over the net amount (after payment processor fees) of each sale payment
+CLOSER_COMMISSION_RATE = 0.10
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -46,6 +50,8 @@ class Client(db.Model):
     phone = db.Column(db.String(20))
     instagram = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Name + email without accents, lowercase; indexed for search (pg_trgm / FTS5), filled by SearchService
+    search_text = db.Column(db.String(255))
     
     # Relationships
     enrollments = db.relationship('Enrollment', backref='client', lazy='dynamic', cascade="all, delete-orphan")
@@ -100,16 +106,14 @@ class Enrollment(db.Model):
     program_id = db.Column(db.Integer, db.ForeignKey('programs.id'), nullable=False)
     closer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     enrollment_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized from completed payments and the program price (kept in sync by BalanceService)
+    total_paid = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    balance_due = db.Column(db.Float, nullable=False, default=0.0, server_default='0', index=True)
 
     payments = db.relationship('Payment', backref='enrollment', lazy='dynamic', cascade="all, delete-orphan")
     
     closer_rel = db.relationship('User', foreign_keys=[closer_id], backref='sales_made')
 
-    @property
-    def total_paid(self):
-        completed_payments = self.payments.filter_by(status='completed').all()
-        return sum(p.amount for p in completed_payments)
-
 class PaymentMethod(db.Model):
     __tablename__ = 'payment_methods'
     id = db.Column(db.Integer, primary_key=True)
@@ -132,12 +136,47 @@ class Payment(db.Model):
 
     payment_method = db.relationship('PaymentMethod', overlaps="method,payments")
 
+    # Money breakdown, usable per instance and inside aggregates. The SQL side reads
+    # PaymentMethod (fee) and Enrollment (closer_commission): outerjoin/join them in the query.
+    @hybrid_property
+    def fee(self):
+        if not self.method: return 0.0
+        return self.amount * ((self.method.commission_percent or 0.0) / 100.0) + (self.method.commission_fixed or 0.0)
+
+    @fee.expression
+    def fee(cls):
+        return cls.amount * (db.func.coalesce(PaymentMethod.commission_percent, 0.0) / 100.0) + db.func.coalesce(PaymentMethod.commission_fixed, 0.0)
+
+    @hybrid_property
+    def net(self):
+        return self.amount - self.fee
+
+    @net.expression
+    def net(cls):
+        return cls.amount - cls.fee
+
+    @hybrid_property
+    def closer_commission(self):
+        if not self.enrollment or not self.enrollment.closer_id: return 0.0
+        return self.net * CLOSER_COMMISSION_RATE
+
+    @closer_commission.expression
+    def closer_commission(cls):
+        return db.case((Enrollment.closer_id.isnot(None), cls.net * CLOSER_COMMISSION_RATE), else_=0.0)
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    # One active (non canceled) agenda per closer and start time, enforced by the database
+    __table_args__ = (
+        db.Index('uq_appointments_closer_start_active', 'closer_id', 'start_time', unique=True,
+                 sqlite_where=db.text("status != 'canceled'"),
+                 postgresql_where=db.text("status != 'canceled'")),
+    )
     id = db.Column(db.Integer, primary_key=True)
     closer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
     start_time = db.Column(db.DateTime, index=True)
+    duration_minutes = db.Column(db.Integer) # None = default event duration
     status = db.Column(db.String(20), default='scheduled')
     origin = db.Column(db.String(100)) # VSL, Closer, etc.
     appointment_type = db.Column(db.String(50), default='Primera agenda')
@@ -246,6 +285,17 @@ class CloserDailyStats(db.Model):
     closer = db.relationship('User', backref=db.backref('daily_stats', lazy='dynamic'))
     __table_args__ = (db.UniqueConstraint('closer_id', 'date', name='_closer_date_uc'),)
 
+class CloserDailyAgendaStats(db.Model):
+    # Rollup of agendas per closer, local day, type and status (kept by RollupService)
+    __tablename__ = 'closer_daily_agenda_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    closer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
+    appointment_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    __table_args__ = (db.UniqueConstraint('closer_id', 'date', 'appointment_type', 'status', name='_closer_date_type_status_uc'),)
+
 class GoogleCalendarToken(db.Model):
     __tablename__ = 'google_calendar_tokens'
     id = db.Column(db.Integer, primary_key=True)
@@ -320,6 +370,31 @@ class ClientComment(db.Model):
     text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class ActivityEvent(db.Model):
+    # Append-only activity log (written by ActivityService on flush); read newest first by (created_at, id)
+    __tablename__ = 'activity_events'
+    __table_args__ = (db.Index('ix_activity_events_created_at_id', 'created_at', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    event_type = db.Column(db.String(20), nullable=False, index=True) # lead, booking, agenda, sale, payment, comment
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id', ondelete='SET NULL'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL')) # Closer or comment author
+    entity_type = db.Column(db.String(30))
+    entity_id = db.Column(db.Integer)
+    message = db.Column(db.String(255), nullable=False)
+    detail = db.Column(db.String(255))
+    amount = db.Column(db.Float)
+
+class ActivityBounds(db.Model):
+    # Earliest/latest timestamp per entity (payments, clients, appointments), refreshed by BoundsService.rebuild
+    __tablename__ = 'activity_bounds'
+    entity = db.Column(db.String(30), primary_key=True)
+    min_at = db.Column(db.DateTime)
+    max_at = db.Column(db.DateTime)
+    # Version of the entity's cache tag the row was computed at; a newer tag means the row is stale
+    tag_version = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Ad(db.Model):
     __tablename__ = 'ads'
     id = db.Column(db.Integer, primary_key=True)
@@ -329,3 +404,21 @@ class Ad(db.Model):
     total_spend = db.Column(db.Float, default=0.0)
     ad_group_id = db.Column(db.Integer, db.ForeignKey('ad_groups.id'), nullable=False)
     event_id = db.Column(db.Integer, db.ForeignKey('events.id'))
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(120), unique=True, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SlotHold(db.Model):
+    __tablename__ = 'slot_holds'
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), unique=True, nullable=False)
+    closer_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True) # Sweeps delete by range on this index
+    __table_args__ = (db.UniqueConstraint('closer_id', 'start_time', name='_hold_closer_start_uc'),)
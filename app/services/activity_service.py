@@ -0,0 +1,154 @@
+from app import db
+from app.models import ActivityEvent, Client, Appointment, Enrollment, Payment, Program, ClientComment
+from app.services.pagination_service import PaginationService
+from datetime import datetime
+from sqlalchemy import event, inspect, select, insert
+from sqlalchemy.orm import Session
+
+FEED_LIMIT = 20
+MAX_FEED_LIMIT = 100
+AGENDA_STATUS_MESSAGES = {
+    'completed': 'Agenda completada',
+    'no_show': 'Agenda no show',
+    'canceled': 'Agenda cancelada',
+    'rescheduled': 'Agenda reprogramada',
+    'confirmed': 'Agenda confirmada',
+    'scheduled': 'Agenda reactivada',
+}
+
+class ActivityService:
+    """
+    Feed de actividad sobre un log append-only (activity_events).
+    Los eventos se escriben en el mismo flush que crea leads, agendas, ventas, pagos y
+    comentarios (o cambia el estado de una agenda o pago), así que ningún camino de
+    escritura queda fuera. La lectura es un único range scan sobre (created_at, id).
+    """
+
+    # --- Write path ---
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        pending = []  # (event_type, obj)
+        for obj in session.new:
+            model = type(obj)
+            if model is Client: pending.append(('lead', obj))
+            elif model is Appointment: pending.append(('booking', obj))
+            elif model is Enrollment: pending.append(('sale', obj))
+            elif model is Payment and obj.status == 'completed': pending.append(('payment', obj))
+            elif model is ClientComment: pending.append(('comment', obj))
+        for obj in session.dirty:
+            model = type(obj)
+            if model not in (Appointment, Payment) or obj in session.new or obj in session.deleted: continue
+            history = inspect(obj).attrs.status.history
+            if not history.added or history.added == history.deleted: continue
+            if model is Appointment: pending.append(('agenda', obj))
+            elif obj.status == 'completed': pending.append(('payment', obj))
+        if pending:
+            ActivityService._write(session.connection(), pending)
+
+    @staticmethod
+    def _write(connection, pending):
+        # Names, closers and programs for every event of the flush in three queries
+        enrollment_ids = {obj.enrollment_id for kind, obj in pending if kind == 'payment'}
+        enrollments = {row.id: row for row in connection.execute(
+            select(Enrollment.id, Enrollment.client_id, Enrollment.closer_id).where(Enrollment.id.in_(enrollment_ids))
+        )} if enrollment_ids else {}
+
+        def client_of(kind, obj):
+            if kind == 'lead': return obj.id
+            if kind == 'payment': return enrollments[obj.enrollment_id].client_id if obj.enrollment_id in enrollments else None
+            return obj.client_id
+
+        client_ids = {client_of(kind, obj) for kind, obj in pending} - {None}
+        clients = {row.id: row.full_name or row.email for row in connection.execute(
+            select(Client.id, Client.full_name, Client.email).where(Client.id.in_(client_ids))
+        )} if client_ids else {}
+        program_ids = {obj.program_id for kind, obj in pending if kind == 'sale'}
+        programs = dict(connection.execute(select(Program.id, Program.name).where(Program.id.in_(program_ids))).all()) if program_ids else {}
+
+        now = datetime.utcnow()
+        rows = []
+        for kind, obj in pending:
+            client_id = client_of(kind, obj)
+            row = {'created_at': now, 'event_type': kind, 'client_id': client_id, 'user_id': None,
+                   'entity_type': obj.__tablename__, 'entity_id': obj.id, 'detail': clients.get(client_id), 'amount': None}
+            if kind == 'lead':
+                row['message'] = 'Nuevo Lead'
+            elif kind == 'booking':
+                row.update(message=f'Nueva agenda ({obj.appointment_type or "Primera agenda"})', user_id=obj.closer_id)
+            elif kind == 'agenda':
+                row.update(message=AGENDA_STATUS_MESSAGES.get(obj.status, f'Agenda: {obj.status}'), user_id=obj.closer_id)
+            elif kind == 'sale':
+                row.update(message=f'Venta: {programs.get(obj.program_id, "Programa")}', user_id=obj.closer_id)
+            elif kind == 'payment':
+                enrollment = enrollments.get(obj.enrollment_id)
+                row.update(message=f'Pago: ${obj.amount or 0:,.0f}', amount=obj.amount, user_id=enrollment.closer_id if enrollment else None)
+            elif kind == 'comment':
+                row.update(message='Nuevo comentario', user_id=obj.author_id)
+            rows.append(row)
+        connection.execute(insert(ActivityEvent.__table__), rows)
+
+    # --- Read path ---
+
+    @staticmethod
+    def feed(limit=FEED_LIMIT, cursor=None, event_types=None, client_id=None):
+        """Eventos del más nuevo al más viejo: {'items': [...], 'next_cursor': str | None}."""
+        limit = max(1, min(int(limit or FEED_LIMIT), MAX_FEED_LIMIT))
+        query = ActivityEvent.query
+        if event_types: query = query.filter(ActivityEvent.event_type.in_(event_types))
+        if client_id: query = query.filter(ActivityEvent.client_id == client_id)
+        page = PaginationService.paginate(query, [(ActivityEvent.created_at, True)], ActivityEvent.id, cursor=cursor, limit=limit)
+        return {'items': [ActivityService.serialize(e) for e in page['items']], 'next_cursor': page['next_cursor']}
+
+    @staticmethod
+    def serialize(e):
+        return {
+            'id': e.id,
+            'type': e.event_type,
+            'time': e.created_at,
+            'message': e.message,
+            'sub': e.detail,
+            'client_id': e.client_id,
+            'user_id': e.user_id,
+            'entity': {'type': e.entity_type, 'id': e.entity_id},
+            'amount': e.amount
+        }
+
+    # --- Backfill ---
+
+    @staticmethod
+    def backfill():
+        """
+        Carga el log con leads, ventas, pagos completados y comentarios existentes (fechados con su
+        propio timestamp). Devuelve la cantidad de eventos, o None si el log ya tenía eventos.
+        """
+        if db.session.query(ActivityEvent.id).first():
+            return None
+        name = db.func.coalesce(Client.full_name, Client.email)
+        sources = [
+            select(Client.created_at, db.literal('lead'), Client.id, db.null(), db.literal('clients'), Client.id,
+                   db.literal('Nuevo Lead'), name, db.null()),
+            select(Enrollment.enrollment_date, db.literal('sale'), Enrollment.client_id, Enrollment.closer_id, db.literal('enrollments'), Enrollment.id,
+                   db.literal('Venta: ') + db.func.coalesce(Program.name, 'Programa'), name, db.null())
+                .join(Client, Client.id == Enrollment.client_id).outerjoin(Program, Program.id == Enrollment.program_id),
+            select(Payment.date, db.literal('payment'), Enrollment.client_id, Enrollment.closer_id, db.literal('payments'), Payment.id,
+                   db.null(), name, Payment.amount)
+                .join(Enrollment, Enrollment.id == Payment.enrollment_id).join(Client, Client.id == Enrollment.client_id)
+                .where(Payment.status == 'completed'),
+            select(ClientComment.created_at, db.literal('comment'), ClientComment.client_id, ClientComment.author_id, db.literal('client_comments'), ClientComment.id,
+                   db.literal('Nuevo comentario'), name, db.null())
+                .join(Client, Client.id == ClientComment.client_id),
+        ]
+        columns = ['created_at', 'event_type', 'client_id', 'user_id', 'entity_type', 'entity_id', 'message', 'detail', 'amount']
+        count = 0
+        for source in sources:
+            rows = [dict(zip(columns, row)) for row in db.session.execute(source).all()]
+            for row in rows:
+                row['created_at'] = row['created_at'] or datetime.utcnow()
+                if row['event_type'] == 'payment': row['message'] = f"Pago: ${row['amount'] or 0:,.0f}"
+            if rows: db.session.execute(insert(ActivityEvent.__table__), rows)
+            count += len(rows)
+        db.session.commit()
+        return count
+
+event.listen(Session, 'after_flush', ActivityService._after_flush)
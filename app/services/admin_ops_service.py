@@ -1,5 +1,9 @@
 from app import db
-from app.models import User, Client, Appointment, Enrollment, Payment, SurveyAnswer, Program, PaymentMethod
+from app.models import User, Client, Appointment, Enrollment, Payment, SurveyAnswer, Program, PaymentMethod, ActivityEvent
+from app.services.slot_cache import SlotCache
+from app.services.cache_service import ResultCache
+from app.services.rollup_service import RollupService
+from app.services.bounds_service import BoundsService
 from datetime import datetime, timedelta
 import random
 
@@ -7,11 +11,17 @@ class AdminOperationService:
     @staticmethod
     def clear_business_data():
         try:
+            db.session.query(ActivityEvent).delete()
             db.session.query(SurveyAnswer).delete()
             db.session.query(Payment).delete()
             db.session.query(Enrollment).delete()
             db.session.query(Appointment).delete()
             db.session.query(Client).delete()
+            SlotCache.invalidate_all()
+            # Bulk deletes skip the flush listeners that keep the daily rollups and the cache tags
+            RollupService.rebuild(connection=db.session.connection())
+            BoundsService.rebuild(connection=db.session.connection())
+            ResultCache.invalidate()
             db.session.commit()
             return True, "Datos de negocio eliminados correctamente."
         except Exception as e:
@@ -55,11 +65,15 @@ class AdminOperationService:
 
             # 2. Generate Appointments
             appts = []
+            taken = set()
             for i in range(appt_count):
                 client = random.choice(clients)
                 closer = random.choice(closers)
                 days_offset = random.randint(-15, 5)
                 start_time = datetime.utcnow().replace(hour=random.randint(9, 18), minute=0, second=0, microsecond=0) + timedelta(days=days_offset)
+                # A closer can't hold two active agendas at the same time
+                if (closer.id, start_time) in taken: continue
+                taken.add((closer.id, start_time))
                 
                 appt = Appointment(
                     client_id=client.id,
@@ -103,6 +117,7 @@ class AdminOperationService:
                 )
                 db.session.add(payment)
 
+            SlotCache.invalidate_all()
             db.session.commit()
             return True, f"Se generaron {client_count} leads, {appt_count} agendas y {sale_count} ventas."
         except Exception as e:
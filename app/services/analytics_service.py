@@ -0,0 +1,139 @@
+from app import db
+from app.models import Client, Appointment, Enrollment, Payment, Program, SurveyAnswer, SurveyQuestion, Event
+from app.services.cache_service import ResultCache
+from app.services.timeseries_service import TimeSeriesService
+import numpy as np
+import pandas as pd
+
+SECOND_AGENDA_TYPE = 'Segunda agenda'
+UNKNOWN_SOURCE = 'Desconocido'
+# Funnel stages in order; 'lead' is the cohort itself
+STAGES = ('lead', 'survey', 'first_agenda', 'show', 'second_agenda', 'sale')
+# Stages with a timestamp, for time-to-stage distributions (surveys have none)
+TIMED_STAGES = ('first_agenda', 'show', 'second_agenda', 'sale')
+# Stage each conversion rate is measured from; the survey is optional (imported or closer-made leads skip it)
+PREVIOUS_STAGE = {'survey': 'lead', 'first_agenda': 'lead', 'show': 'first_agenda', 'second_agenda': 'show', 'sale': 'second_agenda'}
+
+class AnalyticsService:
+    """
+    Conversión del funnel por fuente para la cohorte de leads creados en el rango:
+    lead -> encuesta -> primera agenda -> show -> segunda agenda -> venta.
+    Cinco queries en bloque (leads, encuestas, agendas, ventas, pagos) y el resto vectorizado en pandas.
+    La fuente es la utm_source del evento cuyas preguntas respondió el lead, o el origin de su primera agenda.
+    """
+
+    @staticmethod
+    @ResultCache.cached('analytics:funnel', tags=('clients', 'appointments', 'enrollments', 'payments', 'surveys', 'events'))
+    def get_funnel(start_date, end_date):
+        start_dt, end_dt = TimeSeriesService.utc_bounds(start_date, end_date)
+        frames = AnalyticsService._load(start_dt, end_dt)
+        leads = AnalyticsService._client_stages(frames)
+
+        sources = [AnalyticsService._summary('total', leads)]
+        for source, group in leads.groupby('source', sort=False):
+            sources.append(AnalyticsService._summary(source, group))
+        sources[1:] = sorted(sources[1:], key=lambda s: (-s['stages'][0]['count'], s['source']))
+        return {
+            'dates': {'start': start_date.isoformat(), 'end': end_date.isoformat()},
+            'stages': list(STAGES),
+            'sources': sources
+        }
+
+    @staticmethod
+    def _load(start_dt, end_dt):
+        cohort = (Client.created_at >= start_dt, Client.created_at <= end_dt)
+
+        connection = db.session.connection()
+
+        def frame(query, columns):
+            # Core execution: plain tuples straight into the DataFrame, no ORM row loading
+            return pd.DataFrame(connection.execute(query).fetchall(), columns=columns)
+
+        return {
+            'clients': frame(db.select(Client.id, Client.created_at).where(*cohort), ['client_id', 'created_at']),
+            'surveys': frame(
+                db.select(SurveyAnswer.client_id, db.func.min(Event.utm_source))
+                .join(Client, Client.id == SurveyAnswer.client_id)
+                .join(SurveyQuestion, SurveyQuestion.id == SurveyAnswer.question_id)
+                .outerjoin(Event, Event.id == SurveyQuestion.event_id)
+                .where(*cohort).group_by(SurveyAnswer.client_id),
+                ['client_id', 'utm_source']),
+            'appointments': frame(
+                db.select(Appointment.client_id, Appointment.start_time, Appointment.status, Appointment.appointment_type, Appointment.origin)
+                .join(Client, Client.id == Appointment.client_id).where(*cohort),
+                ['client_id', 'start_time', 'status', 'appointment_type', 'origin']),
+            'enrollments': frame(
+                db.select(Enrollment.client_id, Enrollment.enrollment_date, db.func.coalesce(Program.price, 0.0))
+                .join(Client, Client.id == Enrollment.client_id).outerjoin(Program, Program.id == Enrollment.program_id).where(*cohort),
+                ['client_id', 'enrollment_date', 'price']),
+            'payments': frame(
+                db.select(Enrollment.client_id, db.func.sum(Payment.amount))
+                .join(Enrollment, Enrollment.id == Payment.enrollment_id).join(Client, Client.id == Enrollment.client_id)
+                .where(*cohort, Payment.status == 'completed').group_by(Enrollment.client_id),
+                ['client_id', 'cash_collected']),
+        }
+
+    @staticmethod
+    def _client_stages(frames):
+        """Una fila por lead: fuente, timestamp de cada etapa alcanzada (NaT si no) y montos."""
+        leads = frames['clients'].set_index('client_id')
+        leads['created_at'] = pd.to_datetime(leads['created_at'])
+        appts = frames['appointments']
+        appts['start_time'] = pd.to_datetime(appts['start_time'])
+        appts = appts.sort_values('start_time', kind='stable')
+
+        is_second = (appts['appointment_type'] == SECOND_AGENDA_TYPE).to_numpy()
+        first = appts[~is_second]
+        leads['first_agenda'] = first.groupby('client_id')['start_time'].min()
+        leads['show'] = first[first['status'] == 'completed'].groupby('client_id')['start_time'].min()
+        leads['second_agenda'] = appts[is_second].groupby('client_id')['start_time'].min()
+
+        enrollments = frames['enrollments']
+        enrollments['enrollment_date'] = pd.to_datetime(enrollments['enrollment_date'])
+        leads['sale'] = enrollments.groupby('client_id')['enrollment_date'].min()
+        leads['sales_amount'] = enrollments.groupby('client_id')['price'].sum()
+        leads['cash_collected'] = frames['payments'].set_index('client_id')['cash_collected']
+        leads[['sales_amount', 'cash_collected']] = leads[['sales_amount', 'cash_collected']].fillna(0.0)
+
+        surveys = frames['surveys'].set_index('client_id')['utm_source']
+        leads['survey'] = leads.index.isin(surveys.index)
+        first_origin = appts.drop_duplicates('client_id').set_index('client_id')['origin']
+        leads['source'] = surveys.reindex(leads.index).fillna(first_origin.reindex(leads.index)).fillna(UNKNOWN_SOURCE)
+        return leads
+
+    @staticmethod
+    def _summary(source, leads):
+        total = len(leads)
+        reached = {
+            'lead': np.ones(total, dtype=bool),
+            'survey': leads['survey'].to_numpy(dtype=bool),
+            **{stage: leads[stage].notna().to_numpy() for stage in TIMED_STAGES}
+        }
+        # count: leads that reached the stage; rate_from_previous: share of the previous stage's leads that reached it
+        stages = []
+        for stage in STAGES:
+            count = int(reached[stage].sum())
+            previous = reached[PREVIOUS_STAGE.get(stage, stage)]
+            previous_count = int(previous.sum())
+            entry = {
+                'stage': stage,
+                'count': count,
+                'rate_from_previous': round(int((reached[stage] & previous).sum()) / previous_count * 100, 2) if previous_count else 0.0,
+                'rate_from_lead': round(count / total * 100, 2) if total else 0.0,
+            }
+            if stage in TIMED_STAGES:
+                entry['days_from_lead'] = AnalyticsService._distribution((leads[stage] - leads['created_at']).dropna())
+            stages.append(entry)
+        return {
+            'source': source,
+            'stages': stages,
+            'revenue': {'sales_amount': float(leads['sales_amount'].sum()), 'cash_collected': float(leads['cash_collected'].sum())}
+        }
+
+    @staticmethod
+    def _distribution(deltas):
+        if deltas.empty: return None
+        days = deltas.dt.total_seconds().to_numpy() / 86400.0
+        p25, p50, p75, p90 = np.percentile(days, [25, 50, 75, 90])
+        return {'mean': round(float(days.mean()), 2), 'p25': round(float(p25), 2), 'median': round(float(p50), 2),
+                'p75': round(float(p75), 2), 'p90': round(float(p90), 2)}
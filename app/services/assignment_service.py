@@ -0,0 +1,35 @@
+from app.models import User, Appointment, db
+from app.services.booking_service import BookingService
+from app.services.slot_cache import SlotCache
+from datetime import timedelta
+from sqlalchemy import func
+
+LOAD_WINDOW_DAYS = 7
+
+class AssignmentService:
+    """
+    Asignación de closer para bookings del funnel sin closer_id.
+    Candidatos: los closers libres en ese horario según el índice por slot de SlotCache.
+    Orden: menor carga en la ventana y, a igual carga, el que hace más tiempo no recibe una agenda (round-robin).
+    """
+
+    @staticmethod
+    def rank_closers(start_time_utc, event=None):
+        """Closers libres en start_time_utc ordenados por preferencia de asignación."""
+        closer_ids = [cid for (cid,) in db.session.query(User.id).filter_by(role='closer').order_by(User.id).all()]
+        duration, buffer = BookingService._event_timing(event)
+        free = SlotCache.free_closers(start_time_utc, closer_ids, duration_minutes=duration, buffer_minutes=buffer)
+        if len(free) < 2: return list(free)
+
+        window = timedelta(days=LOAD_WINDOW_DAYS)
+        load = {closer_id: (count, last_id) for closer_id, count, last_id in db.session.query(
+            Appointment.closer_id, func.count(Appointment.id), func.max(Appointment.id)
+        ).filter(
+            Appointment.closer_id.in_(free),
+            Appointment.status != 'canceled',
+            Appointment.start_time >= start_time_utc - window,
+            Appointment.start_time <= start_time_utc + window
+        ).group_by(Appointment.closer_id).all()}
+
+        # Fewest agendas first; ties go to the closer whose latest agenda is oldest
+        return sorted(free, key=lambda closer_id: (*load.get(closer_id, (0, 0)), closer_id))
@@ -0,0 +1,115 @@
+from app import db
+from app.models import Enrollment, Payment, Program
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+# Attributes whose change moves an enrollment's balance
+PAYMENT_ATTRS = ('enrollment_id', 'amount', 'status')
+ENROLLMENT_ATTRS = ('program_id',)
+
+class BalanceService:
+    """
+    Saldo denormalizado por inscripción: enrollments.total_paid (pagos completados) y
+    enrollments.balance_due (precio del programa - pagado, nunca negativo). Se recalcula en
+    el mismo flush que crea, edita o borra pagos, inscripciones o precios de programas, así
+    que ventas, pagos, importaciones y ediciones del admin quedan en la misma transacción.
+    """
+
+    @staticmethod
+    def _paid_expr():
+        return select(db.func.coalesce(db.func.sum(Payment.amount), 0.0)).where(
+            Payment.enrollment_id == Enrollment.id, Payment.status == 'completed'
+        ).scalar_subquery()
+
+    @staticmethod
+    def _price_expr():
+        return db.func.coalesce(select(Program.price).where(Program.id == Enrollment.program_id).scalar_subquery(), 0.0)
+
+    # --- Flush listener ---
+
+    @staticmethod
+    def _changed(obj, attrs):
+        state = inspect(obj)
+        return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        enrollment_ids, program_ids = set(), set()
+        for obj in session.new:
+            if type(obj) is Payment: enrollment_ids.add(obj.enrollment_id)
+            elif type(obj) is Enrollment: enrollment_ids.add(obj.id)
+        for obj in session.deleted:
+            if type(obj) is Payment: enrollment_ids.add(obj.enrollment_id)
+        for obj in session.dirty:
+            model = type(obj)
+            if obj in session.new or obj in session.deleted: continue
+            if model is Payment and BalanceService._changed(obj, PAYMENT_ATTRS):
+                # A payment moved to another enrollment changes both balances
+                enrollment_ids.update(inspect(obj).attrs.enrollment_id.history.deleted)
+                enrollment_ids.add(obj.enrollment_id)
+            elif model is Enrollment and BalanceService._changed(obj, ENROLLMENT_ATTRS):
+                enrollment_ids.add(obj.id)
+            elif model is Program and BalanceService._changed(obj, ('price',)):
+                program_ids.add(obj.id)
+        # Deleted enrollments take their payments with them
+        enrollment_ids -= {obj.id for obj in session.deleted if type(obj) is Enrollment}
+        enrollment_ids.discard(None)
+        if enrollment_ids or program_ids:
+            BalanceService.refresh(session.connection(), enrollment_ids, program_ids, session=session)
+
+    # --- Writes ---
+
+    @staticmethod
+    def refresh(connection, enrollment_ids=None, program_ids=None, session=None):
+        """
+        Recalcula total_paid y balance_due de las inscripciones indicadas (y de todas las de
+        program_ids); sin argumentos, de todas. Devuelve la cantidad de filas actualizadas.
+        """
+        ids = set(enrollment_ids or ())
+        if program_ids:
+            ids.update(connection.execute(select(Enrollment.id).where(Enrollment.program_id.in_(program_ids))).scalars())
+        full = enrollment_ids is None and program_ids is None
+        if not ids and not full: return 0
+
+        paid, price = BalanceService._paid_expr(), BalanceService._price_expr()
+        stmt = update(Enrollment.__table__).values(
+            total_paid=paid,
+            balance_due=db.case((price - paid > 0, price - paid), else_=0.0)
+        )
+        if not full: stmt = stmt.where(Enrollment.__table__.c.id.in_(list(ids)))
+        count = connection.execute(stmt).rowcount
+
+        if session is not None and not full:
+            # Loaded instances get the stored values without expiring anything else
+            loaded = {key[1][0]: obj for key, obj in session.identity_map.items() if key[0] is Enrollment and key[1][0] in ids}
+            if loaded:
+                rows = connection.execute(select(Enrollment.id, Enrollment.total_paid, Enrollment.balance_due).where(Enrollment.id.in_(list(loaded))))
+                for enrollment_id, total_paid, balance_due in rows:
+                    set_committed_value(loaded[enrollment_id], 'total_paid', total_paid)
+                    set_committed_value(loaded[enrollment_id], 'balance_due', balance_due)
+        return count
+
+    # --- Consistency ---
+
+    @staticmethod
+    def check(tolerance=0.01):
+        """Inscripciones cuyo saldo guardado no coincide con el recalculado desde los pagos."""
+        paid, price = BalanceService._paid_expr(), BalanceService._price_expr()
+        expected_balance = db.case((price - paid > 0, price - paid), else_=0.0)
+        rows = db.session.execute(select(
+            Enrollment.id, Enrollment.total_paid, paid, Enrollment.balance_due, expected_balance
+        ).where(db.or_(
+            db.func.abs(db.func.coalesce(Enrollment.total_paid, 0.0) - paid) > tolerance,
+            db.func.abs(db.func.coalesce(Enrollment.balance_due, 0.0) - expected_balance) > tolerance
+        )).order_by(Enrollment.id)).all()
+        return [{'enrollment_id': row[0], 'total_paid': row[1], 'expected_total_paid': row[2],
+                 'balance_due': row[3], 'expected_balance_due': row[4]} for row in rows]
+
+    @staticmethod
+    def repair(enrollment_ids=None):
+        count = BalanceService.refresh(db.session.connection(), enrollment_ids)
+        db.session.commit()
+        return count
+
+event.listen(Session, 'after_flush', BalanceService._after_flush)
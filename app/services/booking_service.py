@@ -1,85 +1,34 @@
-from app.models import Availability, Appointment, User, Client, SurveyAnswer, db
-from sqlalchemy import or_
-from datetime import datetime, timedelta, date, time
+from app.models import Appointment, User, Client, SurveyAnswer, SlotHold, db
+from app.services.slot_engine import SlotEngine, IntervalIndex, DEFAULT_DURATION_MINUTES
+from app.services.slot_cache import SlotCache
+from app.services.slot_hold_service import SlotHoldService, HOLD_TTL_MINUTES
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
 import pytz
+import secrets
 
 class BookingService:
     @staticmethod
     def get_available_slots_utc(start_date, end_date, preferred_closer_id=None):
-        from app.models import WeeklyAvailability
-        
-        # Get all appointments in range to avoid double booking
-        appointments = Appointment.query.filter(
-            Appointment.start_time >= datetime.combine(start_date, time.min),
-            Appointment.start_time <= datetime.combine(end_date, time.max) + timedelta(days=1),
-            Appointment.status != 'canceled'
-        ).all()
-        
-        booked_slots = set()
-        for appt in appointments:
-            booked_slots.add((appt.closer_id, appt.start_time))
-            
-        unique_slots = {}
-        
-        # Iterate through each day in the range
-        current_date = start_date
-        while current_date <= end_date:
-            # 1. Check for specific overrides in Availability table for this day
-            day_avs = Availability.query.filter_by(date=current_date)
-            if preferred_closer_id:
-                day_avs = day_avs.filter_by(closer_id=preferred_closer_id)
-            
-            day_avs = day_avs.all()
-            
-            if day_avs:
-                # Use specific offsets if they exist
-                for av in day_avs:
-                    BookingService._process_slot(av.closer, current_date, av.start_time, booked_slots, unique_slots, preferred_closer_id)
-            else:
-                # 2. Fallback to WeeklyAvailability
-                day_of_week = current_date.weekday() # 0 = Monday, etc.
-                weekly_query = WeeklyAvailability.query.filter_by(day_of_week=day_of_week, is_active=True)
-                if preferred_closer_id:
-                    weekly_query = weekly_query.filter_by(closer_id=preferred_closer_id)
-                
-                weekly_slots = weekly_query.all()
-                for ws in weekly_slots:
-                    BookingService._process_slot(ws.closer, current_date, ws.start_time, booked_slots, unique_slots, preferred_closer_id)
-            
-            current_date += timedelta(days=1)
-        
-        available_slots = list(unique_slots.values())
-        available_slots.sort(key=lambda x: x['ts'])
-        return available_slots
+        closer_ids = [preferred_closer_id] if preferred_closer_id else None
+        return SlotEngine(start_date, end_date, closer_ids=closer_ids).available_slots()
 
     @staticmethod
-    def _process_slot(closer, date_val, time_val, booked_slots, unique_slots, preferred_closer_id):
-        if not closer: return
-        
-        try: closer_tz = pytz.timezone(closer.timezone or 'America/La_Paz')
-        except: closer_tz = pytz.timezone('America/La_Paz')
-            
-        local_dt = closer_tz.localize(datetime.combine(date_val, time_val))
-        utc_dt = local_dt.astimezone(pytz.UTC).replace(tzinfo=None)
-        
-        # Avoid past slots (with 5 min buffer)
-        if utc_dt < datetime.utcnow() - timedelta(minutes=5): return
-        
-        if (closer.id, utc_dt) not in booked_slots:
-            ts_key = utc_dt
-            if ts_key not in unique_slots:
-                unique_slots[ts_key] = {
-                    'utc_iso': utc_dt.isoformat() + 'Z', 
-                    'closer_id': closer.id, 
-                    'ts': utc_dt.timestamp(),
-                    'date': date_val.isoformat(),
-                    'start': time_val.strftime('%H:%M')
-                }
-            elif preferred_closer_id and closer.id == preferred_closer_id:
-                 unique_slots[ts_key]['closer_id'] = closer.id
+    def get_team_slots(start_date, end_date, closer_ids=None, event=None):
+        # Merged availability of the whole team computed over shared data in one pass
+        if closer_ids is None:
+            closer_ids = [cid for (cid,) in db.session.query(User.id).filter_by(role='closer').order_by(User.id).all()]
+        if not closer_ids: return []
+        duration, buffer = BookingService._event_timing(event)
+        return SlotCache.get_team_slots(start_date, end_date, closer_ids, duration_minutes=duration, buffer_minutes=buffer)
+
+    @staticmethod
+    def _event_timing(event):
+        if not event: return DEFAULT_DURATION_MINUTES, 0
+        return event.duration_minutes or DEFAULT_DURATION_MINUTES, event.buffer_minutes or 0
 
     @staticmethod
-    def create_or_update_client(data, client_id=None):
+    def create_or_update_client(data, client_id=None, commit=True):
         email = data.get('email')
         name = data.get('name')
         
@@ -100,28 +49,97 @@ class BookingService:
             if 'phone' in data: client.phone = data['phone']
             if 'instagram' in data: client.instagram = data['instagram']
         
-        db.session.commit()
+        if commit: db.session.commit()
+        else: db.session.flush()
         return client
 
     @staticmethod
-    def create_appointment(client_id, closer_id, start_time_utc, origin='direct', status='scheduled'):
-        conflict = Appointment.query.filter_by(closer_id=closer_id, start_time=start_time_utc).filter(Appointment.status != 'canceled').first()
-        if conflict: return None
-            
-        appt = Appointment(
-            closer_id=closer_id,
-            client_id=client_id,
-            start_time=start_time_utc,
-            status=status,
-            origin=origin
-        )
-        db.session.add(appt)
+    def create_appointment(client_id, closer_id, start_time_utc, origin='direct', status='scheduled', event=None, commit=True):
+        appt = BookingService._reserve(client_id, closer_id, start_time_utc, origin=origin, status=status, event=event)
+        if appt and commit: db.session.commit()
+        return appt
+
+    @staticmethod
+    def book_slot(client_id, start_time_utc, closer_ids, origin='direct', event=None, hold=None):
+        """
+        Reserva el horario con el primer closer libre de la lista, dentro de la transacción del llamador.
+        Si otro booking gana la carrera por un closer se reintenta con el siguiente; devuelve None si ninguno queda libre.
+        Un hold vigente del mismo horario se intenta primero con su closer y se consume al reservar.
+        """
+        hold_token = None
+        if hold and hold.start_time == start_time_utc and hold.closer_id in closer_ids:
+            hold_token = hold.token
+            closer_ids = [hold.closer_id] + [cid for cid in closer_ids if cid != hold.closer_id]
+
+        for closer_id in closer_ids:
+            token = hold_token if hold_token and closer_id == hold.closer_id else None
+            appt = BookingService._reserve(client_id, closer_id, start_time_utc, origin=origin, event=event, hold_token=token)
+            if appt:
+                if hold_token: SlotHold.query.filter_by(token=hold_token).delete()
+                return appt
+        return None
+
+    @staticmethod
+    def hold_slot(start_time_utc, closer_ids, event=None):
+        """Bloquea el horario unos minutos para el primer closer libre de la lista. Devuelve el SlotHold o None."""
+        duration, buffer = BookingService._event_timing(event)
+        SlotHoldService.sweep(commit=False)
+        for closer_id in closer_ids:
+            try:
+                with db.session.begin_nested():
+                    if not BookingService._is_free(closer_id, start_time_utc, duration, buffer): continue
+                    hold = SlotHold(
+                        token=secrets.token_urlsafe(32),
+                        closer_id=closer_id,
+                        start_time=start_time_utc,
+                        duration_minutes=duration,
+                        expires_at=datetime.utcnow() + timedelta(minutes=HOLD_TTL_MINUTES)
+                    )
+                    db.session.add(hold)
+                    db.session.flush()
+            except IntegrityError:
+                # Another lead held the same start first
+                continue
+            db.session.commit()
+            return hold
         db.session.commit()
-        
+        return None
+
+    @staticmethod
+    def _is_free(closer_id, start_time_utc, duration, buffer, hold_token=None):
+        # Serializes writers of the same closer (row lock on Postgres, SQLite serializes writers itself)
+        db.session.query(User.id).filter(User.id == closer_id).with_for_update().first()
+        start, end = IntervalIndex.appointment_interval(start_time_utc, duration)
+        window_start, window_end = start - timedelta(minutes=buffer), end + timedelta(minutes=buffer)
+        if IntervalIndex.for_closer(closer_id, window_start, window_end).overlaps(window_start, window_end): return False
+        held = IntervalIndex.for_holds([closer_id], window_start, window_end, exclude_token=hold_token).get(closer_id)
+        return not (held and held.overlaps(window_start, window_end))
+
+    @staticmethod
+    def _reserve(client_id, closer_id, start_time_utc, origin='direct', status='scheduled', event=None, hold_token=None):
+        # Each attempt runs in a savepoint: losing a race only rolls back the attempt, not the caller's transaction
+        duration, buffer = BookingService._event_timing(event)
+        try:
+            with db.session.begin_nested():
+                if not BookingService._is_free(closer_id, start_time_utc, duration, buffer, hold_token): return None
+
+                appt = Appointment(
+                    closer_id=closer_id,
+                    client_id=client_id,
+                    start_time=start_time_utc,
+                    duration_minutes=duration,
+                    status=status,
+                    origin=origin
+                )
+                db.session.add(appt)
+                # Flushing here makes the unique index on active (closer, start) reject a concurrent double booking
+                db.session.flush()
+        except IntegrityError:
+            return None
         return appt
 
     @staticmethod
-    def save_survey_answers(client_id, answers_data, appointment_id=None):
+    def save_survey_answers(client_id, answers_data, appointment_id=None, commit=True):
         for item in answers_data:
             q_id = item['question_id']
             ans_text = item['answer']
@@ -132,7 +150,7 @@ class BookingService:
             else:
                 new_ans = SurveyAnswer(client_id=client_id, question_id=q_id, answer=ans_text, appointment_id=appointment_id)
                 db.session.add(new_ans)
-        db.session.commit()
+        if commit: db.session.commit()
 
     @staticmethod
     def trigger_agenda_webhook(appointment, event=None):
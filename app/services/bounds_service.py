@@ -0,0 +1,74 @@
+from app import db
+from app.models import ActivityBounds, CacheVersion, Payment, Client, Appointment
+from app.services.cache_service import LRUCache, CacheVersions, ResultCache
+from datetime import datetime
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+
+# entity -> (model, timestamp column)
+ENTITIES = {
+    'payments': (Payment, 'date'),
+    'clients': (Client, 'created_at'),
+    'appointments': (Appointment, 'start_time'),
+}
+
+class BoundsService:
+    """
+    Primer y último timestamp de pagos, leads y agendas (activity_bounds), para resolver el
+    rango del período 'all_time' sin recorrer las tablas. Las escrituras no tocan esta tabla:
+    cada fila guarda la versión del tag de su entidad (ResultCache) con la que se calculó, y una
+    fila cuyo tag cambió desde entonces se recalcula al leer, sin guardarla. rebuild() (CLI
+    `flask activity-bounds-rebuild`, periódico) vuelve a dejar las filas al día.
+    """
+    entries = LRUCache(max_entries=1)
+
+    @staticmethod
+    def get():
+        """{entidad: (min, max)}. Nunca escribe: lo desactualizado se calcula en memoria."""
+        keys = [ResultCache.tag_key(entity) for entity in ENTITIES]
+        versions = CacheVersions.get(keys)
+        stamp = tuple(versions[key] for key in keys)
+        bounds = BoundsService.entries.get('bounds', stamp)
+        if bounds is not None: return dict(bounds)
+
+        rows = db.session.execute(select(ActivityBounds.entity, ActivityBounds.min_at, ActivityBounds.max_at, ActivityBounds.tag_version)).all()
+        bounds = {entity: (min_at, max_at) for entity, min_at, max_at, tag_version in rows
+                  if entity in ENTITIES and tag_version == versions[ResultCache.tag_key(entity)]}
+        stale = [entity for entity in ENTITIES if entity not in bounds]
+        if stale:
+            values = db.session.execute(select(*BoundsService._columns(stale))).one()
+            bounds.update({entity: (values[2 * i], values[2 * i + 1]) for i, entity in enumerate(stale)})
+        BoundsService.entries.set('bounds', stamp, bounds)
+        return dict(bounds)
+
+    @staticmethod
+    def _columns(entities):
+        # MIN and MAX of each entity as scalar subqueries, so one statement reads them all
+        columns = []
+        for entity in entities:
+            model, attr = ENTITIES[entity]
+            column = getattr(model, attr)
+            columns += [select(db.func.min(column)).scalar_subquery(), select(db.func.max(column)).scalar_subquery()]
+        return columns
+
+    @staticmethod
+    def rebuild(entities=None, connection=None):
+        """Recalcula y guarda los extremos desde las tablas base (de todas las entidades o de las indicadas)."""
+        own_transaction = connection is None
+        connection = connection or db.session.connection()
+        table = ActivityBounds.__table__
+        entities = list(entities or ENTITIES)
+        now = datetime.utcnow()
+        # Tag versions read in the same statement (same snapshot) as the MIN/MAX they stamp
+        tags = [select(CacheVersion.version).where(CacheVersion.key == ResultCache.tag_key(entity)).scalar_subquery() for entity in entities]
+        values = connection.execute(select(*BoundsService._columns(entities), *tags)).one()
+        for i, entity in enumerate(entities):
+            row = {'min_at': values[2 * i], 'max_at': values[2 * i + 1], 'tag_version': values[2 * len(entities) + i] or 0, 'updated_at': now}
+            if connection.execute(update(table).where(table.c.entity == entity).values(row)).rowcount: continue
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(entity=entity, **row))
+            except IntegrityError:
+                connection.execute(update(table).where(table.c.entity == entity).values(row))
+        if own_transaction: db.session.commit()
+        return {entity: (values[2 * i], values[2 * i + 1]) for i, entity in enumerate(entities)}
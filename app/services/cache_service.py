@@ -0,0 +1,209 @@
+from app import db
+from app.models import (CacheVersion, Payment, PaymentMethod, Enrollment, Program, Appointment,
+                        Expense, RecurringExpense, Client, ClientComment, User, Availability, SurveyAnswer, Event)
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from flask import g, has_app_context
+from sqlalchemy import event, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import copy
+import functools
+import threading
+import time
+
+# Models whose writes invalidate the cached results tagged with these names
+TAGS_BY_MODEL = {
+    Payment: ('payments',),
+    PaymentMethod: ('payments',),
+    Enrollment: ('enrollments',),
+    Program: ('enrollments',),
+    Appointment: ('appointments',),
+    Availability: ('appointments',),
+    Expense: ('expenses',),
+    RecurringExpense: ('expenses',),
+    Client: ('clients',),
+    ClientComment: ('comments',),
+    SurveyAnswer: ('surveys',),
+    Event: ('events',),
+    User: ('users',),
+}
+ALL_TAGS = tuple(sorted({tag for tags in TAGS_BY_MODEL.values() for tag in tags}))
+
+class LRUCache:
+    """
+    Cache en memoria del proceso (un tier por worker de gunicorn).
+    Cada entrada guarda el sello de versiones con el que se calculó; una lectura solo
+    es hit si el sello coincide con las versiones compartidas actuales.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, stamp, value):
+        with self._lock:
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+class CacheVersions:
+    """
+    Tier compartido: contadores de versión por clave en la base de datos.
+    Todos los workers leen las mismas versiones, así que una escritura en cualquiera
+    de ellos invalida las copias en memoria de todos.
+    Las claves a incrementar se juntan durante la transacción y se incrementan una sola vez
+    justo antes del COMMIT, en una sola sentencia y en orden: los locks de esas filas (compartidas
+    por todos los escritores) duran lo que dura el commit y siempre se toman en el mismo orden.
+    """
+
+    @staticmethod
+    def get(keys):
+        keys = list(keys)
+        if not keys: return {}
+        rows = db.session.query(CacheVersion.key, CacheVersion.version).filter(CacheVersion.key.in_(keys)).all()
+        versions = dict.fromkeys(keys, 0)
+        versions.update(rows)
+        # Keys this transaction will bump: its reads see uncommitted data, so they get a stamp no entry can match
+        pending = db.session.info.get('cache_bumps')
+        if pending:
+            for key in pending.intersection(keys): versions[key] = object()
+        return versions
+
+    @staticmethod
+    def bump(*keys):
+        # Deferred to the caller's commit, so the bump commits (or rolls back) with the write
+        CacheVersions.defer(db.session, *keys)
+
+    @staticmethod
+    def defer(session, *keys):
+        # Same as bump, for a given session (usable from flush events)
+        session.info.setdefault('cache_bumps', set()).update(keys)
+
+    @staticmethod
+    def bump_connection(connection, *keys):
+        """Incrementa las claves en una sola sentencia (upsert), en orden de clave."""
+        keys = sorted(set(keys))
+        if not keys: return
+        now = datetime.utcnow()
+        table = CacheVersion.__table__
+        dialect = connection.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert_fn = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert_fn(table).values([{'key': key, 'version': 1, 'updated_at': now} for key in keys])
+            connection.execute(stmt.on_conflict_do_update(index_elements=['key'], set_={'version': table.c.version + 1, 'updated_at': now}))
+            return
+        for key in keys:
+            increment = update(table).where(table.c.key == key).values(version=table.c.version + 1, updated_at=now)
+            if connection.execute(increment).rowcount: continue
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(key=key, version=1, updated_at=now))
+            except IntegrityError:
+                connection.execute(increment)
+
+    @staticmethod
+    def _before_commit(session):
+        # Savepoint releases also fire before_commit; only the outermost commit bumps
+        if session.in_nested_transaction(): return
+        # The commit's own final flush runs after this hook: flush first so its keys are included
+        session.flush()
+        keys = session.info.pop('cache_bumps', None)
+        if keys: CacheVersions.bump_connection(session.connection(), *keys)
+
+    @staticmethod
+    def _after_transaction_end(session, transaction):
+        # A rolled back (or committed) outermost transaction leaves nothing pending
+        if transaction.parent is None: session.info.pop('cache_bumps', None)
+
+    @staticmethod
+    def prune(prefix, older_than_days=30):
+        # Drops stale keys (e.g. per-day keys of past days); a missing key reads as version 0
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        deleted = CacheVersion.query.filter(
+            CacheVersion.key.like(f'{prefix}%'),
+            CacheVersion.updated_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+class ResultCache:
+    """
+    Cache de resultados de servicios (dashboard, finanzas) invalidado por tags.
+    Cada tag es una clave de CacheVersions ('tag:payments', ...) que se incrementa al confirmar
+    la transacción que escribe filas de los modelos asociados (TAGS_BY_MODEL), así que cualquier
+    escritura ORM invalida las entradas afectadas en todos los workers.
+    Los resultados cacheados deben ser datos planos (sin instancias ORM): se devuelven copiados.
+    """
+    entries = LRUCache(max_entries=256)
+    # Bounds staleness from writes that bypass the ORM (bulk deletes, raw SQL)
+    MAX_AGE_SECONDS = 300
+
+    @staticmethod
+    def tag_key(tag):
+        return f'tag:{tag}'
+
+    @staticmethod
+    def cached(name, tags):
+        """Decorador: cachea por (name, argumentos) hasta que cambie alguno de los tags o el día."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return ResultCache.get_or_compute(name, (args, tuple(sorted(kwargs.items()))), tags, lambda: fn(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def get_or_compute(name, key, tags, compute):
+        """Valor cacheado de (name, key), o el de compute() si cambió alguno de los tags o el día."""
+        keys = [ResultCache.tag_key(tag) for tag in tags]
+        versions = CacheVersions.get(keys)
+        stamp = (tuple(versions[k] for k in keys), date.today(), int(time.time() // ResultCache.MAX_AGE_SECONDS))
+        cache_key = (name, key)
+        value = ResultCache.entries.get(cache_key, stamp)
+        status = 'HIT'
+        if value is None:
+            value = compute()
+            ResultCache.entries.set(cache_key, stamp, value)
+            status = 'MISS'
+        if has_app_context(): g.result_cache = status
+        return copy.deepcopy(value)
+
+    @staticmethod
+    def invalidate(*tags):
+        # For writes that bypass the flush (bulk query deletes); bumped with the caller's commit
+        CacheVersions.bump(*(ResultCache.tag_key(tag) for tag in (tags or ALL_TAGS)))
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        tags = set()
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            tags.update(TAGS_BY_MODEL.get(type(obj), ()))
+        if tags:
+            CacheVersions.defer(session, *(ResultCache.tag_key(tag) for tag in tags))
+
+event.listen(Session, 'after_flush', ResultCache._after_flush)
+event.listen(Session, 'before_commit', CacheVersions._before_commit)
+event.listen(Session, 'after_transaction_end', CacheVersions._after_transaction_end)
@@ -1,45 +1,28 @@
 from app.models import User, Client, Enrollment, Appointment, Payment, PaymentMethod, CloserDailyStats, DailyReportQuestion, DailyReportAnswer, Event, db, Integration
 from app.services.dashboard_service import DashboardService
+from app.services.financial_service import FinancialService
+from app.services.lead_filter import LeadFilter
 from sqlalchemy import or_
 from datetime import datetime, time, timedelta, date
 import pytz
 
 class CloserService:
     @staticmethod
-    def get_leads_pagination(closer_id, page=1, per_page=50, filters=None):
+    def lead_filter(closer_id, filters=None):
+        """Filtro de leads del closer ('program' es un id); el admin ve todos los leads."""
         filters = filters or {}
-        search = filters.get('search')
-        start_date_str = filters.get('start_date')
-        end_date_str = filters.get('end_date')
-        program_filter = filters.get('program')
-        sort_by = filters.get('sort_by', 'newest')
-
-        query = Client.query
-        
         from flask_login import current_user
-        if current_user.role != 'admin':
-            query = query.filter(
-                or_(
-                    Client.enrollments.any(Enrollment.closer_id == closer_id),
-                    Client.appointments.any(Appointment.closer_id == closer_id)
-                )
-            )
-        
-        if program_filter:
-            query = query.join(Enrollment).filter(Enrollment.program_id == program_filter)
-
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-            query = query.filter(Client.created_at >= start_date)
-        
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(Client.created_at < end_date)
-
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(or_(Client.full_name.ilike(search_term), Client.email.ilike(search_term)))
+        return LeadFilter(
+            search=filters.get('search'),
+            start_date=filters.get('start_date'),
+            end_date=filters.get('end_date'),
+            closer_id=closer_id if current_user.role != 'admin' else None,
+            program_id=filters.get('program')
+        )
 
+    @staticmethod
+    def get_leads_pagination(lead_filter, page=1, per_page=50, sort_by='newest'):
+        query = lead_filter.clients()
         if sort_by == 'oldest':
             query = query.order_by(Client.created_at.asc())
         elif sort_by == 'a-z':
@@ -52,54 +35,23 @@ class CloserService:
         return query.paginate(page=page, per_page=per_page, error_out=False)
 
     @staticmethod
-    def get_leads_kpis(closer_id, filters=None):
-        filters = filters or {}
-        search = filters.get('search')
-        start_date_str = filters.get('start_date')
-        end_date_str = filters.get('end_date')
-
-        def apply_lead_filters(q):
-            if start_date_str: q = q.filter(Client.created_at >= datetime.strptime(start_date_str, '%Y-%m-%d'))
-            if end_date_str: q = q.filter(Client.created_at < datetime.strptime(end_date_str, '%Y-%m-%d') + timedelta(days=1))
-            if search: q = q.filter(or_(Client.full_name.ilike(f"%{search}%"), Client.email.ilike(f"%{search}%")))
-            return q
-
-        from flask_login import current_user
-        kpi_query = Client.query
-        if current_user.role != 'admin':
-            kpi_query = kpi_query.filter(or_(
-                Client.enrollments.any(Enrollment.closer_id == closer_id), 
-                Client.appointments.any(Appointment.closer_id == closer_id)
-            ))
-        kpi_query = apply_lead_filters(kpi_query)
-        total_clients = kpi_query.count()
-
-        fin_query = db.session.query(db.func.sum(Payment.amount)).select_from(Client).join(Enrollment).join(Payment).filter(
-            Payment.status == 'completed',
-            Enrollment.closer_id == closer_id
-        )
-        fin_query = apply_lead_filters(fin_query)
-        total_revenue_gross = fin_query.scalar() or 0.0
-
-        comm_query = db.session.query(
-            db.func.sum((Payment.amount * (PaymentMethod.commission_percent / 100.0)) + PaymentMethod.commission_fixed)
-        ).select_from(Client).join(Enrollment).join(Payment).join(PaymentMethod).filter(
-            Payment.status == 'completed', Enrollment.closer_id == closer_id
-        )
-        comm_query = apply_lead_filters(comm_query)
-        platform_fees = comm_query.scalar() or 0.0
-        cash_collect_net = total_revenue_gross - platform_fees
-
-        enr_query = Enrollment.query.filter(Enrollment.closer_id == closer_id)
-        enr_query = enr_query.join(Client)
-        enr_query = apply_lead_filters(enr_query)
-        enrs = enr_query.all()
-        total_debt = sum(max(0, (e.program.price if e.program else 0.0) - e.total_paid) for e in enrs)
+    def get_leads_kpis(closer_id, lead_filter):
+        # One statement: every KPI is a scalar subquery over the same lead set
+        ids = lead_filter.cte()
+        payments = lead_filter.enrollments().join(Payment, Payment.enrollment_id == Enrollment.id).outerjoin(
+            PaymentMethod, PaymentMethod.id == Payment.payment_method_id
+        ).filter(Payment.status == 'completed', Enrollment.closer_id == closer_id)
+        total_clients, cash_collect_net, my_commission, total_debt = db.session.query(
+            db.session.query(db.func.count()).select_from(ids).scalar_subquery(),
+            payments.with_entities(db.func.coalesce(db.func.sum(Payment.net), 0.0)).scalar_subquery(),
+            payments.with_entities(db.func.coalesce(db.func.sum(Payment.closer_commission), 0.0)).scalar_subquery(),
+            lead_filter.enrollments(db.func.coalesce(db.func.sum(Enrollment.balance_due), 0.0)).filter(Enrollment.closer_id == closer_id).scalar_subquery()
+        ).one()
 
         return {
             'total': total_clients,
             'cash_collected': cash_collect_net,
-            'my_commission': cash_collect_net * 0.10,
+            'my_commission': my_commission,
             'debt': total_debt
         }
 
@@ -117,36 +69,21 @@ class CloserService:
         print(f"[DEBUG] Today Local: {today_local}")
         print(f"[DEBUG] UTC Range: {start_utc} to {end_utc}")
         
-        detailed_metrics = DashboardService.get_detailed_closer_metrics(start_utc, end_utc, closer_id)
+        # Rollups are keyed by the closer's local day (timezone_name is the closer's timezone)
+        detailed_metrics = DashboardService.get_detailed_closer_metrics(today_local, today_local, closer_id)
         
         agendas = detailed_metrics['agendas']
         first, second = agendas['first_agendas'], agendas['second_agendas']
         
-        new_enrollments = Enrollment.query.filter(
-            Enrollment.closer_id == closer_id,
-            Enrollment.enrollment_date >= start_utc,
-            Enrollment.enrollment_date <= end_utc
-        ).all()
-        
-        kpi_sales_count = len(new_enrollments)
-        kpi_sales_amount = sum(e.program.price if e.program else 0.0 for e in new_enrollments)
-        
-        payments_today = Payment.query.join(Enrollment).filter(
-            Enrollment.closer_id == closer_id,
-            Payment.date >= start_utc, Payment.date <= end_utc, Payment.status == 'completed'
-        ).all()
-        kpi_cash_collected = sum(p.amount for p in payments_today)
+        today_stats = CloserDailyStats.query.filter_by(closer_id=closer_id, date=today_local).first()
+        kpi_sales_count = (today_stats.sales_count or 0) if today_stats else 0
+        kpi_sales_amount = (today_stats.sales_amount or 0.0) if today_stats else 0.0
+        kpi_cash_collected = (today_stats.cash_collected or 0.0) if today_stats else 0.0
         
         month_start_utc = user_tz.localize(datetime(today_local.year, today_local.month, 1)).astimezone(pytz.UTC).replace(tzinfo=None)
         
         def calculate_commission(s_dt, e_dt):
-            gross = db.session.query(db.func.sum(Payment.amount)).select_from(Enrollment).join(Payment).filter(
-                Enrollment.closer_id == closer_id, Payment.status == 'completed', Payment.date >= s_dt, Payment.date <= e_dt
-            ).scalar() or 0.0
-            fees = db.session.query(db.func.sum((Payment.amount * (PaymentMethod.commission_percent / 100.0)) + PaymentMethod.commission_fixed)).select_from(Enrollment).join(Payment).join(PaymentMethod).filter(
-                 Enrollment.closer_id == closer_id, Payment.status == 'completed', Payment.date >= s_dt, Payment.date <= e_dt
-            ).scalar() or 0.0
-            return (gross - fees) * 0.10
+            return FinancialService.payment_totals(s_dt, e_dt, closer_id=closer_id)['closer_commission']
 
         upcoming = Appointment.query.filter(
             Appointment.closer_id == closer_id,
@@ -161,8 +98,6 @@ class CloserService:
             ))
         recent_clients = recent_query.order_by(Client.created_at.desc()).limit(10).all()
 
-        today_stats = CloserDailyStats.query.filter_by(closer_id=closer_id, date=today_local).first()
-
         return {
             'kpis': {
                 'scheduled': agendas['total_agendas'],
@@ -417,7 +352,8 @@ class CloserService:
                         new_appt.google_event_id = evt_id
                 except Exception as e:
                     print(f"Error syncing second agenda event: {e}")
-        
+
+
         db.session.commit()
         return appt
 
@@ -439,12 +375,11 @@ class CloserService:
         payment_types = [p.payment_type for p in payments]
         
         program_price = enrollment.program.price if enrollment.program else 0.0
-        total_paid = sum(p.amount for p in payments)
-        has_debt = total_paid < program_price
+        has_debt = enrollment.balance_due > 0
         
         payload = {
             "has_debt": has_debt,
-            "total_paid": total_paid,
+            "total_paid": enrollment.total_paid,
             "program_id": enrollment.program_id,
             "program_price": program_price
         }
@@ -468,79 +403,6 @@ class CloserService:
         payload["allowed_types"] = ["installment", "renewal"]
         return payload
  
-    @staticmethod
-    def get_enrollment_details(enrollment_id):
-        from app.models import SurveyQuestion
-        import json
-        
-        enrollment = Enrollment.query.get_or_404(enrollment_id)
-        client = enrollment.client
-        
-        # 1. Payments
-        payments = []
-        for p in enrollment.payments:
-            payments.append({
-                "id": p.id,
-                "amount": p.amount,
-                "date": p.date.isoformat(),
-                "type": p.payment_type,
-                "method": p.method.name if p.method else "N/A",
-                "status": p.status,
-                "method_id": p.payment_method_id
-            })
-            
-        # 2. Appointments
-        appointments = []
-        for a in client.appointments.order_by(Appointment.start_time.desc()):
-            appointments.append({
-                "id": a.id,
-                "start_time": a.start_time.isoformat(),
-                "status": a.status,
-                "type": a.appointment_type,
-                "origin": a.origin
-            })
-            
-        # 3. Survey Answers + Scores
-        survey_data = []
-        for sa in client.survey_answers:
-            points = 0
-            q = sa.question
-            if q and q.options:
-                try:
-                    opts = json.loads(q.options)
-                    if isinstance(opts, list):
-                        for opt in opts:
-                            if str(opt.get('text')) == str(sa.answer):
-                                points = int(opt.get('points', 0))
-                                break
-                except: pass
-                
-            survey_data.append({
-                "question": q.text if q else "Pregunta eliminada",
-                "answer": sa.answer,
-                "points": points
-            })
-            
-        return {
-            "id": enrollment.id,
-            "client": {
-                "id": client.id,
-                "name": client.full_name,
-                "email": client.email,
-                "phone": client.phone,
-                "instagram": client.instagram
-            },
-            "program": {
-                "id": enrollment.program_id,
-                "name": enrollment.program.name if enrollment.program else "N/A",
-                "price": enrollment.program.price if enrollment.program else 0.0
-            },
-            "payments": payments,
-            "appointments": appointments,
-            "survey": survey_data,
-            "total_paid": enrollment.total_paid
-        }
- 
     @staticmethod
     def add_payment(enrollment_id, data):
         enrollment = Enrollment.query.get_or_404(enrollment_id)
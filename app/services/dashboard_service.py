@@ -1,50 +1,80 @@
 from app import db
-from app.models import CloserDailyStats, Payment, User, Expense, Enrollment, Program, PaymentMethod, Client, Appointment, Availability
+from app.models import CloserDailyStats, CloserDailyAgendaStats, Payment, User, Enrollment, Program, Client
 from app.services.base import BaseService
-from datetime import datetime, date, time, timedelta
-from sqlalchemy import or_
+from app.services.cache_service import ResultCache
+from app.services.financial_service import FinancialService
+from app.services.timeseries_service import TimeSeriesService
+from app.services.activity_service import ActivityService
+from app.services.bounds_service import BoundsService
+from datetime import datetime, date, timedelta
 
 class DashboardService(BaseService):
     @staticmethod
     def get_detailed_closer_metrics(start_date, end_date, closer_id=None):
-        if isinstance(start_date, date): start_date = datetime.combine(start_date, time.min)
-        if isinstance(end_date, date): end_date = datetime.combine(end_date, time.max)
-        
-        appt_filters = [Appointment.start_time >= start_date, Appointment.start_time <= end_date]
-        avail_filters = [Availability.date >= start_date.date(), Availability.date <= end_date.date()]
-        sale_filters = [Enrollment.enrollment_date >= start_date, Enrollment.enrollment_date <= end_date]
-        
-        if closer_id:
-            appt_filters.append(Appointment.closer_id == closer_id)
-            avail_filters.append(Availability.closer_id == closer_id)
-            sale_filters.append(Enrollment.closer_id == closer_id)
-            
-        slots_defined_count = Availability.query.filter(*avail_filters).count()
-        total_appts = Appointment.query.filter(*appt_filters).all()
-        
-        slots_used = len(total_appts)
+        """Métricas de agendas y ventas entre dos días locales (inclusive), leídas de los rollups diarios."""
+        metrics = DashboardService._grouped_closer_metrics(start_date, end_date, [closer_id] if closer_id else None, by_closer=False)
+        return metrics.get(None) or DashboardService._closer_metrics(None, None)
+
+    @staticmethod
+    def get_closers_metrics(start_date, end_date, closer_ids=None):
+        """{closer_id: métricas} de todos los closers (o de los indicados) con dos queries agrupadas por closer."""
+        return DashboardService._grouped_closer_metrics(start_date, end_date, closer_ids, by_closer=True)
+
+    @staticmethod
+    def _grouped_closer_metrics(start_date, end_date, closer_ids=None, by_closer=True):
+        if isinstance(start_date, datetime): start_date = start_date.date()
+        if isinstance(end_date, datetime): end_date = end_date.date()
+
+        daily_filters = [CloserDailyStats.date >= start_date, CloserDailyStats.date <= end_date]
+        agenda_filters = [CloserDailyAgendaStats.date >= start_date, CloserDailyAgendaStats.date <= end_date]
+        if closer_ids is not None:
+            daily_filters.append(CloserDailyStats.closer_id.in_(closer_ids))
+            agenda_filters.append(CloserDailyAgendaStats.closer_id.in_(closer_ids))
+        # Grouped by closer, or a single bucket (key None) for the whole team
+        daily_key = [CloserDailyStats.closer_id] if by_closer else []
+        agenda_key = [CloserDailyAgendaStats.closer_id] if by_closer else []
+
+        daily_q = db.session.query(
+            *daily_key,
+            db.func.coalesce(db.func.sum(CloserDailyStats.slots_defined), 0),
+            db.func.coalesce(db.func.sum(CloserDailyStats.calls_scheduled), 0),
+            db.func.coalesce(db.func.sum(CloserDailyStats.sales_count), 0),
+            db.func.coalesce(db.func.sum(CloserDailyStats.sales_amount), 0.0),
+            db.func.coalesce(db.func.sum(CloserDailyStats.cash_collected), 0.0)
+        ).filter(*daily_filters)
+        agenda_q = db.session.query(
+            *agenda_key, CloserDailyAgendaStats.appointment_type, CloserDailyAgendaStats.status, db.func.sum(CloserDailyAgendaStats.count)
+        ).filter(*agenda_filters).group_by(CloserDailyAgendaStats.appointment_type, CloserDailyAgendaStats.status)
+        if by_closer:
+            daily_q = daily_q.group_by(CloserDailyStats.closer_id)
+            agenda_q = agenda_q.group_by(CloserDailyAgendaStats.closer_id)
+
+        def split(row): return (row[0], row[1:]) if by_closer else (None, tuple(row))
+        daily = dict(split(row) for row in daily_q.all())
+        agendas = {}
+        for row in agenda_q.all():
+            key, (a_type, status, count) = split(row)
+            agendas.setdefault(key, []).append((a_type, status, int(count or 0)))
+        return {key: DashboardService._closer_metrics(daily.get(key), agendas.get(key)) for key in set(daily) | set(agendas)}
+
+    @staticmethod
+    def _closer_metrics(daily, agenda_rows):
+        slots_defined_count, slots_used, sales_count, sales_amount, cash_collected = daily or (0, 0, 0, 0.0, 0.0)
         slots_available = max(0, slots_defined_count - slots_used)
-        
+
         stats = {
             'total_agendas': 0,
             'presentations': 0,
             'first_agendas': {'total': 0, 'completed': 0, 'no_show': 0, 'canceled': 0, 'rescheduled': 0, 'scheduled': 0, 'confirmed': 0},
             'second_agendas': {'total': 0, 'completed': 0, 'no_show': 0, 'canceled': 0, 'rescheduled': 0, 'scheduled': 0, 'confirmed': 0}
         }
-        
-        def update_bucket(bucket, status):
-            bucket['total'] += 1
-            if status in bucket: bucket[status] += 1
-        
-        for appt in total_appts:
-            stats['total_agendas'] += 1
-            if appt.status == 'completed': stats['presentations'] += 1
-            a_type = appt.appointment_type or 'Primera agenda'
-            if a_type == 'Segunda agenda': update_bucket(stats['second_agendas'], appt.status)
-            else: update_bucket(stats['first_agendas'], appt.status)
-
-        sales_count = Enrollment.query.filter(*sale_filters).count()
-        
+        for a_type, status, count in agenda_rows or []:
+            stats['total_agendas'] += count
+            if status == 'completed': stats['presentations'] += count
+            bucket = stats['second_agendas'] if a_type == 'Segunda agenda' else stats['first_agendas']
+            bucket['total'] += count
+            if status in bucket: bucket[status] += count
+
         def safe_div(n, d): return (n / d * 100) if d > 0 else 0
         total_completed = stats['first_agendas']['completed'] + stats['second_agendas']['completed']
         total_scheduled = stats['first_agendas']['total'] + stats['second_agendas']['total']
@@ -59,12 +89,51 @@ class DashboardService(BaseService):
             'slots': {'total': slots_defined_count, 'available': slots_available, 'used': slots_used},
             'agendas': stats,
             'sales': sales_count,
+            'revenue': {'sales_amount': sales_amount, 'cash_collected': cash_collected},
             'kpis': kpis
         }
 
     @staticmethod
-    def get_main_dashboard_data(period='this_month', start_date_arg=None, end_date_arg=None):
-        today = date.today()
+    def get_closer_leaderboard(start_date, end_date):
+        """Ranking de closers activos del período (ventas, monto vendido, tasa de cierre)."""
+        closers = User.query.filter(User.role == 'closer', User.is_active == True).order_by(User.id).all()
+        metrics = DashboardService.get_closers_metrics(start_date, end_date, [c.id for c in closers])
+        empty = DashboardService._closer_metrics(None, None)
+        rows = []
+        for closer in closers:
+            m = metrics.get(closer.id, empty)
+            rows.append({
+                'closer_id': closer.id,
+                'username': closer.username,
+                'sales': m['sales'],
+                'sales_amount': m['revenue']['sales_amount'],
+                'cash_collected': m['revenue']['cash_collected'],
+                'agendas': m['agendas']['total_agendas'],
+                'presentations': m['agendas']['presentations'],
+                'slots_used': m['slots']['used'],
+                'slots_available': m['slots']['available'],
+                'show_up_rate': m['kpis']['show_up_rate'],
+                'closing_rate': m['kpis']['closing_rate_global'],
+                'closing_rate_presentation': m['kpis']['closing_rate_presentation'],
+            })
+        rows.sort(key=lambda r: (-r['sales'], -r['sales_amount'], -r['closing_rate'], r['closer_id']))
+        for rank, row in enumerate(rows, start=1): row['rank'] = rank
+        return rows
+
+    @staticmethod
+    def _client_debt_subquery(start_dt, end_dt):
+        # Per client: sum of the stored enrollment balances
+        return db.session.query(
+            Enrollment.client_id.label('client_id'), db.func.sum(Enrollment.balance_due).label('debt')
+        ).join(Client, Client.id == Enrollment.client_id).filter(
+            Client.created_at >= start_dt, Client.created_at <= end_dt
+        ).group_by(Enrollment.client_id).subquery()
+
+    @staticmethod
+    @ResultCache.cached('dashboard:main', tags=('payments', 'expenses', 'clients', 'enrollments', 'appointments', 'comments'))
+    def get_main_dashboard_data(period='this_month', start_date_arg=None, end_date_arg=None, timezone_name=None, granularity=None):
+        # Periods and chart buckets follow the viewer's timezone (UTC days when none is given)
+        today = datetime.now(TimeSeriesService.get_timezone(timezone_name)).date() if timezone_name else date.today()
         if period == 'custom' and start_date_arg and end_date_arg:
             try:
                 start_date = datetime.strptime(start_date_arg, '%Y-%m-%d').date()
@@ -79,32 +148,10 @@ class DashboardService(BaseService):
             start_date = last_month_end.replace(day=1)
             end_date = last_month_end
         elif period == 'all_time':
-            # Dynamic range: First record to Last record
-            # We check Payments and Clients for activity range
-            min_p = db.session.query(db.func.min(Payment.date)).scalar()
-            min_c = db.session.query(db.func.min(Client.created_at)).scalar()
-            max_p = db.session.query(db.func.max(Payment.date)).scalar()
-            max_c = db.session.query(db.func.max(Client.created_at)).scalar()
-            
-            # Normalize to date objects
-            mins = []
-            if min_p: mins.append(min_p.date() if isinstance(min_p, datetime) else min_p)
-            if min_c: mins.append(min_c.date() if isinstance(min_c, datetime) else min_c.date())
-            
-            maxs = []
-            if max_p: maxs.append(max_p.date() if isinstance(max_p, datetime) else max_p)
-            if max_c: maxs.append(max_c.date() if isinstance(max_c, datetime) else max_c.date())
-            # Also consider today for end date if data is old, so we don't look stuck in past?
-            # User said "terminar en el ultimo", sticking to data range.
-            # But usually dashboard is current. Let's ensure at least Today is included if user wants "Everything"
-            # actually user said "terminar en el ultimo" specifically.
-            # But if I have NO data future, cutting off at today is fine. 
-            # If I have future data (appointments), I should show it? 
-            # Let's add Appointment to the query to be safe for "Last record"
-            
-            max_a = db.session.query(db.func.max(Appointment.start_time)).scalar()
-            if max_a: maxs.append(max_a.date())
-
+            # Dynamic range: first to last record (payments and leads; appointments may extend the end)
+            bounds = BoundsService.get()
+            mins = [b[0].date() for entity, b in bounds.items() if entity != 'appointments' and b[0]]
+            maxs = [b[1].date() for b in bounds.values() if b[1]]
             start_date = min(mins) if mins else today.replace(day=1)
             end_date = max(maxs) if maxs else today
             
@@ -115,65 +162,48 @@ class DashboardService(BaseService):
             start_date = today.replace(day=1)
             end_date = today
 
-        start_dt = datetime.combine(start_date, time.min)
-        end_dt = datetime.combine(end_date, time.max)
+        start_dt, end_dt = TimeSeriesService.utc_bounds(start_date, end_date, timezone_name)
         
-        payments = Payment.query.filter(Payment.date >= start_dt, Payment.date <= end_dt, Payment.status == 'completed').all()
-        income = sum(p.amount for p in payments)
-        total_comm = sum((p.amount * (p.method.commission_percent / 100) + p.method.commission_fixed) for p in payments if p.method)
-        
-        total_expenses = db.session.query(db.func.sum(Expense.amount)).filter(Expense.date >= start_dt, Expense.date <= end_dt).scalar() or 0
+        totals = FinancialService.payment_totals(start_dt, end_dt)
+        income, total_comm, total_expenses = totals['gross'], totals['fees'], totals['expenses']
         net_profit = (income - total_comm) - total_expenses
         
-        # Debt calculation
-        period_clients = Client.query.filter(Client.created_at >= start_dt, Client.created_at <= end_dt).all()
-        period_debt = 0.0
-        top_debtors_list = []
-        
-        for c in period_clients:
-            c_debt = 0.0
-            for enr in c.enrollments:
-                debt = (enr.program.price if enr.program else 0.0) - enr.total_paid
-                if debt > 0: c_debt += debt
-            if c_debt > 0:
-                period_debt += c_debt
-                top_debtors_list.append({'student': c, 'debt': c_debt})
-        
-        top_debtors = sorted(top_debtors_list, key=lambda x: x['debt'], reverse=True)[:5]
+        # Debt calculation (cohort of clients created in the period), aggregated in SQL
+        client_debt = DashboardService._client_debt_subquery(start_dt, end_dt)
+        active_leads, period_debt = db.session.query(
+            db.func.count(Client.id), db.func.coalesce(db.func.sum(client_debt.c.debt), 0.0)
+        ).outerjoin(client_debt, client_debt.c.client_id == Client.id).filter(
+            Client.created_at >= start_dt, Client.created_at <= end_dt
+        ).one()
+        period_debt = float(period_debt)
+
+        top_debtors = [{'student': {'id': c.id, 'full_name': c.full_name, 'email': c.email}, 'debt': float(debt)} for c, debt in db.session.query(Client, client_debt.c.debt).join(
+            client_debt, client_debt.c.client_id == Client.id
+        ).filter(client_debt.c.debt > 0).order_by(client_debt.c.debt.desc(), Client.id).limit(5).all()]
 
         # Charts Data Preparation
         
-        # 1. Revenue & Agendas over time
-        # Get daily revenue
-        daily_rev_q = db.session.query(db.func.date(Payment.date), db.func.sum(Payment.amount)).filter(
+        # 1. Revenue & Agendas over time, bucketed in SQL (coarser buckets for long ranges)
+        granularity = TimeSeriesService.granularity_for(start_date, end_date, granularity)
+        rev_bucket = TimeSeriesService.bucket_expr(Payment.date, granularity, timezone_name or 'UTC', start_dt, end_dt)
+        rev_q = db.session.query(rev_bucket, db.func.sum(Payment.amount)).filter(
             Payment.date >= start_dt, Payment.date <= end_dt, Payment.status == 'completed'
-        ).group_by(db.func.date(Payment.date)).all()
-        rev_dict = {str(r[0]): float(r[1]) for r in daily_rev_q}
-
-        # Get daily agendas count
-        daily_agendas_q = db.session.query(db.func.date(Appointment.start_time), db.func.count(Appointment.id)).filter(
-            Appointment.start_time >= start_dt, Appointment.start_time <= end_dt
-        ).group_by(db.func.date(Appointment.start_time)).all()
-        agendas_dict = {str(r[0]): int(r[1]) for r in daily_agendas_q}
-
-        chart_dates = []
-        chart_revs = []
-        chart_agendas = []
-        
-        curr = start_date
-        while curr <= end_date:
-            d_str = str(curr)
-            chart_dates.append(d_str)
-            chart_revs.append(rev_dict.get(d_str, 0.0))
-            chart_agendas.append(agendas_dict.get(d_str, 0))
-            curr += timedelta(days=1)
+        ).group_by(rev_bucket).all()
+        chart_dates, chart_revs = TimeSeriesService.fill(rev_q, start_date, end_date, granularity)
+
+        # Agendas come from the rollup, already bucketed by closer-local day
+        agenda_bucket = TimeSeriesService.bucket_expr(CloserDailyAgendaStats.date, granularity)
+        agendas_q = db.session.query(agenda_bucket, db.func.sum(CloserDailyAgendaStats.count)).filter(
+            CloserDailyAgendaStats.date >= start_date, CloserDailyAgendaStats.date <= end_date
+        ).group_by(agenda_bucket).all()
+        chart_agendas = [int(v) for v in TimeSeriesService.fill(agendas_q, start_date, end_date, granularity)[1]]
 
         # 2. Agenda Status Breakdown
-        status_q = db.session.query(Appointment.status, db.func.count(Appointment.id)).filter(
-            Appointment.start_time >= start_dt, Appointment.start_time <= end_dt
-        ).group_by(Appointment.status).all()
-        status_labels = [r[0] for r in status_q]
-        status_values = [r[1] for r in status_q]
+        status_q = db.session.query(CloserDailyAgendaStats.status, db.func.sum(CloserDailyAgendaStats.count)).filter(
+            CloserDailyAgendaStats.date >= start_date, CloserDailyAgendaStats.date <= end_date
+        ).group_by(CloserDailyAgendaStats.status).having(db.func.sum(CloserDailyAgendaStats.count) > 0).all()
+        status_labels = [r[0] or None for r in status_q]
+        status_values = [int(r[1]) for r in status_q]
 
         # 3. Programs Breakdown
         prog_q = db.session.query(Program.name, db.func.count(Enrollment.id)).join(Program).filter(
@@ -189,23 +219,16 @@ class DashboardService(BaseService):
         # Ideally we might want Total Contract Value vs Collected, but requested "Deudas y pagos"
         # Let's send { "Cobrado": income, "Por Cobrar": period_debt } 
         
-        activity = []
-        rec_clients = Client.query.order_by(Client.created_at.desc()).limit(5).all()
-        for c in rec_clients:
-            activity.append({'type': 'lead', 'time': c.created_at, 'message': 'Nuevo Lead', 'sub': c.full_name or c.email})
-        
-        rec_payments = Payment.query.join(Enrollment).join(Client).filter(Payment.status == 'completed').order_by(Payment.date.desc()).limit(5).all()
-        for p in rec_payments:
-            activity.append({'type': 'payment', 'time': p.date, 'message': f'Pago: ${p.amount:,.0f}', 'sub': p.enrollment.client.full_name or p.enrollment.client.email})
-
-        activity.sort(key=lambda x: x['time'], reverse=True)
+        # Latest events of every source, one indexed range scan on the activity log
+        activity = ActivityService.feed(limit=10)['items']
 
         return {
-            'recent_activity': activity[:10],
+            'recent_activity': activity,
             'dates': {'start': start_date, 'end': end_date},
             'financials': {'income': income, 'cash_collected': income - total_comm, 'net_profit': net_profit, 'total_expenses': total_expenses},
-            'cohort': {'active_leads': len(period_clients), 'p_debt': period_debt, 'top_debtors': top_debtors},
+            'cohort': {'active_leads': active_leads, 'p_debt': period_debt, 'top_debtors': top_debtors},
             'charts': {
+                'granularity': granularity,
                 'dates_labels': chart_dates, 
                 'revenue_values': chart_revs, 
                 'agendas_values': chart_agendas,
@@ -1,6 +1,7 @@
 from app import db
 from app.models import Expense, RecurringExpense, Payment, PaymentMethod, Enrollment, User
 from app.services.base import BaseService
+from app.services.cache_service import ResultCache
 from datetime import datetime, time, timedelta, date
 
 class FinancialService(BaseService):
@@ -22,7 +23,38 @@ class FinancialService(BaseService):
             return FinancialService.error(f"Error al registrar gasto: {str(e)}")
 
     @staticmethod
+    def payment_totals(start_dt=None, end_dt=None, closer_id=None):
+        """
+        Totales de pagos completados en una sola query agregada:
+        {'count', 'gross', 'fees', 'net', 'closer_commission', 'expenses'} (gastos del mismo rango).
+        """
+        filters = [Payment.status == 'completed']
+        expense_filters = []
+        if start_dt:
+            filters.append(Payment.date >= start_dt)
+            expense_filters.append(Expense.date >= start_dt)
+        if end_dt:
+            filters.append(Payment.date <= end_dt)
+            expense_filters.append(Expense.date <= end_dt)
+        if closer_id: filters.append(Enrollment.closer_id == closer_id)
+
+        expenses = db.select(db.func.coalesce(db.func.sum(Expense.amount), 0.0)).where(*expense_filters).scalar_subquery()
+        count, gross, fees, commission, total_expenses = db.session.query(
+            db.func.count(Payment.id),
+            db.func.coalesce(db.func.sum(Payment.amount), 0.0),
+            db.func.coalesce(db.func.sum(Payment.fee), 0.0),
+            db.func.coalesce(db.func.sum(Payment.closer_commission), 0.0),
+            expenses
+        ).select_from(Payment).join(Enrollment, Enrollment.id == Payment.enrollment_id).outerjoin(
+            PaymentMethod, PaymentMethod.id == Payment.payment_method_id
+        ).filter(*filters).one()
+        return {'count': count, 'gross': gross, 'fees': fees, 'net': gross - fees,
+                'closer_commission': commission, 'expenses': total_expenses}
+
+    @staticmethod
+    @ResultCache.cached('finance:overview', tags=('payments', 'expenses', 'enrollments'))
     def get_finances_data(start_date, end_date):
+        """KPIs y gastos del período, ya serializados (el resultado se cachea por rango de fechas)."""
         # Definitions
         start_dt = datetime.combine(start_date, time.min)
         end_dt = datetime.combine(end_date, time.max)
@@ -33,59 +65,43 @@ class FinancialService(BaseService):
             Expense.date <= end_dt
         ).order_by(Expense.date.desc())
         expenses = expenses_query.all()
-        total_expenses = sum(e.amount for e in expenses)
-
-        # 2. Query Recurring Expenses (Configuration)
-        recurring_expenses = RecurringExpense.query.all()
-
-        # 3. Income & Cash Collected Logic
-        period_payments = Payment.query.options(db.joinedload(Payment.enrollment)).filter(
-            Payment.date >= start_dt,
-            Payment.date <= end_dt,
-            Payment.status == 'completed'
-        ).all()
-        
-        gross_revenue = 0
-        total_commission = 0
-        closer_commission_total = 0
-        
-        for p in period_payments:
-            gross_revenue += p.amount
-            if p.method:
-                comm = (p.amount * (p.method.commission_percent / 100)) + p.method.commission_fixed
-                total_commission += comm
-            
-            # Closer Commissions Calculation
-            if p.enrollment and p.enrollment.closer_id:
-                p_amount = p.amount
-                if p.method:
-                    p_fee = (p.amount * (p.method.commission_percent / 100)) + p.method.commission_fixed
-                    p_amount -= p_fee
-                closer_commission_total += (p_amount * 0.10)
 
+        # 2. Income, fees, closer commissions and expenses in one aggregate query
+        totals = FinancialService.payment_totals(start_dt, end_dt)
+        gross_revenue = totals['gross']
+        total_commission = totals['fees']
+        closer_commission_total = totals['closer_commission']
+        total_expenses = totals['expenses']
         cash_collected = gross_revenue - total_commission
         
         # Add Closer Commissions to Total Expenses for Net Profit Calc
         net_profit = cash_collected - (total_expenses + closer_commission_total)
         total_expenses_with_commissions = total_expenses + closer_commission_total
         
+        expenses = [{
+            "id": e.id,
+            "description": e.description,
+            "amount": float(e.amount),
+            "category": e.category,
+            "date": e.date,
+            "is_recurring": e.is_recurring
+        } for e in expenses]
+
         # Inject Virtual Expense for Closer Commissions
         if closer_commission_total > 0:
-            class VirtualExpense:
-                def __init__(self, date, description, category, amount, id=None):
-                    self.date = date
-                    self.description = description
-                    self.category = category
-                    self.amount = amount
-                    self.id = id
-            
-            v_exp = VirtualExpense(end_dt, 'Comisiones Closers (Calculado)', 'variable', closer_commission_total)
-            expenses.append(v_exp)
-            expenses.sort(key=lambda x: x.date, reverse=True)
+            expenses.append({
+                "id": None,
+                "description": 'Comisiones Closers (Calculado)',
+                "amount": float(closer_commission_total),
+                "category": 'variable',
+                "date": end_dt,
+                "is_recurring": False
+            })
+            expenses.sort(key=lambda x: x['date'], reverse=True)
+        for e in expenses: e['date'] = e['date'].isoformat()
 
         return {
             'expenses': expenses,
-            'recurring_expenses': recurring_expenses,
             'kpis': {
                 'gross_revenue': gross_revenue,
                 'total_commission': total_commission,
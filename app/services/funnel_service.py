@@ -0,0 +1,88 @@
+from app.models import Event, SurveyQuestion
+from app.services.cache_service import LRUCache, CacheVersions
+from app.services.booking_service import BookingService
+from sqlalchemy import or_
+from datetime import date, timedelta
+import hashlib
+import json
+
+STATIC_KEY = 'funnel:static'
+FUNNEL_DAYS = 14
+
+class FunnelService:
+    """
+    Payload público del funnel por utm_source, separado en dos partes con su propio ETag:
+    - static: evento + preguntas fusionadas (global, grupo, evento), precalculado y versionado en cache_versions.
+    - slots: disponibilidad del equipo, servida desde SlotCache.
+    """
+    static_entries = LRUCache(max_entries=256)
+
+    @staticmethod
+    def invalidate():
+        # Admin edits of events or questions; runs inside the caller's transaction
+        CacheVersions.bump(STATIC_KEY)
+
+    @staticmethod
+    def etag(payload):
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def get_static(utm_source):
+        """(payload, etag) del evento activo o None. Un hit cuesta una sola query (la versión)."""
+        version = CacheVersions.get([STATIC_KEY])[STATIC_KEY]
+        entry = FunnelService.static_entries.get(utm_source, version)
+        if entry is None:
+            entry = FunnelService._build_static(utm_source)
+            FunnelService.static_entries.set(utm_source, version, entry)
+        return entry
+
+    @staticmethod
+    def _build_static(utm_source):
+        event = Event.query.filter_by(utm_source=utm_source, is_active=True).first()
+        if not event: return None
+
+        # Merge Questions: Global + Group + Event, in one query
+        scopes = [SurveyQuestion.is_global.is_(True), SurveyQuestion.event_id == event.id]
+        if event.group_id: scopes.append(SurveyQuestion.group_id == event.group_id)
+        questions = SurveyQuestion.query.filter(SurveyQuestion.is_active.is_(True), or_(*scopes)).all()
+
+        def tier(q):
+            if q.is_global: return 0
+            return 2 if q.event_id == event.id else 1
+        questions.sort(key=lambda q: (q.order or 0, tier(q), q.id))
+
+        payload = {
+            "event": {
+                "id": event.id,
+                "name": event.name,
+                "duration": event.duration_minutes,
+                "utm_source": event.utm_source,
+                "min_score": event.min_score,
+                "redirect_success": event.redirect_url_success,
+                "redirect_fail": event.redirect_url_fail,
+            },
+            "questions": [{
+                "id": q.id,
+                "text": q.text,
+                "type": q.question_type,
+                "options": json.loads(q.options) if q.options and q.options.startswith('[') else q.options,
+                "step": q.step,
+                "mapping": q.mapping_field
+            } for q in questions]
+        }
+        return payload, FunnelService.etag(payload)
+
+    @staticmethod
+    def get_slots(utm_source):
+        """(payload, etag) con los slots del equipo para el evento activo, o None."""
+        event = Event.query.filter_by(utm_source=utm_source, is_active=True).first()
+        if not event: return None
+
+        start_date = date.today()
+        end_date = start_date + timedelta(days=FUNNEL_DAYS)
+        payload = {
+            # Aggregate slots from all closers (already tagged and sorted chronologically)
+            "availability": BookingService.get_team_slots(start_date, end_date, event=event),
+            "closer_name": "Equipo NeurOPS" # Generic if merging
+        }
+        return payload, FunnelService.etag(payload)
@@ -150,6 +150,9 @@ class ImportService:
 
         if not dry_run:
             try:
+                if target == 'agendas':
+                    from app.services.slot_cache import SlotCache
+                    SlotCache.invalidate_all()
                 db.session.commit()
             except Exception as e:
                 db.session.rollback()
@@ -352,11 +355,19 @@ class ImportService:
             db.session.flush()
 
         # 4. Create Appointment
+        status = data.get('status', 'scheduled')
+        if status != 'canceled' and Appointment.query.filter(
+            Appointment.closer_id == closer.id,
+            Appointment.start_time == start_time,
+            Appointment.status != 'canceled'
+        ).first():
+            raise Exception(f"'{closer.username}' ya tiene una agenda activa el {start_time}")
+
         appt = Appointment(
             client_id=client.id,
             closer_id=closer.id,
             start_time=start_time,
-            status=data.get('status', 'scheduled'),
+            status=status,
             appointment_type=data.get('type', 'Primera agenda'),
             origin=data.get('origin', 'import')
         )
@@ -0,0 +1,81 @@
+from app import db
+from app.models import Client, Enrollment, Appointment, Program
+from app.services.search_service import SearchService
+from datetime import datetime, timedelta
+from sqlalchemy import select, union
+
+class LeadFilter:
+    """
+    Filtros del listado de leads (búsqueda, fechas de alta, closer, programas, deuda) compilados
+    una vez a un conjunto de ids (CTE lead_ids). La página y cada KPI hacen join contra ese
+    conjunto en vez de volver a aplicar los filtros a mano sobre cada query.
+    """
+
+    def __init__(self, search=None, start_date=None, end_date=None, closer_id=None, programs=None, program_id=None, with_debt=False):
+        self.search = search
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        self.end_date = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+        self.closer_id = closer_id
+        self.programs = [p for p in programs if p] if programs else None
+        self.program_id = program_id
+        self.with_debt = with_debt
+        self._cte = None
+
+    @staticmethod
+    def from_filters(filters, closer_id=None):
+        """
+        Desde el dict de filtros de los endpoints ('program' son nombres separados por coma).
+        closer_id restringe a los leads del closer (agendas o ventas) aunque filters no lo traiga.
+        """
+        program = filters.get('program')
+        return LeadFilter(
+            search=filters.get('search'),
+            start_date=filters.get('start_date'),
+            end_date=filters.get('end_date'),
+            closer_id=closer_id or filters.get('closer_id'),
+            programs=program.split(',') if program else None,
+            program_id=filters.get('program_id'),
+            with_debt=bool(filters.get('with_debt'))
+        )
+
+    def conditions(self):
+        """Condiciones sobre Client; las relaciones se resuelven con semi-joins (IN) no correlacionados."""
+        conditions = []
+        if self.start_date: conditions.append(Client.created_at >= self.start_date)
+        if self.end_date: conditions.append(Client.created_at < self.end_date)
+        if self.search and self.search.strip(): conditions.append(SearchService.condition(self.search))
+        if self.closer_id:
+            conditions.append(Client.id.in_(union(
+                select(Appointment.client_id).where(Appointment.closer_id == self.closer_id),
+                select(Enrollment.client_id).where(Enrollment.closer_id == self.closer_id)
+            )))
+        if self.programs:
+            conditions.append(Client.id.in_(select(Enrollment.client_id).join(Program, Program.id == Enrollment.program_id).where(Program.name.in_(self.programs))))
+        if self.program_id:
+            conditions.append(Client.id.in_(select(Enrollment.client_id).where(Enrollment.program_id == self.program_id)))
+        if self.with_debt:
+            conditions.append(Client.id.in_(select(Enrollment.client_id).where(Enrollment.balance_due > 0)))
+        return conditions
+
+    def enrollment_conditions(self):
+        """Condiciones sobre Enrollment/Program para KPIs por inscripción (ingresos, conteo por programa)."""
+        conditions = []
+        if self.programs: conditions.append(Enrollment.program_id.in_(select(Program.id).where(Program.name.in_(self.programs))))
+        if self.program_id: conditions.append(Enrollment.program_id == self.program_id)
+        return conditions
+
+    def cte(self):
+        """CTE lead_ids con los ids que pasan los filtros (compilada una sola vez por instancia)."""
+        if self._cte is None:
+            self._cte = select(Client.id.label('id')).where(*self.conditions()).cte('lead_ids')
+        return self._cte
+
+    def clients(self):
+        """Query de Client restringida al conjunto filtrado."""
+        ids = self.cte()
+        return Client.query.join(ids, ids.c.id == Client.id)
+
+    def enrollments(self, *columns):
+        """Query de las inscripciones del conjunto filtrado (con las condiciones por inscripción)."""
+        ids = self.cte()
+        return db.session.query(*columns).select_from(ids).join(Enrollment, Enrollment.client_id == ids.c.id).filter(*self.enrollment_conditions())
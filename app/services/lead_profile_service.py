@@ -0,0 +1,131 @@
+from app import db
+from app.models import User, Client, Enrollment, Program, Payment, PaymentMethod, Appointment, SurveyQuestion, SurveyAnswer
+from functools import lru_cache
+import json
+
+# Statements per view, whatever the lead's history (checked by scripts/check_query_budget.py and the benchmark)
+QUERY_BUDGET = {'lead_profile': 3, 'enrollment_details': 4}
+
+class LeadProfileService:
+    """
+    Vistas de lectura del perfil de un lead y del detalle de una venta. Cada colección se lee con
+    una sola query que proyecta sólo las columnas que se serializan (con los nombres de programa,
+    closer y método ya unidos), así que la cantidad de sentencias no crece con el historial.
+    """
+
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def parse_options(options):
+        """Opciones de una pregunta ('[{"text", "points"}]') como {texto: puntos}; cacheado por el texto."""
+        try:
+            opts = json.loads(options)
+        except (TypeError, ValueError):
+            # Old comma-separated format carries no points
+            return {}
+        if not isinstance(opts, list): return {}
+        points = {}
+        for opt in opts:
+            if not isinstance(opt, dict): continue
+            try: points.setdefault(str(opt.get('text')), int(opt.get('points', 0)))
+            except (TypeError, ValueError): points.setdefault(str(opt.get('text')), 0)
+        return points
+
+    @staticmethod
+    def answer_points(options, answer):
+        """Puntos de una respuesta según las opciones de su pregunta (0 si no coincide ninguna)."""
+        if not options: return 0
+        return LeadProfileService.parse_options(options).get(str(answer), 0)
+
+    @staticmethod
+    def lead_profile(client_id):
+        client = db.session.query(
+            Client.id, Client.full_name, Client.email, Client.phone, Client.instagram
+        ).filter(Client.id == client_id).first_or_404()
+
+        enrollments = db.session.query(
+            Enrollment.id, Enrollment.enrollment_date, Program.name, User.username
+        ).outerjoin(Program, Program.id == Enrollment.program_id).outerjoin(
+            User, User.id == Enrollment.closer_id
+        ).filter(Enrollment.client_id == client_id).order_by(Enrollment.id).all()
+
+        appointments = db.session.query(
+            Appointment.id, Appointment.start_time, Appointment.status, Appointment.origin, User.username
+        ).outerjoin(User, User.id == Appointment.closer_id).filter(Appointment.client_id == client_id).order_by(Appointment.id).all()
+
+        return {
+            "id": client.id,
+            "username": client.full_name or client.email,
+            "email": client.email,
+            "profile": {
+                "phone": client.phone,
+                "instagram": client.instagram
+            },
+            "enrollments": [{"id": e.id, "program": e.name, "date": e.enrollment_date.isoformat(), "closer": e.username} for e in enrollments],
+            "appointments": [{"id": a.id, "start_time": a.start_time.isoformat(), "status": a.status, "closer": a.username, "origin": a.origin} for a in appointments]
+        }
+
+    @staticmethod
+    def enrollment_details(enrollment_id):
+        enrollment = db.session.query(
+            Enrollment.id, Enrollment.client_id, Enrollment.program_id, Enrollment.total_paid, Enrollment.balance_due,
+            Client.full_name, Client.email, Client.phone, Client.instagram,
+            Program.name.label('program_name'), Program.price.label('program_price')
+        ).join(Client, Client.id == Enrollment.client_id).outerjoin(
+            Program, Program.id == Enrollment.program_id
+        ).filter(Enrollment.id == enrollment_id).first_or_404()
+
+        payments = db.session.query(
+            Payment.id, Payment.amount, Payment.date, Payment.payment_type, Payment.status, Payment.payment_method_id,
+            PaymentMethod.name.label('method_name')
+        ).outerjoin(PaymentMethod, PaymentMethod.id == Payment.payment_method_id).filter(
+            Payment.enrollment_id == enrollment_id
+        ).order_by(Payment.id).all()
+
+        appointments = db.session.query(
+            Appointment.id, Appointment.start_time, Appointment.status, Appointment.appointment_type, Appointment.origin
+        ).filter(Appointment.client_id == enrollment.client_id).order_by(Appointment.start_time.desc()).all()
+
+        answers = db.session.query(
+            SurveyAnswer.answer, SurveyQuestion.text, SurveyQuestion.options
+        ).outerjoin(SurveyQuestion, SurveyQuestion.id == SurveyAnswer.question_id).filter(
+            SurveyAnswer.client_id == enrollment.client_id
+        ).order_by(SurveyAnswer.id).all()
+
+        return {
+            "id": enrollment.id,
+            "client": {
+                "id": enrollment.client_id,
+                "name": enrollment.full_name,
+                "email": enrollment.email,
+                "phone": enrollment.phone,
+                "instagram": enrollment.instagram
+            },
+            "program": {
+                "id": enrollment.program_id,
+                "name": enrollment.program_name if enrollment.program_name is not None else "N/A",
+                "price": enrollment.program_price if enrollment.program_name is not None else 0.0
+            },
+            "payments": [{
+                "id": p.id,
+                "amount": p.amount,
+                "date": p.date.isoformat(),
+                "type": p.payment_type,
+                "method": p.method_name if p.method_name is not None else "N/A",
+                "status": p.status,
+                "method_id": p.payment_method_id
+            } for p in payments],
+            "appointments": [{
+                "id": a.id,
+                "start_time": a.start_time.isoformat(),
+                "status": a.status,
+                "type": a.appointment_type,
+                "origin": a.origin
+            } for a in appointments],
+            "survey": [{
+                "question": a.text if a.text is not None else "Pregunta eliminada",
+                "answer": a.answer,
+                "points": LeadProfileService.answer_points(a.options, a.answer)
+            } for a in answers],
+            "total_paid": enrollment.total_paid,
+            "balance_due": enrollment.balance_due
+        }
@@ -0,0 +1,118 @@
+from app import db
+from app.services.cache_service import ResultCache
+from datetime import datetime, date
+from sqlalchemy import or_, and_
+import base64
+import json
+import math
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+class PaginationService:
+    """
+    Paginación keyset para los listados grandes: cada página se pide con WHERE (orden, id) después
+    del último registro visto, así que la página 500 cuesta lo mismo que la primera. Los cursores
+    son opacos (base64 de los valores de orden). El total es opcional y se cachea por tags
+    (ResultCache), así que el COUNT(*) sobre el join filtrado no se repite en cada página.
+    Sin cursor, `page` sigue funcionando con OFFSET para los clientes que navegan por número.
+    """
+
+    # --- Cursors ---
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, datetime): return {'dt': value.isoformat()}
+        if isinstance(value, date): return {'d': value.isoformat()}
+        return value
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, dict):
+            if 'dt' in value: return datetime.fromisoformat(value['dt'])
+            if 'd' in value: return date.fromisoformat(value['d'])
+        return value
+
+    @staticmethod
+    def encode_cursor(values, backwards=False):
+        raw = json.dumps({'v': [PaginationService._dump(v) for v in values], 'b': backwards}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """(valores, hacia_atrás) del cursor, o None si es inválido."""
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+            return [PaginationService._load(v) for v in raw['v']], bool(raw.get('b'))
+        except (ValueError, TypeError, KeyError, AttributeError, UnicodeDecodeError):
+            return None
+
+    # --- Pages ---
+
+    @staticmethod
+    def _after(keys, values, backwards):
+        """Filas posteriores a `values` en el orden de `keys` (anteriores si backwards)."""
+        clauses = []
+        for i, (expr, descending) in enumerate(keys):
+            later = expr < values[i] if descending != backwards else expr > values[i]
+            clauses.append(and_(*[keys[j][0] == values[j] for j in range(i)], later))
+        return or_(*clauses)
+
+    @staticmethod
+    def paginate(query, order, id_column, cursor=None, page=None, limit=DEFAULT_LIMIT, count_tags=None):
+        """
+        Una página de `query` ordenada por `order` ([(expresión, descendente)], sin NULLs) desempatando
+        por `id_column`. Devuelve {'items', 'next_cursor', 'prev_cursor', 'total', 'pages'}; total y pages
+        sólo se calculan (cacheados) si se pasan count_tags.
+        """
+        limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+        keys = list(order) + [(id_column, order[-1][1] if order else True)]
+        position = PaginationService.decode_cursor(cursor) if cursor else None
+        if position and len(position[0]) != len(keys): position = None
+        backwards = bool(position and position[1])
+
+        total = PaginationService.count(query, count_tags) if count_tags is not None else None
+
+        page_q = query.order_by(None).add_columns(*[expr.label(f'_key{i}') for i, (expr, _) in enumerate(keys)])
+        if position: page_q = page_q.filter(PaginationService._after(keys, position[0], backwards))
+        page_q = page_q.order_by(*[expr.desc() if descending != backwards else expr.asc() for expr, descending in keys])
+        offset = (max(page, 1) - 1) * limit if page and not position else 0
+        rows = page_q.offset(offset).limit(limit + 1).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards: rows.reverse()
+        first, last = (list(rows[0][1:]), list(rows[-1][1:])) if rows else (None, None)
+        # Backwards pages always have rows after them (the ones the cursor came from)
+        next_cursor = PaginationService.encode_cursor(last) if rows and (has_more or backwards) else None
+        prev_cursor = PaginationService.encode_cursor(first, backwards=True) if rows and ((backwards and has_more) or (not backwards and (position or offset))) else None
+        return {
+            'items': [row[0] for row in rows],
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'total': total,
+            'pages': max(1, math.ceil(total / limit)) if total is not None else None
+        }
+
+    @staticmethod
+    def options(args, count_tags, limit=DEFAULT_LIMIT):
+        """kwargs de paginate desde los query params: cursor, page, per_page y count=false (sin total)."""
+        return {
+            'cursor': args.get('cursor'),
+            'page': args.get('page', type=int),
+            'limit': args.get('per_page', limit, type=int),
+            'count_tags': count_tags if args.get('count') != 'false' else None
+        }
+
+    @staticmethod
+    def envelope(result, data):
+        """Respuesta JSON de un listado: datos serializados más total, páginas y cursores."""
+        return {'data': data, 'total': result['total'], 'pages': result['pages'],
+                'next_cursor': result['next_cursor'], 'prev_cursor': result['prev_cursor']}
+
+    @staticmethod
+    def count(query, tags):
+        """COUNT(*) de la query, cacheado por su SQL y parámetros hasta que cambie alguno de los tags."""
+        statement = query.order_by(None).statement.compile(dialect=db.engine.dialect)
+        key = (str(statement), tuple(sorted((name, repr(value)) for name, value in statement.params.items())))
+        return ResultCache.get_or_compute('pagination:count', key, tuple(tags), lambda: query.order_by(None).count())
@@ -0,0 +1,289 @@
+from app import db
+from app.models import (User, Client, Appointment, Enrollment, Payment, Program, Availability,
+                        CloserDailyStats, CloserDailyAgendaStats)
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, inspect, select, update, delete, insert, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import pytz
+
+DEFAULT_TIMEZONE = 'America/La_Paz'
+DEFAULT_AGENDA_TYPE = 'Primera agenda'
+COUNTERS = ('calls_scheduled', 'calls_completed', 'calls_no_show', 'calls_canceled',
+            'sales_count', 'sales_amount', 'cash_collected', 'slots_defined')
+AMOUNTS = ('sales_amount', 'cash_collected')
+STATUS_COUNTERS = {'completed': 'calls_completed', 'no_show': 'calls_no_show', 'canceled': 'calls_canceled'}
+
+# Attributes whose change moves a row's contribution; other edits don't touch the rollups
+TRACKED = {
+    Appointment: ('closer_id', 'start_time', 'status', 'appointment_type'),
+    Enrollment: ('closer_id', 'enrollment_date', 'program_id'),
+    Payment: ('enrollment_id', 'date', 'amount', 'status'),
+    Availability: ('closer_id', 'date'),
+}
+
+class RollupDelta:
+    """Cambios firmados por (closer, día local) acumulados durante un flush."""
+
+    def __init__(self):
+        self.rows = []  # (closer_id, when, counters, agenda_key)
+
+    def add_rows(self, rows, sign):
+        for closer_id, when, counters, agenda_key in rows:
+            if closer_id is None or when is None: continue
+            self.rows.append((closer_id, when, {k: v * sign for k, v in counters.items()}, agenda_key and (agenda_key, sign)))
+
+    def resolve(self, connection):
+        """Agrupa por día local de cada closer: ({(closer, día): {contador: delta}}, {(closer, día, tipo, estado): delta})."""
+        timezones = RollupService.timezones(connection, {row[0] for row in self.rows})
+        daily = defaultdict(lambda: defaultdict(float))
+        agendas = defaultdict(int)
+        for closer_id, when, counters, agenda in self.rows:
+            day = RollupService.local_day(when, timezones.get(closer_id))
+            for key, value in counters.items():
+                daily[(closer_id, day)][key] += value
+            if agenda:
+                (appointment_type, status), sign = agenda
+                agendas[(closer_id, day, appointment_type, status)] += sign
+        daily = {key: {k: (v if k in AMOUNTS else int(v)) for k, v in values.items() if v} for key, values in daily.items()}
+        return {key: values for key, values in daily.items() if values}, {key: v for key, v in agendas.items() if v}
+
+class RollupService:
+    """
+    Rollups diarios por closer (día local según su timezone), mantenidos de forma incremental:
+    cada flush que toca agendas, ventas, pagos u overrides de disponibilidad aplica sus deltas
+    con upserts atómicos en closer_daily_stats y closer_daily_agenda_stats.
+    """
+
+    @staticmethod
+    def timezones(connection, closer_ids):
+        if not closer_ids: return {}
+        rows = connection.execute(select(User.id, User.timezone).where(User.id.in_(closer_ids))).all()
+        result = {}
+        for closer_id, tz_name in rows:
+            try: result[closer_id] = pytz.timezone(tz_name or DEFAULT_TIMEZONE)
+            except Exception: result[closer_id] = pytz.timezone(DEFAULT_TIMEZONE)
+        return result
+
+    @staticmethod
+    def local_day(when, tz):
+        # Availability overrides are already stored as local dates
+        if not isinstance(when, datetime): return when
+        return pytz.UTC.localize(when).astimezone(tz or pytz.timezone(DEFAULT_TIMEZONE)).date()
+
+    # --- Contributions read straight from the database (pre-flush or post-flush state) ---
+
+    @staticmethod
+    def _contributions(connection, model, ids):
+        if not ids: return []
+        ids = list(ids)
+        if model is Appointment:
+            rows = connection.execute(select(
+                Appointment.closer_id, Appointment.start_time, Appointment.status, Appointment.appointment_type
+            ).where(Appointment.id.in_(ids))).all()
+            return [RollupService._appointment_row(*row) for row in rows]
+        if model is Enrollment:
+            rows = connection.execute(select(
+                Enrollment.closer_id, Enrollment.enrollment_date, Program.price
+            ).outerjoin(Program, Program.id == Enrollment.program_id).where(Enrollment.id.in_(ids))).all()
+            return [(closer_id, when, {'sales_count': 1, 'sales_amount': price or 0.0}, None) for closer_id, when, price in rows]
+        if model is Payment:
+            rows = connection.execute(select(
+                Enrollment.closer_id, Payment.date, Payment.amount
+            ).join(Enrollment, Enrollment.id == Payment.enrollment_id).where(
+                Payment.id.in_(ids), Payment.status == 'completed'
+            )).all()
+            return [(closer_id, when, {'cash_collected': amount or 0.0}, None) for closer_id, when, amount in rows]
+        if model is Availability:
+            rows = connection.execute(select(Availability.closer_id, Availability.date).where(Availability.id.in_(ids))).all()
+            return [(closer_id, day, {'slots_defined': 1}, None) for closer_id, day in rows]
+        return []
+
+    @staticmethod
+    def _appointment_row(closer_id, start_time, status, appointment_type):
+        counters = {'calls_scheduled': 1}
+        if status in STATUS_COUNTERS: counters[STATUS_COUNTERS[status]] = 1
+        return closer_id, start_time, counters, (appointment_type or DEFAULT_AGENDA_TYPE, status or '')
+
+    # --- Flush listeners ---
+
+    @staticmethod
+    def _changed(obj, attrs):
+        state = inspect(obj)
+        return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+    @staticmethod
+    def _before_flush(session, flush_context, instances):
+        pending = {'old': defaultdict(set), 'new': [], 'rebuild': set()}
+        with session.no_autoflush:
+            for obj in session.deleted:
+                if type(obj) in TRACKED and obj.id is not None:
+                    pending['old'][type(obj)].add(obj.id)
+
+            # A deleted client takes its agendas, sales and payments with it, whether or not the
+            # cascade has loaded them into the session
+            clients = [obj.id for obj in session.deleted if type(obj) is Client and obj.id is not None]
+            if clients:
+                connection = session.connection()
+                pending['old'][Appointment].update(connection.execute(select(Appointment.id).where(Appointment.client_id.in_(clients))).scalars())
+                enrollments = connection.execute(select(Enrollment.id).where(Enrollment.client_id.in_(clients))).scalars().all()
+                pending['old'][Enrollment].update(enrollments)
+                if enrollments:
+                    pending['old'][Payment].update(connection.execute(select(Payment.id).where(Payment.enrollment_id.in_(enrollments))).scalars())
+
+            for obj in session.dirty:
+                model = type(obj)
+                if model in TRACKED:
+                    if obj.id is not None and RollupService._changed(obj, TRACKED[model]):
+                        pending['old'][model].add(obj.id)
+                        pending['new'].append(obj)
+                elif model is Program and RollupService._changed(obj, ('price',)):
+                    # Price edits change the sales amount of every enrollment of the program
+                    ids = session.connection().execute(select(Enrollment.id).where(Enrollment.program_id == obj.id)).scalars()
+                    pending['old'][Enrollment].update(ids)
+                elif model is User and RollupService._changed(obj, ('timezone',)):
+                    pending['rebuild'].add(obj.id)
+
+            # An enrollment moving to another closer moves its payments too
+            moved = [obj.id for obj in session.dirty if type(obj) is Enrollment and obj.id is not None
+                     and RollupService._changed(obj, ('closer_id',))]
+            if moved:
+                ids = session.connection().execute(select(Payment.id).where(Payment.enrollment_id.in_(moved))).scalars()
+                pending['old'][Payment].update(ids)
+
+            pending['new'].extend(obj for obj in session.new if type(obj) in TRACKED)
+            if not pending['old'] and not pending['new'] and not pending['rebuild']: return
+
+            delta = RollupDelta()
+            connection = session.connection()
+            for model, ids in pending['old'].items():
+                delta.add_rows(RollupService._contributions(connection, model, ids), -1)
+        pending['delta'] = delta
+        session.info.setdefault('rollup_pending', []).append(pending)
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        queue = session.info.pop('rollup_pending', None)
+        if not queue: return
+        connection = session.connection()
+        for pending in queue:
+            delta = pending['delta']
+            new_ids = defaultdict(set)
+            for obj in pending['new']:
+                if obj in session.deleted or obj.id is None: continue
+                new_ids[type(obj)].add(obj.id)
+            # Rows re-read after the flush: old contributions that still exist come back with their new values
+            for model, ids in pending['old'].items():
+                new_ids[model].update(ids)
+            for model, ids in new_ids.items():
+                delta.add_rows(RollupService._contributions(connection, model, ids), 1)
+            RollupService.apply(connection, *delta.resolve(connection))
+            if pending['rebuild']:
+                RollupService.rebuild(closer_ids=pending['rebuild'], connection=connection)
+
+    # --- Writes ---
+
+    @staticmethod
+    def _upsert(connection, table, keys, rows, additive=True):
+        if not rows: return
+        dialect = connection.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert_fn = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert_fn(table).values(rows)
+            columns = [c for c in rows[0] if c not in keys]
+            stmt = stmt.on_conflict_do_update(index_elements=keys, set_={
+                c: (func.coalesce(table.c[c], 0) + stmt.excluded[c]) if additive else stmt.excluded[c] for c in columns
+            })
+            connection.execute(stmt)
+            return
+        for row in rows:
+            where = [table.c[k] == row[k] for k in keys]
+            values = {c: (func.coalesce(table.c[c], 0) + v) if additive else v for c, v in row.items() if c not in keys}
+            if not connection.execute(update(table).where(*where).values(values)).rowcount:
+                connection.execute(insert(table).values(row))
+
+    @staticmethod
+    def apply(connection, daily, agendas, additive=True):
+        daily_rows = [{'closer_id': closer_id, 'date': day, **{c: values.get(c, 0) for c in COUNTERS}}
+                      for (closer_id, day), values in daily.items()]
+        agenda_rows = [{'closer_id': closer_id, 'date': day, 'appointment_type': a_type, 'status': status, 'count': count}
+                       for (closer_id, day, a_type, status), count in agendas.items()]
+        RollupService._upsert(connection, CloserDailyStats.__table__, ['closer_id', 'date'], daily_rows, additive)
+        RollupService._upsert(connection, CloserDailyAgendaStats.__table__,
+                              ['closer_id', 'date', 'appointment_type', 'status'], agenda_rows, additive)
+
+    # --- Backfill and consistency ---
+
+    @staticmethod
+    def expected(connection, closer_ids=None):
+        """Rollups calculados desde las tablas base (para rebuild y check)."""
+        def scoped(query, column):
+            return query.where(column.in_(closer_ids)) if closer_ids is not None else query
+
+        delta = RollupDelta()
+        delta.add_rows([RollupService._appointment_row(*row) for row in connection.execute(scoped(select(
+            Appointment.closer_id, Appointment.start_time, Appointment.status, Appointment.appointment_type
+        ), Appointment.closer_id)).all()], 1)
+        delta.add_rows([(closer_id, when, {'sales_count': 1, 'sales_amount': price or 0.0}, None) for closer_id, when, price in connection.execute(scoped(select(
+            Enrollment.closer_id, Enrollment.enrollment_date, Program.price
+        ).outerjoin(Program, Program.id == Enrollment.program_id), Enrollment.closer_id)).all()], 1)
+        delta.add_rows([(closer_id, when, {'cash_collected': amount or 0.0}, None) for closer_id, when, amount in connection.execute(scoped(select(
+            Enrollment.closer_id, Payment.date, Payment.amount
+        ).join(Enrollment, Enrollment.id == Payment.enrollment_id).where(Payment.status == 'completed'), Enrollment.closer_id)).all()], 1)
+        delta.add_rows([(closer_id, day, {'slots_defined': 1}, None) for closer_id, day in connection.execute(scoped(select(
+            Availability.closer_id, Availability.date
+        ), Availability.closer_id)).all()], 1)
+        return delta.resolve(connection)
+
+    @staticmethod
+    def rebuild(closer_ids=None, connection=None):
+        """Recalcula los rollups (de todos los closers o de los indicados). Devuelve (filas diarias, filas de agenda)."""
+        own_transaction = connection is None
+        connection = connection or db.session.connection()
+        if closer_ids is not None: closer_ids = list(closer_ids)
+        daily, agendas = RollupService.expected(connection, closer_ids)
+
+        # Daily stats rows also hold daily report answers, so counters are reset instead of deleting rows
+        reset = update(CloserDailyStats).values({c: 0 for c in COUNTERS})
+        clear = delete(CloserDailyAgendaStats)
+        if closer_ids is not None:
+            reset = reset.where(CloserDailyStats.closer_id.in_(closer_ids))
+            clear = clear.where(CloserDailyAgendaStats.closer_id.in_(closer_ids))
+        connection.execute(reset)
+        connection.execute(clear)
+        RollupService.apply(connection, daily, agendas, additive=False)
+        if own_transaction: db.session.commit()
+        return len(daily), len(agendas)
+
+    @staticmethod
+    def check(closer_ids=None, tolerance=0.01):
+        """Lista de diferencias entre los rollups guardados y los recalculados."""
+        connection = db.session.connection()
+        if closer_ids is not None: closer_ids = list(closer_ids)
+        daily, agendas = RollupService.expected(connection, closer_ids)
+
+        stored_daily_q = select(CloserDailyStats.closer_id, CloserDailyStats.date, *[CloserDailyStats.__table__.c[c] for c in COUNTERS])
+        stored_agendas_q = select(CloserDailyAgendaStats.closer_id, CloserDailyAgendaStats.date, CloserDailyAgendaStats.appointment_type,
+                                  CloserDailyAgendaStats.status, CloserDailyAgendaStats.count)
+        if closer_ids is not None:
+            stored_daily_q = stored_daily_q.where(CloserDailyStats.closer_id.in_(closer_ids))
+            stored_agendas_q = stored_agendas_q.where(CloserDailyAgendaStats.closer_id.in_(closer_ids))
+        stored_daily = {(row[0], row[1]): dict(zip(COUNTERS, row[2:])) for row in connection.execute(stored_daily_q).all()}
+        stored_agendas = {tuple(row[:4]): row[4] for row in connection.execute(stored_agendas_q).all()}
+
+        issues = []
+        for key in set(daily) | set(stored_daily):
+            for counter in COUNTERS:
+                expected = daily.get(key, {}).get(counter, 0)
+                stored = (stored_daily.get(key) or {}).get(counter) or 0
+                if abs(expected - stored) > tolerance:
+                    issues.append({'closer_id': key[0], 'date': key[1], 'field': counter, 'stored': stored, 'expected': expected})
+        for key in set(agendas) | set(stored_agendas):
+            expected, stored = agendas.get(key, 0), stored_agendas.get(key) or 0
+            if expected != stored:
+                issues.append({'closer_id': key[0], 'date': key[1], 'field': f'agendas:{key[2]}:{key[3]}', 'stored': stored, 'expected': expected})
+        return sorted(issues, key=lambda i: (i['closer_id'], i['date'], i['field']))
+
+event.listen(Session, 'before_flush', RollupService._before_flush)
+event.listen(Session, 'after_flush', RollupService._after_flush)
@@ -0,0 +1,135 @@
+from app import db
+from app.models import Client
+from sqlalchemy import event, inspect, select, update, DDL
+from sqlalchemy.orm import Session
+import unicodedata
+
+# Trigram tokens: shorter words can't use the FTS5 index on SQLite and are matched with LIKE
+MIN_INDEXED_WORD = 3
+TYPEAHEAD_LIMIT = 10
+REINDEX_BATCH = 2000
+FTS_TABLE = 'clients_search'
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(search_text, content='clients', content_rowid='id', tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON clients BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON clients BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON clients BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_clients_search_text_trgm ON clients USING gin (search_text gin_trgm_ops)",
+]
+
+class SearchService:
+    """
+    Búsqueda de leads por nombre o email sobre clients.search_text (minúsculas, sin acentos).
+    En Postgres usa un índice GIN de trigramas (pg_trgm); en SQLite, la tabla FTS5 clients_search
+    con tokenizer trigram, sincronizada por triggers. search_text se completa en cada flush.
+    """
+
+    @staticmethod
+    def normalize(text):
+        """'José  PÉREZ' -> 'jose perez' (sin acentos, minúsculas, espacios simples)."""
+        if not text: return ''
+        decomposed = unicodedata.normalize('NFKD', text)
+        return ' '.join(''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold().split())
+
+    @staticmethod
+    def search_text(full_name, email):
+        return SearchService.normalize(f"{full_name or ''} {email or ''}") or None
+
+    # --- Query side ---
+
+    @staticmethod
+    def _fts_query(words):
+        # Each word as a quoted phrase: user input never reaches the FTS5 query syntax
+        return ' AND '.join('"{}"'.format(w.replace('"', '""')) for w in words)
+
+    @staticmethod
+    def _fts_match(words):
+        return select(db.literal_column('rowid').label('id'), db.literal_column('rank').label('rank')).select_from(
+            db.table(FTS_TABLE)
+        ).where(db.literal_column(FTS_TABLE).op('MATCH')(SearchService._fts_query(words)))
+
+    @staticmethod
+    def condition(term):
+        """Condición SQL sobre Client: cada palabra del término aparece en el nombre o el email."""
+        words = SearchService.normalize(term).split()
+        if not words: return db.true()
+        indexed = [w for w in words if len(w) >= MIN_INDEXED_WORD]
+        if db.engine.dialect.name != 'sqlite' or not indexed:
+            return db.and_(*[Client.search_text.contains(w, autoescape=True) for w in words])
+        match = SearchService._fts_match(indexed).subquery()
+        return db.and_(Client.id.in_(select(match.c.id)),
+                       *[Client.search_text.contains(w, autoescape=True) for w in words if len(w) < MIN_INDEXED_WORD])
+
+    @staticmethod
+    def filter(query, term):
+        """Aplica la búsqueda a una query que incluye Client (sin término, la devuelve igual)."""
+        return query.filter(SearchService.condition(term)) if term and term.strip() else query
+
+    @staticmethod
+    def typeahead(term, limit=TYPEAHEAD_LIMIT, query=None):
+        """Leads que coinciden, ordenados por relevancia: prefijo del texto, inicio de palabra, similitud, más nuevos."""
+        normalized = SearchService.normalize(term)
+        if not normalized: return []
+        query = SearchService.filter(query if query is not None else Client.query, term)
+        order = [db.case(
+            (Client.search_text.startswith(normalized, autoescape=True), 0),
+            (Client.search_text.contains(' ' + normalized, autoescape=True), 1),
+            else_=2
+        )]
+        if db.engine.dialect.name == 'postgresql':
+            order.append(db.func.similarity(Client.search_text, normalized).desc())
+        else:
+            indexed = [w for w in normalized.split() if len(w) >= MIN_INDEXED_WORD]
+            if indexed:
+                # bm25 rank of the FTS5 match (lower is better)
+                match = SearchService._fts_match(indexed).subquery()
+                query = query.outerjoin(match, match.c.id == Client.id)
+                order.append(match.c.rank)
+        return query.order_by(*order, Client.created_at.desc(), Client.id.desc()).limit(limit).all()
+
+    # --- Write side ---
+
+    @staticmethod
+    def _before_flush(session, flush_context, instances):
+        for obj in list(session.new) + list(session.dirty):
+            if type(obj) is not Client: continue
+            state = inspect(obj)
+            if obj in session.new or state.attrs.full_name.history.has_changes() or state.attrs.email.history.has_changes():
+                obj.search_text = SearchService.search_text(obj.full_name, obj.email)
+
+    @staticmethod
+    def reindex(only_missing=False):
+        """Recalcula search_text (p. ej. tras inserts en bloque). Devuelve la cantidad de leads actualizados."""
+        count, last_id = 0, 0
+        while True:
+            rows_q = select(Client.id, Client.full_name, Client.email).where(Client.id > last_id).order_by(Client.id).limit(REINDEX_BATCH)
+            if only_missing: rows_q = rows_q.where(Client.search_text.is_(None))
+            rows = db.session.execute(rows_q).all()
+            if not rows: break
+            db.session.execute(update(Client.__table__).where(Client.__table__.c.id == db.bindparam('client_id')), [
+                {'client_id': client_id, 'search_text': SearchService.search_text(full_name, email)} for client_id, full_name, email in rows
+            ])
+            count += len(rows)
+            last_id = rows[-1][0]
+        db.session.commit()
+        return count
+
+event.listen(Session, 'before_flush', SearchService._before_flush)
+# Index structures live outside the model metadata; created along with the clients table
+for statement in SQLITE_DDL:
+    event.listen(Client.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Client.__table__, 'before_drop', DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect='sqlite'))
+for statement in POSTGRES_DDL:
+    event.listen(Client.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
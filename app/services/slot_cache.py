@@ -0,0 +1,163 @@
+from app.models import User, Appointment
+from app.services.cache_service import LRUCache, CacheVersions
+from app.services.slot_engine import SlotEngine, IntervalIndex, DEFAULT_TIMEZONE, DEFAULT_DURATION_MINUTES
+from datetime import datetime, timedelta
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+import pytz
+
+GLOBAL_KEY = 'slots:all'
+# Appointment attributes that decide which slots an agenda blocks
+BLOCKING = ('closer_id', 'start_time', 'status', 'duration_minutes')
+
+class SlotCache:
+    """
+    Cache de disponibilidad por (closer, día local).
+    Tier 1: LRU en memoria por worker. Tier 2: versiones compartidas en BD (CacheVersions),
+    incrementadas por cada escritura que cambia la disponibilidad.
+    """
+    entries = LRUCache(max_entries=8192)
+
+    @staticmethod
+    def closer_key(closer_id):
+        return f'slots:closer:{closer_id}'
+
+    @staticmethod
+    def day_key(closer_id, day):
+        return f'slots:closer:{closer_id}:{day.isoformat()}'
+
+    @staticmethod
+    def _version_keys(closer_ids, days):
+        keys = [GLOBAL_KEY]
+        for closer_id in closer_ids:
+            keys.append(SlotCache.closer_key(closer_id))
+            keys.extend(SlotCache.day_key(closer_id, day) for day in days)
+        return keys
+
+    @staticmethod
+    def _day_slots(days, closer_ids, versions, duration_minutes, buffer_minutes):
+        """{(closer, día local): slots} desde el LRU; los que faltan se calculan juntos con el motor."""
+        def stamp(closer_id, day):
+            return (versions[GLOBAL_KEY], versions[SlotCache.closer_key(closer_id)], versions[SlotCache.day_key(closer_id, day)])
+
+        cached, missing = {}, []
+        for closer_id in closer_ids:
+            for day in days:
+                slots = SlotCache.entries.get((closer_id, day, duration_minutes, buffer_minutes), stamp(closer_id, day))
+                if slots is None: missing.append((closer_id, day))
+                else: cached[(closer_id, day)] = slots
+
+        if missing:
+            miss_closers = sorted({closer_id for closer_id, _ in missing})
+            miss_days = [day for _, day in missing]
+            engine = SlotEngine(min(miss_days), max(miss_days), closer_ids=miss_closers,
+                                duration_minutes=duration_minutes, buffer_minutes=buffer_minutes)
+            for closer_id, day in missing:
+                slots = engine.day_slots(closer_id, day)
+                SlotCache.entries.set((closer_id, day, duration_minutes, buffer_minutes), stamp(closer_id, day), slots)
+                cached[(closer_id, day)] = slots
+        return cached
+
+    @staticmethod
+    def get_team_slots(start_date, end_date, closer_ids, duration_minutes=DEFAULT_DURATION_MINUTES, buffer_minutes=0):
+        days = []
+        current_date = start_date
+        while current_date <= end_date:
+            days.append(current_date)
+            current_date += timedelta(days=1)
+
+        versions = CacheVersions.get(SlotCache._version_keys(closer_ids, days))
+        cached = SlotCache._day_slots(days, closer_ids, versions, duration_minutes, buffer_minutes)
+
+        # Past slots and active holds are filtered on read so cached days stay valid while time moves on
+        min_ts = (datetime.utcnow() - timedelta(minutes=5)).timestamp()
+        held = IntervalIndex.for_holds(closer_ids, datetime.combine(start_date, datetime.min.time()) - timedelta(days=1),
+                                       datetime.combine(end_date, datetime.max.time()) + timedelta(days=1))
+        duration, buffer = timedelta(minutes=duration_minutes), timedelta(minutes=buffer_minutes)
+        all_slots = []
+        for closer_id in closer_ids:
+            seen = set()
+            closer_held = held.get(closer_id)
+            for day in days:
+                for slot in cached[(closer_id, day)]:
+                    if slot['ts'] < min_ts or slot['ts'] in seen: continue
+                    if closer_held:
+                        utc_start = datetime.fromisoformat(slot['utc_iso'][:-1])
+                        if closer_held.overlaps(utc_start - buffer, utc_start + duration + buffer): continue
+                    seen.add(slot['ts'])
+                    all_slots.append(dict(slot))
+
+        all_slots.sort(key=lambda x: x['ts'])
+        return all_slots
+
+    @staticmethod
+    def free_closers(start_time_utc, closer_ids, duration_minutes=DEFAULT_DURATION_MINUTES, buffer_minutes=0):
+        """
+        Closers libres en start_time_utc. Usa un índice {utc_iso: [closer_id]} por día UTC, guardado
+        en el LRU con el sello de versiones de los días locales que lo forman (cualquier timezone
+        cae a un día del UTC); sólo los holds del instante se revisan en cada lectura.
+        """
+        if not closer_ids or start_time_utc < datetime.utcnow() - timedelta(minutes=5): return []
+        day = start_time_utc.date()
+        days = [day - timedelta(days=1), day, day + timedelta(days=1)]
+        keys = SlotCache._version_keys(closer_ids, days)
+        versions = CacheVersions.get(keys)
+        index_key = ('index', day, tuple(closer_ids), duration_minutes, buffer_minutes)
+        stamp = tuple(versions[key] for key in keys)
+        index = SlotCache.entries.get(index_key, stamp)
+        if index is None:
+            index = {}
+            for slots in SlotCache._day_slots(days, closer_ids, versions, duration_minutes, buffer_minutes).values():
+                for slot in slots:
+                    if slot['utc_iso'][:10] == day.isoformat():
+                        index.setdefault(slot['utc_iso'], []).append(slot['closer_id'])
+            SlotCache.entries.set(index_key, stamp, index)
+
+        free = index.get(start_time_utc.isoformat() + 'Z', [])
+        if not free: return []
+        start, end = start_time_utc - timedelta(minutes=buffer_minutes), start_time_utc + timedelta(minutes=duration_minutes + buffer_minutes)
+        held = IntervalIndex.for_holds(free, start, end)
+        return [closer_id for closer_id in dict.fromkeys(free) if not (held.get(closer_id) and held[closer_id].overlaps(start, end))]
+
+    @staticmethod
+    def invalidate_closer(closer_id):
+        CacheVersions.bump(SlotCache.closer_key(closer_id))
+
+    @staticmethod
+    def invalidate_all():
+        CacheVersions.bump(GLOBAL_KEY)
+
+    @staticmethod
+    def _appointment_keys(closer_tz, closer_id, start_time):
+        # Slots are keyed by the closer's local day; with durations and buffers an agenda can
+        # block slots of the neighbouring days too, so the local days around it are bumped
+        local_day = pytz.UTC.localize(start_time).astimezone(closer_tz).date()
+        return [SlotCache.day_key(closer_id, local_day + timedelta(days=offset)) for offset in (-1, 0, 1)]
+
+    @staticmethod
+    def _before_flush(session, flush_context, instances):
+        # Every agenda write (new, moved, canceled, deleted) invalidates the days of its old and new positions
+        agendas, changed = set(), []
+        with session.no_autoflush:
+            for obj in (*session.new, *session.dirty, *session.deleted):
+                if type(obj) is not Appointment: continue
+                if obj in session.dirty and not any(inspect(obj).attrs[attr].history.has_changes() for attr in BLOCKING):
+                    continue
+                if obj not in session.deleted: agendas.add((obj.closer_id, obj.start_time))
+                if obj.id is not None: changed.append(obj.id)
+            # Old positions come from the database: expired attributes keep no history when set
+            connection = session.connection()
+            if changed:
+                agendas.update(connection.execute(select(Appointment.closer_id, Appointment.start_time).where(Appointment.id.in_(changed))).all())
+            agendas = {(closer_id, start_time) for closer_id, start_time in agendas if closer_id and start_time}
+            if not agendas: return
+
+            timezones = dict(connection.execute(select(User.id, User.timezone).where(User.id.in_({c for c, _ in agendas}))).all())
+        keys = set()
+        for closer_id, start_time in agendas:
+            try: closer_tz = pytz.timezone(timezones.get(closer_id) or DEFAULT_TIMEZONE)
+            except Exception: closer_tz = pytz.timezone(DEFAULT_TIMEZONE)
+            keys.update(SlotCache._appointment_keys(closer_tz, closer_id, start_time))
+        CacheVersions.defer(session, *keys)
+
+event.listen(Session, 'before_flush', SlotCache._before_flush)
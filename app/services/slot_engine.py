@@ -0,0 +1,243 @@
+from app.models import Availability, WeeklyAvailability, Appointment, SlotHold, User, db
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta, time
+from itertools import accumulate
+import numpy as np
+import pytz
+
+DEFAULT_TIMEZONE = 'America/La_Paz'
+DEFAULT_DURATION_MINUTES = 30
+
+class IntervalIndex:
+    """
+    Intervalos ocupados [inicio, fin) de un closer, ordenados por inicio.
+    Guarda el máximo acumulado de los fines para responder solapamientos con un bisect (O(log n)).
+    """
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        self.max_ends = list(accumulate((end for _, end in intervals), max))
+
+    def overlaps(self, start, end):
+        # Only intervals starting before `end` can overlap; the furthest-reaching one decides
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.max_ends[i - 1] > start
+
+    @staticmethod
+    def appointment_interval(start_time, duration_minutes):
+        return start_time, start_time + timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES)
+
+    @staticmethod
+    def for_closer(closer_id, window_start, window_end, exclude_id=None):
+        """Índice con las agendas activas de un closer que pueden solapar la ventana dada."""
+        query = db.session.query(Appointment.start_time, Appointment.duration_minutes).filter(
+            Appointment.closer_id == closer_id,
+            Appointment.status != 'canceled',
+            # Appointments never last longer than a day
+            Appointment.start_time > window_start - timedelta(days=1),
+            Appointment.start_time < window_end
+        )
+        if exclude_id: query = query.filter(Appointment.id != exclude_id)
+        return IntervalIndex(IntervalIndex.appointment_interval(start, duration) for start, duration in query.all())
+
+    @staticmethod
+    def for_holds(closer_ids, window_start, window_end, exclude_token=None):
+        """{closer_id: IntervalIndex} con los holds vigentes que pueden solapar la ventana."""
+        query = db.session.query(SlotHold.closer_id, SlotHold.start_time, SlotHold.duration_minutes).filter(
+            SlotHold.expires_at > datetime.utcnow(),
+            SlotHold.start_time > window_start - timedelta(days=1),
+            SlotHold.start_time < window_end
+        )
+        if closer_ids is not None: query = query.filter(SlotHold.closer_id.in_(closer_ids))
+        if exclude_token: query = query.filter(SlotHold.token != exclude_token)
+
+        held = defaultdict(list)
+        for closer_id, start, duration in query.all():
+            held[closer_id].append(IntervalIndex.appointment_interval(start, duration))
+        return {closer_id: IntervalIndex(intervals) for closer_id, intervals in held.items()}
+
+class SlotEngine:
+    """
+    Motor de disponibilidad basado en conjuntos.
+    Carga overrides, plantillas semanales, closers y agendas activas de todo el rango
+    en un número fijo de queries y expande los slots en memoria.
+    """
+
+    def __init__(self, start_date, end_date, closer_ids=None, duration_minutes=DEFAULT_DURATION_MINUTES, buffer_minutes=0):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.closer_ids = list(closer_ids) if closer_ids is not None else None
+        self.duration = timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES)
+        self.buffer = timedelta(minutes=buffer_minutes or 0)
+        self._timezones = {}
+        self._load()
+
+    def _load(self):
+        overrides_q = Availability.query.filter(
+            Availability.date >= self.start_date,
+            Availability.date <= self.end_date
+        )
+        weekly_q = WeeklyAvailability.query.filter_by(is_active=True)
+        appts_q = db.session.query(Appointment.closer_id, Appointment.start_time, Appointment.duration_minutes).filter(
+            # Local days east of UTC start on the previous UTC day
+            Appointment.start_time >= datetime.combine(self.start_date, time.min) - timedelta(days=1),
+            Appointment.start_time <= datetime.combine(self.end_date, time.max) + timedelta(days=1),
+            Appointment.status != 'canceled'
+        )
+        if self.closer_ids is not None:
+            overrides_q = overrides_q.filter(Availability.closer_id.in_(self.closer_ids))
+            weekly_q = weekly_q.filter(WeeklyAvailability.closer_id.in_(self.closer_ids))
+            appts_q = appts_q.filter(Appointment.closer_id.in_(self.closer_ids))
+
+        overrides = overrides_q.order_by(Availability.id).all()
+        weekly = weekly_q.order_by(WeeklyAvailability.id).all()
+
+        self.overrides_by_day = defaultdict(list)
+        self.overrides_by_closer_day = defaultdict(list)
+        for av in overrides:
+            self.overrides_by_day[av.date].append(av)
+            self.overrides_by_closer_day[(av.closer_id, av.date)].append(av)
+
+        self.weekly_by_dow = defaultdict(list)
+        self.weekly_by_closer_dow = defaultdict(list)
+        for ws in weekly:
+            self.weekly_by_dow[ws.day_of_week].append(ws)
+            self.weekly_by_closer_dow[(ws.closer_id, ws.day_of_week)].append(ws)
+
+        ids = {r.closer_id for r in overrides} | {r.closer_id for r in weekly}
+        self.closers = {u.id: u for u in User.query.filter(User.id.in_(ids)).all()} if ids else {}
+
+        busy = defaultdict(list)
+        for closer_id, start, duration in appts_q.all():
+            busy[closer_id].append(IntervalIndex.appointment_interval(start, duration))
+        self.busy = {closer_id: IntervalIndex(intervals) for closer_id, intervals in busy.items()}
+        self.held = IntervalIndex.for_holds(
+            self.closer_ids,
+            datetime.combine(self.start_date, time.min) - timedelta(days=1),
+            datetime.combine(self.end_date, time.max) + timedelta(days=1)
+        )
+
+    def is_busy(self, closer_id, utc_start, holds=True):
+        # The buffer applies on both sides of the requested slot
+        window = (utc_start - self.buffer, utc_start + self.duration + self.buffer)
+        index = self.busy.get(closer_id)
+        if index and index.overlaps(*window): return True
+        held = self.held.get(closer_id) if holds else None
+        return bool(held) and held.overlaps(*window)
+
+    def _timezone(self, closer):
+        tz = self._timezones.get(closer.id)
+        if tz is None:
+            try: tz = pytz.timezone(closer.timezone or DEFAULT_TIMEZONE)
+            except Exception: tz = pytz.timezone(DEFAULT_TIMEZONE)
+            self._timezones[closer.id] = tz
+        return tz
+
+    def _day_rows(self, day, closer_id=None):
+        # Specific overrides replace the weekly template for that day
+        if closer_id is None:
+            return self.overrides_by_day.get(day) or self.weekly_by_dow.get(day.weekday(), [])
+        return (self.overrides_by_closer_day.get((closer_id, day))
+                or self.weekly_by_closer_dow.get((closer_id, day.weekday()), []))
+
+    def _days(self):
+        current_date = self.start_date
+        while current_date <= self.end_date:
+            yield current_date
+            current_date += timedelta(days=1)
+
+    def _local_starts(self, day, row):
+        """Inicios locales de los slots de un rango, con paso duración + buffer (datetime64[m])."""
+        duration = int(self.duration.total_seconds() // 60)
+        step = duration + int(self.buffer.total_seconds() // 60)
+        start = row.start_time.hour * 60 + row.start_time.minute
+        end = row.end_time.hour * 60 + row.end_time.minute if row.end_time else start
+        if end < start: end += 24 * 60  # Range ends past midnight
+
+        # The start slot is always offered (legacy one-row-per-slot data); the rest must fit in the range
+        minutes = np.arange(start, max(start, end - duration) + 1, step)
+        return np.datetime64(day, 'm') + minutes.astype('timedelta64[m]')
+
+    def _to_utc(self, tz, local_starts):
+        first = tz.localize(local_starts[0].item()).utcoffset()
+        last = tz.localize(local_starts[-1].item()).utcoffset()
+        if first == last:
+            # No DST change inside the range: one offset for the whole array
+            return local_starts - np.timedelta64(int(first.total_seconds()), 's')
+        return np.array([tz.localize(dt).astimezone(pytz.UTC).replace(tzinfo=None) for dt in local_starts.tolist()],
+                        dtype='datetime64[s]')
+
+    def _expand(self, rows, day, unique_slots, min_utc=None, holds=True):
+        for row in rows:
+            closer = self.closers.get(row.closer_id)
+            if not closer: continue
+
+            local_starts = self._local_starts(day, row)
+            utc_starts = self._to_utc(self._timezone(closer), local_starts)
+
+            # Avoid past slots (with 5 min buffer)
+            if min_utc:
+                keep = utc_starts >= np.datetime64(min_utc)
+                local_starts, utc_starts = local_starts[keep], utc_starts[keep]
+
+            for local_dt, utc_dt in zip(local_starts.tolist(), utc_starts.astype('datetime64[s]').tolist()):
+                if self.is_busy(closer.id, utc_dt, holds): continue
+                if utc_dt in unique_slots: continue
+
+                unique_slots[utc_dt] = {
+                    'utc_iso': utc_dt.isoformat() + 'Z',
+                    'closer_id': closer.id,
+                    'ts': utc_dt.timestamp(),
+                    'date': day.isoformat(),
+                    'start': local_dt.strftime('%H:%M')
+                }
+
+    def available_slots(self):
+        """Slots libres del rango, deduplicados por horario UTC y ordenados cronológicamente."""
+        min_utc = datetime.utcnow() - timedelta(minutes=5)
+        unique_slots = {}
+        for day in self._days():
+            self._expand(self._day_rows(day), day, unique_slots, min_utc)
+
+        available_slots = list(unique_slots.values())
+        available_slots.sort(key=lambda x: x['ts'])
+        return available_slots
+
+    def day_slots(self, closer_id, day):
+        """
+        Slots libres de un closer para un día local (unidad cacheable).
+        No descarta horarios pasados ni holds: ambos cambian sin escrituras que invaliden la cache.
+        """
+        closer = self.closers.get(closer_id)
+        if not closer: return []
+
+        unique_slots = {}
+        self._expand(self._day_rows(day, closer_id), day, unique_slots, holds=False)
+        slots = sorted(unique_slots.values(), key=lambda x: x['ts'])
+        for slot in slots:
+            slot['closer_name'] = closer.username
+        return slots
+
+    def team_slots(self):
+        """
+        Slots libres de cada closer del rango, etiquetados con closer_id/closer_name.
+        Cada closer resuelve sus overrides de forma independiente y no se deduplica entre closers.
+        """
+        min_utc = datetime.utcnow() - timedelta(minutes=5)
+        closer_ids = self.closer_ids if self.closer_ids is not None else sorted(self.closers)
+        all_slots = []
+        for closer_id in closer_ids:
+            closer = self.closers.get(closer_id)
+            if not closer: continue
+
+            unique_slots = {}
+            for day in self._days():
+                self._expand(self._day_rows(day, closer_id), day, unique_slots, min_utc)
+            for slot in unique_slots.values():
+                slot['closer_name'] = closer.username
+            all_slots.extend(unique_slots.values())
+
+        all_slots.sort(key=lambda x: x['ts'])
+        return all_slots
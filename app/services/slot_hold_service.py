@@ -0,0 +1,28 @@
+from app.models import SlotHold, db
+from datetime import datetime
+
+HOLD_TTL_MINUTES = 5
+
+class SlotHoldService:
+    """
+    Holds temporales de un horario mientras el lead completa el funnel.
+    Expiran solos: toda lectura filtra por expires_at y el barrido borra por rango sobre su índice.
+    """
+
+    @staticmethod
+    def get_active(token):
+        if not token: return None
+        return SlotHold.query.filter(SlotHold.token == token, SlotHold.expires_at > datetime.utcnow()).first()
+
+    @staticmethod
+    def release(token):
+        deleted = SlotHold.query.filter_by(token=token).delete()
+        db.session.commit()
+        return deleted > 0
+
+    @staticmethod
+    def sweep(commit=True):
+        # Range delete on the expires_at index: only expired rows are touched
+        deleted = SlotHold.query.filter(SlotHold.expires_at <= datetime.utcnow()).delete()
+        if commit: db.session.commit()
+        return deleted
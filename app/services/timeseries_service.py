@@ -0,0 +1,109 @@
+from app import db
+from datetime import datetime, time, timedelta
+import pandas as pd
+import pytz
+
+DEFAULT_TIMEZONE = 'America/La_Paz'
+GRANULARITIES = ('day', 'week', 'month')
+# Longest range (in days) charted at each granularity before switching to a coarser one
+AUTO_LIMITS = (('day', 62), ('week', 366))
+PANDAS_FREQ = {'day': 'D', 'week': '7D', 'month': 'MS'}
+
+class TimeSeriesService:
+    """
+    Series temporales agrupadas en la base de datos por día, semana (lunes) o mes en la
+    timezone del usuario que mira el dashboard. Los timestamps se guardan en UTC naive:
+    Postgres los convierte con AT TIME ZONE; SQLite con un desplazamiento en minutos por
+    tramo de offset (transiciones DST del rango). Los huecos se rellenan con pandas.
+    """
+
+    @staticmethod
+    def get_timezone(tz_name):
+        try: return pytz.timezone(tz_name or DEFAULT_TIMEZONE)
+        except Exception: return pytz.timezone(DEFAULT_TIMEZONE)
+
+    @staticmethod
+    def granularity_for(start_date, end_date, requested=None):
+        if requested in GRANULARITIES: return requested
+        days = (end_date - start_date).days + 1
+        for granularity, limit in AUTO_LIMITS:
+            if days <= limit: return granularity
+        return 'month'
+
+    @staticmethod
+    def utc_bounds(start_date, end_date, tz_name=None):
+        """(inicio, fin) en UTC naive de los días locales [start_date, end_date]; sin timezone, los días son UTC."""
+        start_dt, end_dt = datetime.combine(start_date, time.min), datetime.combine(end_date, time.max)
+        if not tz_name: return start_dt, end_dt
+        tz = TimeSeriesService.get_timezone(tz_name)
+        return (tz.localize(start_dt).astimezone(pytz.UTC).replace(tzinfo=None),
+                tz.localize(end_dt).astimezone(pytz.UTC).replace(tzinfo=None))
+
+    @staticmethod
+    def bucket_start(day, granularity):
+        if granularity == 'week': return day - timedelta(days=day.weekday())
+        if granularity == 'month': return day.replace(day=1)
+        return day
+
+    # --- SQL expressions ---
+
+    @staticmethod
+    def _inline(value):
+        # Rendered inline so the SELECT and GROUP BY expressions match (Postgres compares them textually)
+        return db.literal(value, literal_execute=True)
+
+    @staticmethod
+    def _offsets(tz, start_utc, end_utc):
+        """[(desde_utc, minutos)] con el offset de la timezone vigente en cada tramo del rango."""
+        def offset(moment):
+            return int(pytz.UTC.localize(moment).astimezone(tz).utcoffset().total_seconds() // 60)
+
+        spans = [(None, offset(start_utc))]
+        cursor = start_utc
+        while cursor < end_utc:
+            step = min(cursor + timedelta(days=1), end_utc)
+            if offset(step) != spans[-1][1]:
+                # Narrow the transition down to the minute
+                low, high = cursor, step
+                while high - low > timedelta(minutes=1):
+                    middle = low + (high - low) / 2
+                    if offset(middle) == spans[-1][1]: low = middle
+                    else: high = middle
+                spans.append((high.replace(second=0, microsecond=0), offset(high)))
+            cursor = step
+        return spans
+
+    @staticmethod
+    def local_expr(column, tz_name, start_utc, end_utc):
+        """Expresión SQL con el timestamp UTC `column` convertido a la hora local de tz_name."""
+        tz = TimeSeriesService.get_timezone(tz_name)
+        if db.engine.dialect.name == 'postgresql':
+            return db.func.timezone(TimeSeriesService._inline(tz.zone), db.func.timezone(TimeSeriesService._inline('UTC'), column))
+        spans = TimeSeriesService._offsets(tz, start_utc - timedelta(days=1), end_utc + timedelta(days=1))
+        def modifier(minutes): return f'{minutes:+d} minutes'
+        if len(spans) == 1: return db.func.datetime(column, modifier(spans[0][1]))
+        whens = [(column < since, modifier(spans[i - 1][1])) for i, (since, _) in enumerate(spans) if since is not None]
+        return db.func.datetime(column, db.case(*whens, else_=modifier(spans[-1][1])))
+
+    @staticmethod
+    def bucket_expr(column, granularity, tz_name=None, start_utc=None, end_utc=None):
+        """
+        Expresión de agrupación por bucket. Con tz_name, `column` es un timestamp UTC que se pasa
+        a hora local; sin ella, `column` ya es un día local (p. ej. los rollups diarios por closer).
+        """
+        value = TimeSeriesService.local_expr(column, tz_name, start_utc, end_utc) if tz_name else column
+        if db.engine.dialect.name == 'postgresql':
+            return db.cast(db.func.date_trunc(TimeSeriesService._inline(granularity), value), db.Date)
+        if granularity == 'week': return db.func.date(value, 'weekday 0', '-6 days')
+        if granularity == 'month': return db.func.strftime('%Y-%m-01', value)
+        return db.func.date(value)
+
+    # --- Gap filling ---
+
+    @staticmethod
+    def fill(rows, start_date, end_date, granularity, fill_value=0):
+        """Completa [(bucket, valor)] con todos los buckets del rango. Devuelve (labels ISO, valores)."""
+        index = pd.date_range(TimeSeriesService.bucket_start(start_date, granularity), end_date, freq=PANDAS_FREQ[granularity])
+        series = pd.Series({pd.Timestamp(str(bucket)[:10]): value for bucket, value in rows if bucket is not None}, dtype='float64')
+        series = series.groupby(level=0).sum().reindex(index, fill_value=fill_value)
+        return [d.date().isoformat() for d in index], series.tolist()
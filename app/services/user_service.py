@@ -1,8 +1,11 @@
 from app import db
-from app.models import User, Client, Enrollment, Program, Payment, PaymentMethod, Appointment
+from app.models import User, Client, Enrollment, Program, Payment, PaymentMethod
 from app.services.base import BaseService
-from datetime import datetime, timedelta
-from sqlalchemy import or_
+from app.services.pagination_service import PaginationService
+from app.services.slot_cache import SlotCache
+
+# Writes to these invalidate the cached lead list totals
+LEAD_COUNT_TAGS = ('clients', 'enrollments', 'appointments')
 
 class UserService(BaseService):
     @staticmethod
@@ -57,7 +60,10 @@ class UserService(BaseService):
             if 'username' in data: user.username = data['username']
             if 'email' in data: user.email = data['email']
             if 'role' in data: user.role = data['role']
-            if 'timezone' in data: user.timezone = data['timezone']
+            if 'timezone' in data and data['timezone'] != user.timezone:
+                user.timezone = data['timezone']
+                # Cached slots are keyed by the closer's local days
+                SlotCache.invalidate_closer(user.id)
             if data.get('password'): user.set_password(data['password'])
             db.session.commit()
             return UserService.success("Usuario actualizado correctamente.")
@@ -101,142 +107,46 @@ class UserService(BaseService):
             return UserService.error(f"Error al eliminar: {str(e)}")
 
     @staticmethod
-    def get_leads_list(filters, page=1, per_page=50):
-        query = Client.query
-        search = filters.get('search')
-        program_filter = filters.get('program')
-        start_date = filters.get('start_date')
-        end_date = filters.get('end_date')
-        sort_by = filters.get('sort_by', 'newest')
-        closer_id = filters.get('closer_id')
-
-        # Join if filtering by program
-        if program_filter:
-            programs = program_filter.split(',')
-            if programs:
-                query = query.join(Enrollment).join(Program).filter(Program.name.in_(programs))
-        
-        if closer_id:
-            query = query.filter(or_(
-                Client.appointments.any(Appointment.closer_id == closer_id),
-                Client.enrollments.any(Enrollment.closer_id == closer_id)
-            ))
-        
-        if start_date: query = query.filter(Client.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
-        if end_date: query = query.filter(Client.created_at < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
-        if search:
-            term = f"%{search}%"
-            query = query.filter(or_(Client.full_name.ilike(term), Client.email.ilike(term)))
-
-        if sort_by == 'oldest': query = query.order_by(Client.created_at.asc())
-        elif sort_by == 'a-z': query = query.order_by(Client.full_name.asc())
-        elif sort_by == 'z-a': query = query.order_by(Client.full_name.desc())
-        else: query = query.order_by(Client.created_at.desc())
-
-        return query.paginate(page=page, per_page=per_page, error_out=False)
+    def get_leads_list(lead_filter, sort_by='newest', page=None, per_page=50, cursor=None, with_total=True):
+        return PaginationService.paginate(
+            lead_filter.clients(), UserService.lead_order(sort_by), Client.id, cursor=cursor, page=page, limit=per_page,
+            count_tags=LEAD_COUNT_TAGS if with_total else None
+        )
 
     @staticmethod
-    def get_leads_kpis(filters):
-        def apply_filters(q):
-            search = filters.get('search')
-            program_filter = filters.get('program')
-            closer_id = filters.get('closer_id')
-            start_date = filters.get('start_date')
-            end_date = filters.get('end_date')
-
-            if program_filter:
-                programs = program_filter.split(',')
-                if programs:
-                    # Check if already joined
-                    # SQLAlchemy constructs are smart, but safer to robustly join
-                    # Assuming q is based on Client or joined with it
-                    # We need to act differently based on q source
-                    # For simplicity, assuming q starts with Client
-                    pass # We need robust check inside main logic
-            
-            # Since apply_filters is helper, let's just inline logic or simplify
-            # Re-implementing specific filter block per query type below is safer
-            return q
-
-        # Separate logic for complex joins
-        base_q = Client.query
-        
-        # Apply standard filters to base_q
-        search = filters.get('search')
-        program_filter = filters.get('program')
-        closer_id = filters.get('closer_id')
-        start_date = filters.get('start_date')
-        end_date = filters.get('end_date')
-
-        if program_filter:
-            programs = program_filter.split(',')
-            if programs:
-                base_q = base_q.join(Enrollment).join(Program).filter(Program.name.in_(programs))
-        
-        if closer_id:
-            base_q = base_q.filter(or_(
-                Client.appointments.any(Appointment.closer_id == closer_id),
-                Client.enrollments.any(Enrollment.closer_id == closer_id)
-            ))
-        if start_date: base_q = base_q.filter(Client.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
-        if end_date: base_q = base_q.filter(Client.created_at < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
-        if search: base_q = base_q.filter(or_(Client.full_name.ilike(f"%{search}%"), Client.email.ilike(f"%{search}%")))
-        
-        total_clients = base_q.count()
+    def lead_order(sort_by):
+        # Keyset sort keys must be non-null: names without value sort as ''
+        if sort_by == 'oldest': return [(Client.created_at, False)]
+        if sort_by == 'a-z': return [(db.func.coalesce(Client.full_name, ''), False)]
+        if sort_by == 'z-a': return [(db.func.coalesce(Client.full_name, ''), True)]
+        if sort_by == 'debt':
+            debt = db.session.query(db.func.coalesce(db.func.sum(Enrollment.balance_due), 0.0)).filter(
+                Enrollment.client_id == Client.id
+            ).correlate(Client).scalar_subquery()
+            return [(debt, True), (Client.created_at, True)]
+        return [(Client.created_at, True)]
 
-        # Revenue Query
-        pay_q = db.session.query(
-            db.func.sum(Payment.amount),
-            db.func.sum((Payment.amount * (PaymentMethod.commission_percent / 100.0)) + PaymentMethod.commission_fixed)
-        ).select_from(Client).join(Enrollment).join(Payment).join(PaymentMethod).filter(Payment.status == 'completed')
-        
-        # Apply same filters to pay_q
-        if program_filter:
-            programs = program_filter.split(',')
-            # We already join Enrollment/Program in base query logic, but pay_q is fresh
-            # Should reuse logic.
-            pay_q = pay_q.join(Program).filter(Program.name.in_(programs)) # Program is joined via Enrollment usually
-        
-        if closer_id:
-             pay_q = pay_q.filter(or_(
-                Client.appointments.any(Appointment.closer_id == closer_id),
-                Client.enrollments.any(Enrollment.closer_id == closer_id)
-            ))
-        if start_date: pay_q = pay_q.filter(Client.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
-        if end_date: pay_q = pay_q.filter(Client.created_at < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
-        if search: pay_q = pay_q.filter(or_(Client.full_name.ilike(f"%{search}%"), Client.email.ilike(f"%{search}%")))
-
-        result = pay_q.first()
-        gross_collected = result[0] or 0.0
-        cash_collected = gross_collected - (result[1] or 0.0)
-        
-        # Debt Query? Simple approach: fetch clients and iterate
-        # Optimization: Don't iterate all if too many. 
-        # But for debt calculation we need all.
-        # Let's use base_q.all() if feasible or aggregate in sql
-        clients = base_q.all()
-        total_debt = 0.0
-        for c in clients:
-            for enr in c.enrollments:
-                debt = (enr.program.price if enr.program else 0.0) - enr.total_paid
-                if debt > 0: total_debt += debt
-        
-        # Program Counts
-        program_counts_q = db.session.query(Program.name, db.func.count(Enrollment.id)).select_from(Client).join(Enrollment).join(Program)
-        # Apply filters
-        if program_filter:
-            programs = program_filter.split(',')
-            program_counts_q = program_counts_q.filter(Program.name.in_(programs))
-        if closer_id:
-            program_counts_q = program_counts_q.filter(or_(
-                Client.appointments.any(Appointment.closer_id == closer_id),
-                Client.enrollments.any(Enrollment.closer_id == closer_id)
-            ))
-        if start_date: program_counts_q = program_counts_q.filter(Client.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
-        if end_date: program_counts_q = program_counts_q.filter(Client.created_at < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
-        if search: program_counts_q = program_counts_q.filter(or_(Client.full_name.ilike(f"%{search}%"), Client.email.ilike(f"%{search}%")))
-        
-        program_counts = program_counts_q.group_by(Program.name).all()
+    @staticmethod
+    def get_leads_kpis(lead_filter):
+        # Two statements whatever the number of leads: the scalar KPIs together, then the per-program counts
+        ids = lead_filter.cte()
+        payments = lead_filter.enrollments().join(Payment, Payment.enrollment_id == Enrollment.id).join(
+            PaymentMethod, PaymentMethod.id == Payment.payment_method_id
+        ).filter(Payment.status == 'completed')
+        total_clients, gross_collected, fees, total_debt = db.session.query(
+            db.session.query(db.func.count()).select_from(ids).scalar_subquery(),
+            payments.with_entities(db.func.coalesce(db.func.sum(Payment.amount), 0.0)).scalar_subquery(),
+            payments.with_entities(db.func.coalesce(db.func.sum(Payment.fee), 0.0)).scalar_subquery(),
+            # Debt: stored per-enrollment balances of the filtered leads (every program)
+            db.session.query(db.func.coalesce(db.func.sum(Enrollment.balance_due), 0.0)).select_from(ids).join(
+                Enrollment, Enrollment.client_id == ids.c.id
+            ).scalar_subquery()
+        ).one()
+        cash_collected = gross_collected - fees
+
+        program_counts = lead_filter.enrollments(Program.name, db.func.count(Enrollment.id)).join(
+            Program, Program.id == Enrollment.program_id
+        ).group_by(Program.name).all()
 
         return {
             'total': total_clients,
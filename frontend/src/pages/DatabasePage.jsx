@@ -31,7 +31,8 @@ import usePersistentFilters from '../hooks/usePersistentFilters';
 const DatabasePage = () => {
     const [activeTab, setActiveTab] = useState('leads_raw'); // Default to leads for visibility
     const [data, setData] = useState([]);
-    const [pagination, setPagination] = useState({ page: 1, total: 0, pages: 1 });
+    // Keyset pagination: the API returns opaque cursors for the pages around the current one
+    const [pagination, setPagination] = useState({ page: 1, total: 0, pages: 1, cursor: null, next: null, prev: null });
     const [loading, setLoading] = useState(true);
     const [search, setSearch] = useState('');
     const [editingId, setEditingId] = useState(null);
@@ -68,7 +69,7 @@ const DatabasePage = () => {
         fetchData(1);
     }, [activeTab, filters]);
 
-    const fetchData = async (page = 1) => {
+    const fetchData = async (page = 1, cursor = null) => {
         try {
             setLoading(true);
             const tab = tabs.find(t => t.id === activeTab);
@@ -79,7 +80,7 @@ const DatabasePage = () => {
             }
 
             const params = {
-                page,
+                ...(cursor ? { cursor } : { page }),
                 search,
                 start_date: filters.dateRange?.start,
                 end_date: filters.dateRange?.end,
@@ -98,10 +99,10 @@ const DatabasePage = () => {
 
             if (res.data.data) {
                 setData(res.data.data);
-                setPagination({ page, total: res.data.total, pages: res.data.pages });
+                setPagination({ page, total: res.data.total, pages: res.data.pages, cursor, next: res.data.next_cursor, prev: res.data.prev_cursor });
             } else {
                 setData(res.data);
-                setPagination({ page: 1, total: res.data.length, pages: 1 });
+                setPagination({ page: 1, total: res.data.length, pages: 1, cursor: null, next: null, prev: null });
             }
         } catch (err) {
             console.error(err);
@@ -118,7 +119,7 @@ const DatabasePage = () => {
             const tab = tabs.find(t => t.id === activeTab);
             await api.post(tab.endpoint, editForm);
             setEditingId(null);
-            fetchData(pagination.page);
+            fetchData(pagination.page, pagination.cursor);
         } catch (err) { alert("Error al guardar cambios"); }
     };
     const handleDelete = async (id) => { /* ... existing ... */
@@ -126,7 +127,7 @@ const DatabasePage = () => {
         try {
             const tab = tabs.find(t => t.id === activeTab);
             await api.delete(`${tab.endpoint}?id=${id}`);
-            fetchData(pagination.page);
+            fetchData(pagination.page, pagination.cursor);
         } catch (err) { alert("No se pudo eliminar el registro"); }
     };
 
@@ -342,9 +343,9 @@ const DatabasePage = () => {
                 </div>
                 {pagination.pages > 1 && (
                     <div className="flex bg-surface rounded-xl p-1 border border-base">
-                        <button disabled={pagination.page === 1} onClick={() => fetchData(pagination.page - 1)} className="p-2 text-muted hover:text-base disabled:text-muted/20 transition-all"><ChevronLeft size={20} /></button>
+                        <button disabled={pagination.page === 1} onClick={() => fetchData(pagination.page - 1, pagination.page - 1 === 1 ? null : pagination.prev)} className="p-2 text-muted hover:text-base disabled:text-muted/20 transition-all"><ChevronLeft size={20} /></button>
                         <div className="px-4 flex items-center text-[10px] font-black text-base uppercase tracking-widest">{pagination.page} / {pagination.pages}</div>
-                        <button disabled={pagination.page === pagination.pages} onClick={() => fetchData(pagination.page + 1)} className="p-2 text-muted hover:text-base disabled:text-muted/20 transition-all"><ChevronRight size={20} /></button>
+                        <button disabled={!pagination.next} onClick={() => fetchData(pagination.page + 1, pagination.next)} className="p-2 text-muted hover:text-base disabled:text-muted/20 transition-all"><ChevronRight size={20} /></button>
                     </div>
                 )}
             </div>
@@ -32,5 +32,87 @@ def create_admin(username, password):
     db.session.commit()
     print(f"Admin user {username} created successfully.")
 
+@app.cli.command("prune-slot-cache")
+@click.option("--days", default=30, help="Drop per-day slot cache keys untouched for this many days.")
+def prune_slot_cache(days):
+    """Removes stale per-day slot cache versions."""
+    from app.services.cache_service import CacheVersions
+    deleted = CacheVersions.prune('slots:closer:', older_than_days=days)
+    print(f"{deleted} slot cache keys removed.")
+
+@app.cli.command("sweep-slot-holds")
+def sweep_slot_holds():
+    """Deletes expired funnel slot holds."""
+    from app.services.slot_hold_service import SlotHoldService
+    deleted = SlotHoldService.sweep()
+    print(f"{deleted} expired slot holds removed.")
+
+@app.cli.command("rollup-rebuild")
+@click.option("--closer", "closer_ids", type=int, multiple=True, help="Only rebuild these closers (repeatable).")
+def rollup_rebuild(closer_ids):
+    """Recomputes the daily closer rollups from appointments, enrollments and payments."""
+    from app.services.rollup_service import RollupService
+    daily, agendas = RollupService.rebuild(closer_ids=list(closer_ids) or None)
+    print(f"Rollups rebuilt: {daily} daily rows, {agendas} agenda rows.")
+
+@app.cli.command("rollup-check")
+@click.option("--closer", "closer_ids", type=int, multiple=True, help="Only check these closers (repeatable).")
+@click.option("--fix", is_flag=True, help="Rebuild the affected closers when differences are found.")
+def rollup_check(closer_ids, fix):
+    """Compares the daily closer rollups against the raw tables."""
+    from app.services.rollup_service import RollupService
+    issues = RollupService.check(closer_ids=list(closer_ids) or None)
+    for issue in issues[:50]:
+        print(f"closer {issue['closer_id']} {issue['date']} {issue['field']}: stored {issue['stored']}, expected {issue['expected']}")
+    if not issues:
+        print("Rollups are consistent.")
+        return
+    print(f"{len(issues)} differences found.")
+    if fix:
+        RollupService.rebuild(closer_ids=sorted({i['closer_id'] for i in issues}))
+        print("Affected closers rebuilt.")
+    else:
+        raise SystemExit(1)
+
+@app.cli.command("activity-backfill")
+def activity_backfill():
+    """Seeds the activity log from existing leads, sales, completed payments and comments (only when empty)."""
+    from app.services.activity_service import ActivityService
+    count = ActivityService.backfill()
+    print("Activity log already has events; nothing to do." if count is None else f"Activity events created: {count}.")
+
+@app.cli.command("activity-bounds-rebuild")
+def activity_bounds_rebuild():
+    """Recomputes the first/last timestamps of payments, leads and appointments used by the 'all_time' period (run periodically)."""
+    from app.services.bounds_service import BoundsService
+    for entity, (min_at, max_at) in BoundsService.rebuild().items():
+        print(f"{entity}: {min_at} -> {max_at}")
+
+@app.cli.command("search-reindex")
+@click.option("--missing", is_flag=True, help="Only leads without search text (e.g. after bulk inserts).")
+def search_reindex(missing):
+    """Recomputes the normalized lead search text (and with it the search index)."""
+    from app.services.search_service import SearchService
+    print(f"Leads reindexed: {SearchService.reindex(only_missing=missing)}.")
+
+@app.cli.command("balance-check")
+@click.option("--fix", is_flag=True, help="Recompute the stored balances of the affected enrollments.")
+def balance_check(fix):
+    """Compares the stored enrollment balances (total_paid, balance_due) against payments and program prices."""
+    from app.services.balance_service import BalanceService
+    issues = BalanceService.check()
+    for issue in issues[:50]:
+        print(f"enrollment {issue['enrollment_id']}: total_paid {issue['total_paid']} (expected {issue['expected_total_paid']}), "
+              f"balance_due {issue['balance_due']} (expected {issue['expected_balance_due']})")
+    if not issues:
+        print("Enrollment balances are consistent.")
+        return
+    print(f"{len(issues)} differences found.")
+    if fix:
+        BalanceService.repair(enrollment_ids=[i['enrollment_id'] for i in issues])
+        print("Affected enrollments recomputed.")
+    else:
+        raise SystemExit(1)
+
 if __name__ == '__main__':
     app.run(debug=True)
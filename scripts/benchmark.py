@@ -0,0 +1,264 @@
+"""
+Benchmark de los caminos de disponibilidad y booking con datos sintéticos.
+
+Crea el esquema en una base dedicada (por defecto un SQLite en el directorio temporal, fuera
+del repo; o la URL indicada), siembra closers, plantillas semanales, overrides y agendas, y
+mide para cada escenario: tiempo de reloj, cantidad de sentencias SQL y pico de memoria
+(tracemalloc).
+El perfil de lead y el detalle de venta además deben respetar su presupuesto de sentencias
+(QUERY_BUDGET en lead_profile_service); si lo superan, el benchmark termina con error.
+La carrera de bookings simultáneos contra un mismo slot está en scripts/check_booking_race.py.
+
+Ejemplos:
+    python scripts/benchmark.py
+    python scripts/benchmark.py --closers 5 50 200 --days 7 30 90 --appointments 0 10000 100000
+    python scripts/benchmark.py --database-url postgresql://localhost/bench --reset --json > baseline.json
+"""
+import sys
+import os
+import argparse
+import contextlib
+import json
+import random
+import tempfile
+import time as clock
+import tracemalloc
+from datetime import datetime, date, time, timedelta
+from statistics import median
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+from config import Config
+from app import create_app, db
+from app.models import User, Client, Appointment, Availability, WeeklyAvailability, Event, Program, PaymentMethod, Enrollment, Payment
+from app.services.rollup_service import RollupService
+from app.services.search_service import SearchService
+
+# Outside the project tree: a relative SQLite URL would land in the Flask instance/ folder
+DEFAULT_URL = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'neurops_benchmark.db')
+TIMEZONES = ['America/La_Paz', 'America/Bogota', 'America/Mexico_City', 'Europe/Madrid']
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+def measure(fn, repeat=1):
+    """Ejecuta fn `repeat` veces; devuelve mediana de ms, sentencias SQL y pico de memoria en KB."""
+    times, statements, peaks = [], [], []
+    for _ in range(repeat):
+        tracemalloc.start()
+        with StatementCounter(db.engine) as counter:
+            started = clock.perf_counter()
+            fn()
+            elapsed = clock.perf_counter() - started
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        times.append(elapsed * 1000)
+        statements.append(counter.count)
+    return {'ms': round(median(times), 2), 'sql': int(median(statements)), 'peak_kb': round(max(peaks) / 1024, 1)}
+
+def seed(n_closers, n_days, n_appointments, rng):
+    """Siembra un equipo sintético con inserts en bloque. Devuelve el Event del funnel."""
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(insert(User), [{
+        'username': f'bench_closer_{i}', 'email': f'bench_closer_{i}@bench.local',
+        'role': 'closer', 'timezone': rng.choice(TIMEZONES), 'is_active': True
+    } for i in range(n_closers)])
+    closer_ids = [cid for (cid,) in db.session.query(User.id).order_by(User.id).all()]
+
+    # Working blocks: one or two ranges per weekday, plus a few date overrides
+    weekly = []
+    for closer_id in closer_ids:
+        for dow in range(7):
+            if dow == 6 and rng.random() < 0.7: continue
+            weekly.append({'closer_id': closer_id, 'day_of_week': dow, 'start_time': time(9, 0), 'end_time': time(13, 0), 'is_active': True})
+            if rng.random() < 0.6:
+                weekly.append({'closer_id': closer_id, 'day_of_week': dow, 'start_time': time(15, 0), 'end_time': time(19, 0), 'is_active': True})
+    db.session.execute(insert(WeeklyAvailability), weekly)
+
+    today = date.today()
+    overrides = []
+    for closer_id in closer_ids:
+        for day in rng.sample(range(n_days), min(3, n_days)):
+            overrides.append({'closer_id': closer_id, 'date': today + timedelta(days=day), 'start_time': time(10, 0), 'end_time': time(16, 0)})
+    db.session.execute(insert(Availability), overrides)
+
+    n_clients = max(1, min(n_appointments, 20000))
+    db.session.execute(insert(Client), [{
+        'full_name': f'Bench Lead {i}', 'email': f'lead_{i}@bench.local', 'created_at': datetime.utcnow() - timedelta(days=rng.randint(0, 365))
+    } for i in range(n_clients)])
+    client_ids = [cid for (cid,) in db.session.query(Client.id).all()]
+
+    # Past history plus the bookable horizon, on a 30 minute grid, one active agenda per closer/start
+    appointments, taken = [], set()
+    base = datetime.combine(today, time.min)
+    history_days = max(30, n_days)
+    while len(appointments) < n_appointments:
+        closer_id = rng.choice(closer_ids)
+        start = base + timedelta(days=rng.randint(-history_days, n_days), minutes=30 * rng.randint(24, 46))
+        status = rng.choice(['scheduled', 'completed', 'completed', 'no_show', 'canceled'])
+        if status != 'canceled':
+            if (closer_id, start) in taken: continue
+            taken.add((closer_id, start))
+        appointments.append({
+            'closer_id': closer_id, 'client_id': rng.choice(client_ids), 'start_time': start,
+            'duration_minutes': 30, 'status': status, 'origin': 'benchmark', 'appointment_type': 'Primera agenda'
+        })
+    for i in range(0, len(appointments), 5000):
+        db.session.execute(insert(Appointment), appointments[i:i + 5000])
+
+    funnel_event = Event(name='Benchmark', utm_source='benchmark', duration_minutes=30, buffer_minutes=0)
+    db.session.add(funnel_event)
+    db.session.commit()
+    # Bulk inserts bypass the flush listeners, so the daily rollups and lead search text are built once here
+    RollupService.rebuild()
+    SearchService.reindex()
+    return funnel_event
+
+def run_scenario(app, n_closers, n_days, n_appointments, repeat, bookings, rng):
+    from app.services.booking_service import BookingService
+    from app.services.slot_cache import SlotCache
+    from app.services.funnel_service import FunnelService
+    from app.services.user_service import UserService
+    from app.services.lead_filter import LeadFilter
+    from app.services.lead_profile_service import LeadProfileService, QUERY_BUDGET
+
+    funnel_event = seed(n_closers, n_days, n_appointments, rng)
+    start_date, end_date = date.today(), date.today() + timedelta(days=n_days)
+    client = app.test_client()
+    results = {}
+
+    results['available_slots'] = measure(lambda: BookingService.get_available_slots_utc(start_date, end_date), repeat)
+
+    def team_cold():
+        SlotCache.entries.clear()
+        BookingService.get_team_slots(start_date, end_date, event=funnel_event)
+    results['team_slots_cold'] = measure(team_cold, repeat)
+    results['team_slots_warm'] = measure(lambda: BookingService.get_team_slots(start_date, end_date, event=funnel_event), repeat)
+
+    def funnel_cold():
+        SlotCache.entries.clear()
+        FunnelService.static_entries.clear()
+        assert client.get('/api/public/funnel/benchmark').status_code == 200
+    results['funnel_cold'] = measure(funnel_cold, repeat)
+    results['funnel_warm'] = measure(lambda: client.get('/api/public/funnel/benchmark'), repeat)
+
+    # Unfiltered lead KPIs: fixed statement count and memory whatever the number of leads
+    results['leads_kpis'] = measure(lambda: UserService.get_leads_kpis(LeadFilter()), repeat)
+
+    # Bookings against free slots of the funnel, letting the assignment engine pick the closer
+    free = sorted({s['ts'] for s in BookingService.get_team_slots(start_date, end_date, event=funnel_event)})
+    free = free[:bookings]
+    booked = []
+    def book_next():
+        ts = free[len(booked) % len(free)]
+        response = client.post('/api/public/book', json={'email': f'bench_{len(booked)}@bench.local', 'timestamp': ts, 'event_id': funnel_event.id})
+        booked.append(response.get_json().get('id') if response.status_code == 201 else None)
+    if free:
+        results['public_book'] = measure(book_next, min(bookings, len(free)))
+        assigned = [cid for (cid,) in db.session.query(Appointment.closer_id).filter(Appointment.id.in_([b for b in booked if b])).all()]
+        per_closer = {}
+        for closer_id in assigned: per_closer[closer_id] = per_closer.get(closer_id, 0) + 1
+        results['assignment'] = {
+            'booked': len(assigned),
+            'closers_used': len(per_closer),
+            'max_per_closer': max(per_closer.values()) if per_closer else 0,
+            'min_per_closer': min(per_closer.values()) if per_closer else 0
+        }
+
+    # Direct service path, with commit
+    closer_id = db.session.query(User.id).filter_by(role='closer').order_by(User.id).first()[0]
+    lead_id = db.session.query(Client.id).order_by(Client.id).first()[0]
+    slot_times = [datetime.combine(end_date + timedelta(days=1), time.min) + timedelta(minutes=30 * i) for i in range(repeat)]
+    results['create_appointment'] = measure(lambda: BookingService.create_appointment(lead_id, closer_id, slot_times.pop(), origin='benchmark'), repeat)
+
+    # Profile read models on the busiest lead, with a sale and its payments: statement count is fixed
+    busiest = db.session.query(Appointment.client_id).group_by(Appointment.client_id).order_by(db.func.count().desc(), Appointment.client_id).first()[0]
+    program = Program(name='Benchmark', price=5000.0)
+    method = PaymentMethod(name='Benchmark', commission_percent=3.5)
+    db.session.add_all([program, method])
+    db.session.flush()
+    enrollment = Enrollment(client_id=busiest, program_id=program.id, closer_id=closer_id)
+    db.session.add(enrollment)
+    db.session.flush()
+    enrollment_id = enrollment.id
+    db.session.add_all([Payment(enrollment_id=enrollment_id, payment_method_id=method.id, amount=50.0, status='completed') for _ in range(50)])
+    db.session.commit()
+    results['lead_profile'] = measure(lambda: LeadProfileService.lead_profile(busiest), repeat)
+    results['enrollment_details'] = measure(lambda: LeadProfileService.enrollment_details(enrollment_id), repeat)
+    for path, budget in QUERY_BUDGET.items():
+        if results[path]['sql'] > budget:
+            raise SystemExit(f"{path}: {results[path]['sql']} sentencias SQL, el presupuesto es {budget}")
+
+    return results
+
+def print_header():
+    header = f"{'closers':>7} {'days':>5} {'appts':>7}  {'path':<20} {'ms':>10} {'sql':>6} {'peak_kb':>10}"
+    print(header)
+    print('-' * len(header))
+
+def print_table(rows):
+    for row in rows:
+        for path, metrics in row['results'].items():
+            if 'ms' not in metrics: continue
+            print(f"{row['closers']:>7} {row['days']:>5} {row['appointments']:>7}  {path:<20} {metrics['ms']:>10} {metrics['sql']:>6} {metrics['peak_kb']:>10}")
+        if 'assignment' in row['results']:
+            a = row['results']['assignment']
+            print(f"{'':>22}  assignment: {a['booked']} booked over {a['closers_used']} closers (min {a['min_per_closer']}, max {a['max_per_closer']})")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de slots y bookings con datos sintéticos.')
+    parser.add_argument('--closers', type=int, nargs='+', default=[5, 50])
+    parser.add_argument('--days', type=int, nargs='+', default=[7, 30])
+    parser.add_argument('--appointments', type=int, nargs='+', default=[0, 10000])
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por medición (se reporta la mediana).')
+    parser.add_argument('--bookings', type=int, default=20, help='Bookings del funnel por escenario.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', default=DEFAULT_URL)
+    parser.add_argument('--reset', action='store_true', help='Confirma que la base indicada puede borrarse (obligatorio fuera de la URL por defecto).')
+    parser.add_argument('--json', action='store_true', help='Salida JSON para comparar contra un baseline.')
+    args = parser.parse_args()
+
+    if args.database_url != DEFAULT_URL and not args.reset:
+        parser.error('La base se borra en cada escenario: usa --reset para confirmar con --database-url.')
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+        SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"timeout": 30}} if args.database_url.startswith('sqlite') else {}
+        WTF_CSRF_ENABLED = False
+
+    app = create_app(BenchmarkConfig)
+    rng = random.Random(args.seed)
+    rows = []
+    if not args.json: print_header()
+    with app.app_context():
+        for n_closers in args.closers:
+            for n_days in args.days:
+                for n_appointments in args.appointments:
+                    # Request handlers print debug lines; keep them out of the report
+                    with contextlib.redirect_stdout(sys.stderr):
+                        results = run_scenario(app, n_closers, n_days, n_appointments, args.repeat, args.bookings, rng)
+                    rows.append({'closers': n_closers, 'days': n_days, 'appointments': n_appointments, 'results': results})
+                    if not args.json: print_table([rows[-1]])
+        db.session.remove()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+
+if __name__ == '__main__':
+    main()
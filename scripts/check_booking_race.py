@@ -0,0 +1,164 @@
+"""
+Chequeo de double-booking con escrituras concurrentes reales.
+
+Cada ronda siembra un equipo mínimo con un slot futuro libre y lanza hilos sincronizados con
+una barrera, cada uno con su propia sesión y conexión:
+
+- funnel: POST /api/public/book simultáneos al mismo slot. Deben crearse tantas agendas como
+  closers libres (el resto recibe "no disponible") y ningún closer puede quedar con dos a esa hora.
+- index: INSERTs simultáneos de la misma (closer, inicio) sin el chequeo previo ni el lock del
+  closer, así que sólo el índice único parcial uq_appointments_closer_start_active los separa:
+  debe confirmarse exactamente uno y el resto fallar con IntegrityError.
+
+En SQLite los escritores se serializan con el lock de la base, así que el escenario funnel no
+llega a competir de verdad; para eso hay que correrlo contra PostgreSQL. El escenario index sí
+ejercita el índice en ambos motores. Termina con error ante cualquier violación.
+
+Ejemplos:
+    python scripts/check_booking_race.py
+    python scripts/check_booking_race.py --database-url postgresql://localhost/race --reset --threads 32 --rounds 20
+"""
+import sys
+import os
+import argparse
+import contextlib
+import tempfile
+import threading
+from datetime import datetime, date, time, timedelta
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from app import create_app, db
+from app.models import User, Client, Appointment, WeeklyAvailability, Event
+
+# Outside the project tree: a relative SQLite URL would land in the Flask instance/ folder
+DEFAULT_URL = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'neurops_booking_race.db')
+
+def seed(n_closers):
+    """Closers en UTC con todo el día disponible; devuelve (id del Event, inicio UTC del slot, ids de closers)."""
+    db.drop_all()
+    db.create_all()
+    closers = [User(username=f'race_closer_{i}', email=f'race_closer_{i}@race.local', role='closer', timezone='UTC') for i in range(n_closers)]
+    db.session.add_all(closers)
+    db.session.flush()
+    for closer in closers:
+        db.session.add_all([WeeklyAvailability(closer_id=closer.id, day_of_week=dow, start_time=time(0, 0), end_time=time(23, 30)) for dow in range(7)])
+    funnel_event = Event(name='Race', utm_source='race', duration_minutes=30, buffer_minutes=0)
+    db.session.add(funnel_event)
+    db.session.commit()
+    return funnel_event.id, datetime.combine(date.today() + timedelta(days=2), time(12, 0)), [closer.id for closer in closers]
+
+def serialize_sqlite(engine):
+    # Each transaction takes the write lock up front: otherwise two readers upgrading to writers
+    # fail with "database is locked" instead of waiting their turn
+    @event.listens_for(engine, 'connect')
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin_immediate(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+def run_threads(app, n_threads, target):
+    """Corre target(i) en n_threads hilos con su propio app context, liberados juntos por una barrera."""
+    # Reading ids after the seed's commit reopened a transaction: end it so it holds no locks
+    db.session.close()
+    barrier = threading.Barrier(n_threads)
+    results = []
+    def worker(i):
+        with app.app_context():
+            barrier.wait()
+            results.append(target(i))
+            db.session.remove()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return results
+
+def active_closers(start_time):
+    db.session.expire_all()
+    closers = [closer_id for (closer_id,) in db.session.query(Appointment.closer_id).filter(
+        Appointment.start_time == start_time, Appointment.status != 'canceled'
+    ).all()]
+    db.session.close()
+    return closers
+
+def check_funnel(app, n_threads, n_closers):
+    event_id, start_time, _ = seed(n_closers)
+    ts = (start_time - datetime(1970, 1, 1)).total_seconds()
+    def book(i):
+        response = app.test_client().post('/api/public/book', json={'email': f'race_{i}@race.local', 'timestamp': ts, 'event_id': event_id})
+        if response.status_code == 201: return 'created'
+        # The route also answers unexpected errors with 400: only the "no disponible" message is a lost race
+        error = (response.get_json() or {}).get('error') or ''
+        return 'rejected' if 'no está disponible' in error else f'{response.status_code}: {error}'
+    outcomes = run_threads(app, n_threads, book)
+    closers = active_closers(start_time)
+    expected = min(n_closers, n_threads)
+    result = {'requests': n_threads, 'free_closers': n_closers, 'created': outcomes.count('created'), 'rejected': outcomes.count('rejected'),
+              'agendas': len(closers), 'errors': [o for o in outcomes if o not in ('created', 'rejected')]}
+    if result['created'] != expected or len(closers) != expected or len(set(closers)) != len(closers) or result['errors']:
+        raise SystemExit(f"funnel: double-booking o bookings perdidos en {start_time.isoformat()}Z: {result}")
+    return result
+
+def check_index(app, n_threads):
+    _, start_time, closer_ids = seed(1)
+    client = Client(full_name='Race Lead', email='race_lead@race.local')
+    db.session.add(client)
+    db.session.commit()
+    row = {'closer_id': closer_ids[0], 'client_id': client.id, 'start_time': start_time, 'duration_minutes': 30, 'status': 'scheduled', 'origin': 'race'}
+    def insert_row(i):
+        # Core insert on a fresh connection: no slot pre-check, no closer lock, no flush listeners
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(Appointment).values(row))
+            return 'inserted'
+        except IntegrityError:
+            return 'rejected'
+    outcomes = run_threads(app, n_threads, insert_row)
+    closers = active_closers(start_time)
+    result = {'requests': n_threads, 'inserted': outcomes.count('inserted'), 'rejected': outcomes.count('rejected'), 'agendas': len(closers)}
+    if result['inserted'] != 1 or result['rejected'] != n_threads - 1 or len(closers) != 1:
+        raise SystemExit(f"index: el índice único no separó los INSERTs concurrentes en {start_time.isoformat()}Z: {result}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Chequeo de double-booking con bookings concurrentes.')
+    parser.add_argument('--threads', type=int, default=12, help='Escritores simultáneos por ronda.')
+    parser.add_argument('--closers', type=int, default=4, help='Closers libres en el slot del escenario funnel.')
+    parser.add_argument('--rounds', type=int, default=5, help='Rondas por escenario (más rondas, más intercalados posibles).')
+    parser.add_argument('--database-url', default=DEFAULT_URL)
+    parser.add_argument('--reset', action='store_true', help='Confirma que la base indicada puede borrarse (obligatorio fuera de la URL por defecto).')
+    args = parser.parse_args()
+
+    if args.database_url != DEFAULT_URL and not args.reset:
+        parser.error('La base se borra en cada ronda: usa --reset para confirmar con --database-url.')
+    if args.threads < 2:
+        parser.error('Hacen falta al menos 2 hilos para una carrera.')
+
+    class RaceConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+        SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"timeout": 30}} if args.database_url.startswith('sqlite') else {"pool_size": args.threads + 2}
+        WTF_CSRF_ENABLED = False
+
+    app = create_app(RaceConfig)
+    with app.app_context():
+        if args.database_url.startswith('sqlite'):
+            print('SQLite serializa a los escritores: el escenario funnel no compite de verdad (usa --database-url de PostgreSQL).')
+            serialize_sqlite(db.engine)
+        for n in range(1, args.rounds + 1):
+            # Request handlers print debug lines; keep them out of the report
+            with contextlib.redirect_stdout(sys.stderr):
+                funnel = check_funnel(app, args.threads, args.closers)
+                index = check_index(app, args.threads)
+            print(f"round {n}: funnel {funnel['created']}/{funnel['requests']} created for {funnel['free_closers']} free closers; "
+                  f"index {index['inserted']} inserted, {index['rejected']} rejected")
+        db.session.remove()
+    print('No double bookings.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Chequeo del presupuesto de sentencias SQL del perfil de lead y del detalle de venta.
+
+Siembra en un SQLite temporal un lead mínimo (programa, método de pago, closer, preguntas)
+con un historial chico y otro grande, y verifica que LeadProfileService.lead_profile y
+enrollment_details ejecutan exactamente QUERY_BUDGET sentencias en ambos casos: la cantidad
+no puede crecer con el historial. Termina con error ante cualquier diferencia.
+
+Ejemplo:
+    python scripts/check_query_budget.py
+"""
+import sys
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from config import Config
+from app import create_app, db
+from app.models import User, Client, Appointment, Program, PaymentMethod, Enrollment, Payment, SurveyQuestion, SurveyAnswer
+from app.services.lead_profile_service import LeadProfileService, QUERY_BUDGET
+
+DATABASE_URL = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'neurops_query_budget.db')
+
+def seed_lead(closer, program, method, questions, n):
+    """Lead con n agendas, n ventas de n pagos cada una y una respuesta por pregunta. Devuelve (lead, una venta)."""
+    lead = Client(full_name=f'Budget Lead {n}', email=f'budget_{n}@budget.local')
+    db.session.add(lead)
+    db.session.flush()
+    start = datetime.utcnow() + timedelta(days=1)
+    db.session.add_all([Appointment(client_id=lead.id, closer_id=closer.id, start_time=start + timedelta(hours=i), status='scheduled') for i in range(n)])
+    enrollments = [Enrollment(client_id=lead.id, program_id=program.id, closer_id=closer.id) for _ in range(n)]
+    db.session.add_all(enrollments)
+    db.session.flush()
+    for enrollment in enrollments:
+        db.session.add_all([Payment(enrollment_id=enrollment.id, payment_method_id=method.id, amount=10.0, status='completed', payment_type='installment') for _ in range(n)])
+    db.session.add_all([SurveyAnswer(client_id=lead.id, question_id=question.id, answer='Sí') for question in questions])
+    db.session.commit()
+    return lead.id, enrollments[0].id
+
+def count_statements(fn):
+    statements = []
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+    return statements
+
+def main():
+    class BudgetConfig(Config):
+        SQLALCHEMY_DATABASE_URI = DATABASE_URL
+
+    app = create_app(BudgetConfig)
+    failures = []
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        closer = User(username='budget_closer', email='budget_closer@budget.local', role='closer')
+        program = Program(name='Budget', price=1000.0)
+        method = PaymentMethod(name='Budget', commission_percent=3.5)
+        questions = [SurveyQuestion(text=f'Pregunta {i}', options=json.dumps([{'text': 'Sí', 'points': 10}, {'text': 'No', 'points': 0}])) for i in range(3)]
+        db.session.add_all([closer, program, method, *questions])
+        db.session.commit()
+
+        for n in (1, 25):
+            lead_id, enrollment_id = seed_lead(closer, program, method, questions, n)
+            # Reads start from an empty identity map, as in a fresh request
+            db.session.expire_all()
+            views = {
+                'lead_profile': lambda: LeadProfileService.lead_profile(lead_id),
+                'enrollment_details': lambda: LeadProfileService.enrollment_details(enrollment_id),
+            }
+            for view, fn in views.items():
+                statements = count_statements(fn)
+                status = 'ok' if len(statements) == QUERY_BUDGET[view] else 'FAIL'
+                print(f"{view:<20} history {n:>3}: {len(statements)} statements (budget {QUERY_BUDGET[view]}) {status}")
+                if status == 'FAIL':
+                    failures.append((view, n, statements))
+        db.session.remove()
+        db.drop_all()
+
+    if failures:
+        for view, n, statements in failures:
+            print(f"\n{view} (history {n}):", file=sys.stderr)
+            for statement in statements: print(f"  {' '.join(statement.split())[:160]}", file=sys.stderr)
+        raise SystemExit(f"{len(failures)} vistas fuera de su presupuesto de sentencias.")
+
+if __name__ == '__main__':
+    main()